@@ -0,0 +1,18 @@
+"""PyreeEngine
+
+PYREE_GLMODE selects how PyOpenGL is configured. PyOpenGL reads its flags when OpenGL.GL is imported, so the mode is
+applied here, before any engine module imports it:
+
+- "default": PyOpenGL checks for GL errors after every call
+- "performance": no error checking or error logging, GL errors go unnoticed
+- "debug": error checking, and the GL state cache verifies skipped binds, see PyreeEngine.glstate"""
+
+import os
+
+glmode: str = os.environ.get("PYREE_GLMODE", "default")
+
+if glmode == "performance":
+    import OpenGL  # Doesn't import OpenGL.GL or pick a platform yet
+
+    OpenGL.ERROR_CHECKING = False
+    OpenGL.ERROR_LOGGING = False
@@ -0,0 +1,205 @@
+"""Texture atlas packer
+
+Packs many small images into the layers of a single TextureArray, so they can all be drawn with one texture bind (e.g.
+by a QuadBatch). Every image is surrounded by a gutter of repeated edge pixels, so filtering and lower mipmap levels
+don't bleed neighbouring images into each other.
+
+Packing only needs NumPy, so it can run offline:
+
+    python -m PyreeEngine.atlas outdir image1.png image2.png ...
+
+The result is a directory with one PNG per layer and a manifest.json. TextureAtlas.cached() loads such a directory if
+its manifest still matches the source images and packs (and saves) again otherwise, so only the first startup after a
+change pays for packing."""
+
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+from pathlib import Path
+
+import argparse
+import json
+
+import numpy as np
+
+from PyreeEngine.preload import decodeimage
+from PyreeEngine import log
+
+
+class AtlasEntry(NamedTuple):
+    layer: int
+    uvrect: Tuple[float, float, float, float]  # u0, v0, u1, v1 of the image without gutter
+    rect: Tuple[int, int, int, int]  # x, y, width, height in pixels, y counted from the bottom
+
+
+class Shelf():
+    __slots__ = ("y", "height", "x")
+
+    def __init__(self, y: int, height: int):
+        self.y: int = y
+        self.height: int = height
+        self.x: int = 0  # Next free column
+
+
+def packrects(sizes: Sequence[Tuple[int, int]], pagesize: int) -> List[Tuple[int, int, int]]:
+    """Shelf packing of (width, height) rectangles, returns (layer, x, y) per rectangle. Tallest rectangles go first,
+    each is put on the first shelf of any layer it fits on, new shelves and layers are opened as required."""
+    placements: List[Tuple[int, int, int]] = [None] * len(sizes)
+    pages: List[List[Shelf]] = []
+    for index in sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], -sizes[i][0])):
+        width, height = sizes[index]
+        if width > pagesize or height > pagesize:
+            raise ValueError("Rectangle of %ix%i doesn't fit on a %ix%i page" % (width, height, pagesize, pagesize))
+        placements[index] = placerect(pages, width, height, pagesize)
+    return placements
+
+
+def placerect(pages: List[List[Shelf]], width: int, height: int, pagesize: int) -> Tuple[int, int, int]:
+    for layer, shelves in enumerate(pages):
+        for shelf in shelves:
+            if height <= shelf.height and shelf.x + width <= pagesize:
+                shelf.x += width
+                return layer, shelf.x - width, shelf.y
+        top = shelves[-1].y + shelves[-1].height
+        if top + height <= pagesize:
+            shelf = Shelf(top, height)
+            shelf.x = width
+            shelves.append(shelf)
+            return layer, 0, top
+    shelf = Shelf(0, height)
+    shelf.x = width
+    pages.append([shelf])
+    return len(pages) - 1, 0, 0
+
+
+def packimages(images: Dict[str, np.ndarray], pagesize: int = 2048,
+               gutter: int = 4) -> Tuple[np.ndarray, Dict[str, AtlasEntry]]:
+    """Pack RGBA uint8 images (rows bottom to top) into (layers, pagesize, pagesize, 4) pages"""
+    from PyreeEngine.textures import torgba
+
+    if not images:
+        raise ValueError("No images to pack")
+
+    names = list(images)
+    images = {name: torgba(images[name]) for name in names}
+    sizes = [(images[name].shape[1] + 2 * gutter, images[name].shape[0] + 2 * gutter) for name in names]
+    placements = packrects(sizes, pagesize)
+
+    pages = np.zeros((max(layer for layer, x, y in placements) + 1, pagesize, pagesize, 4), np.uint8)
+    entries = {}
+    for name, (layer, x, y) in zip(names, placements):
+        imdata = images[name]
+        height, width = imdata.shape[:2]
+        padded = np.pad(imdata, ((gutter, gutter), (gutter, gutter), (0, 0)), mode="edge")
+        pages[layer, y:y + height + 2 * gutter, x:x + width + 2 * gutter] = padded
+        x0, y0 = x + gutter, y + gutter
+        entries[name] = AtlasEntry(layer, (x0 / pagesize, y0 / pagesize, (x0 + width) / pagesize,
+                                           (y0 + height) / pagesize), (x0, y0, width, height))
+    return pages, entries
+
+
+def fingerprint(paths: Sequence[Path]) -> List[List]:
+    """Identifies the state of the source images, a changed file results in a different fingerprint"""
+    result = []
+    for path in paths:
+        stat = Path(path).stat()
+        result.append([str(path), stat.st_mtime_ns, stat.st_size])
+    return result
+
+
+def saveatlas(directory: Path, pages: np.ndarray, entries: Dict[str, AtlasEntry], pagesize: int, gutter: int,
+              sources: List[List] = None) -> None:
+    import imageio  # Deferred, imageio takes long to import
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    for layer, page in enumerate(pages):
+        imageio.imwrite(directory / ("layer%i.png" % layer), np.flipud(page))
+    manifest = {"pagesize": pagesize, "gutter": gutter, "layers": len(pages), "sources": sources,
+                "entries": {name: entry._asdict() for name, entry in entries.items()}}
+    with (directory / "manifest.json").open("w") as f:
+        json.dump(manifest, f, indent=1)
+
+
+def loadmanifest(directory: Path) -> Optional[dict]:
+    try:
+        with (Path(directory) / "manifest.json").open("r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def miplevels(gutter: int) -> int:
+    """Mipmap levels at which neighbouring images don't bleed into each other. A texel of level n covers 2^n pixels,
+    so the gutter has to be at least that wide."""
+    return int(np.log2(gutter)) + 1 if gutter > 0 else 1
+
+
+class TextureAtlas():
+    """Packed images uploaded as TextureArray, look up where an image ended up with atlas[name]
+
+    The mipmap chain is limited to the levels the gutter protects, see miplevels()."""
+
+    def __init__(self, pages: np.ndarray, entries: Dict[str, AtlasEntry], mipmaps: bool = True, gutter: int = 4):
+        from PyreeEngine.textures import TextureArray
+
+        self.entries: Dict[str, AtlasEntry] = entries
+        self.texture: TextureArray = TextureArray(pages.shape[2], pages.shape[1], len(pages), mipmaps,
+                                                  miplevels(gutter))
+        for layer, page in enumerate(pages):
+            self.texture.setlayer(layer, page, generatemipmaps=False)
+        self.texture.generatemipmaps()
+
+    def __getitem__(self, name: str) -> AtlasEntry:
+        return self.entries[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.entries
+
+    @classmethod
+    def build(cls, paths: Sequence[Path], pagesize: int = 2048, gutter: int = 4,
+              mipmaps: bool = True) -> "TextureAtlas":
+        """Pack images at paths, entries are named by str(path)"""
+        pages, entries = packimages({str(path): decodeimage(path) for path in paths}, pagesize, gutter)
+        return cls(pages, entries, mipmaps, gutter)
+
+    @classmethod
+    def load(cls, directory: Path, mipmaps: bool = True) -> "TextureAtlas":
+        directory = Path(directory)
+        manifest = loadmanifest(directory)
+        if manifest is None:
+            raise FileNotFoundError("No atlas manifest in %s" % directory)
+        pages = np.stack([decodeimage(directory / ("layer%i.png" % layer)) for layer in range(manifest["layers"])])
+        entries = {name: AtlasEntry(entry["layer"], tuple(entry["uvrect"]), tuple(entry["rect"]))
+                   for name, entry in manifest["entries"].items()}
+        return cls(pages, entries, mipmaps, manifest["gutter"])
+
+    @classmethod
+    def cached(cls, paths: Sequence[Path], directory: Path, pagesize: int = 2048, gutter: int = 4,
+               mipmaps: bool = True) -> "TextureAtlas":
+        """Load atlas from directory if it was packed from the current versions of paths, pack and save it otherwise"""
+        sources = fingerprint(paths)
+        manifest = loadmanifest(directory)
+        if manifest is not None and manifest["sources"] == sources and manifest["pagesize"] == pagesize and \
+                manifest["gutter"] == gutter:
+            return cls.load(directory, mipmaps)
+
+        log.info("ATLAS", "Packing %i images into %s" % (len(paths), directory))
+        pages, entries = packimages({str(path): decodeimage(path) for path in paths}, pagesize, gutter)
+        saveatlas(directory, pages, entries, pagesize, gutter, sources)
+        return cls(pages, entries, mipmaps, gutter)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack images into texture atlas layers")
+    parser.add_argument("outdir", type=Path)
+    parser.add_argument("images", type=Path, nargs="+")
+    parser.add_argument("--pagesize", type=int, default=2048)
+    parser.add_argument("--gutter", type=int, default=4)
+    args = parser.parse_args()
+
+    pages, entries = packimages({str(path): decodeimage(path) for path in args.images}, args.pagesize, args.gutter)
+    saveatlas(args.outdir, pages, entries, args.pagesize, args.gutter, fingerprint(args.images))
+    log.success("ATLAS", "Packed %i images into %i layers" % (len(entries), len(pages)))
+
+
+if __name__ == "__main__":
+    main()
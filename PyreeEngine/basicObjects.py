@@ -9,12 +9,16 @@ from PyreeEngine.objloader import ObjLoader
 from PyreeEngine.shaders import Shader, DebugShader
 from PyreeEngine.engine import GeometryObject
 from PyreeEngine.shaders import DebugShader
+from PyreeEngine.buffers import StreamingBuffer
+from PyreeEngine.preload import assetcache, decodeobj
+from PyreeEngine.glstate import glstate
+from PyreeEngine.gpuresources import gpuresources, GPUObject
 from pathlib import Path
 
 import numpy as np
 
 
-class ModelObject(GeometryObject):
+class ModelObject(GeometryObject, GPUObject):
     def __init__(self, pathToObj: Path = None):
         super(ModelObject, self).__init__()
 
@@ -22,6 +26,7 @@ class ModelObject(GeometryObject):
         self.vao = None
 
         self.tricount = None
+        self.verts: np.ndarray = None  # (n, 8) copy of the vertices, used by StaticBatch
 
         self.textures = []
 
@@ -33,51 +38,60 @@ class ModelObject(GeometryObject):
         self.uniforms = {}
 
     def loadFromObj(self, pathToObj: Path):
-        vertlist = ObjLoader(pathToObj).verts
-        verts = []
-        for l in vertlist:
-            verts += l
+        verts = assetcache.take(pathToObj)
+        if verts is None:
+            verts = decodeobj(pathToObj)
         self.loadFromVerts(verts)
 
     def loadFromVerts(self, verts: List[float]):
         if verts is not np.array:
             verts = np.array(verts, np.float32)
         self.tricount = int(len(verts) / 8)
+        self.verts = verts.reshape((-1, 8))
 
         if self.vbo is None:
-            self.vbo = glGenBuffers(1)
+            self.vbo = gpuresources.genbuffer(label=type(self).__name__)
 
-        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glstate.bindbuffer(GL_ARRAY_BUFFER, self.vbo)
         glBufferData(GL_ARRAY_BUFFER, verts.nbytes, verts, GL_STATIC_DRAW)
+        gpuresources.resize("buffer", self.vbo, verts.nbytes)
 
         if self.vao is None:
-            self.vao = glGenVertexArrays(1)
-            glBindVertexArray(self.vao)
+            self.setupVertexArray()
 
-            glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 8 * verts.itemsize, ctypes.c_void_p(0))  # XYZ
-            glEnableVertexAttribArray(0)
+    def setupVertexArray(self):
+        """Create VAO for interleaved XYZ UV NXNYNZ float vertices in self.vbo"""
+        itemsize = np.dtype(np.float32).itemsize
+        self.vao = gpuresources.genvertexarray(type(self).__name__)
+        glstate.bindvertexarray(self.vao)
+        glstate.bindbuffer(GL_ARRAY_BUFFER, self.vbo)
 
-            glVertexAttribPointer(1, 2, GL_FLOAT, GL_FALSE, 8 * verts.itemsize,
-                                  ctypes.c_void_p(3 * verts.itemsize))  # UV
-            glEnableVertexAttribArray(1)
+        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 8 * itemsize, ctypes.c_void_p(0))  # XYZ
+        glEnableVertexAttribArray(0)
 
-            glVertexAttribPointer(2, 3, GL_FLOAT, GL_FALSE, 8 * verts.itemsize,
-                                  ctypes.c_void_p(5 * verts.itemsize))  # Normal
-            glEnableVertexAttribArray(2)
+        glVertexAttribPointer(1, 2, GL_FLOAT, GL_FALSE, 8 * itemsize, ctypes.c_void_p(3 * itemsize))  # UV
+        glEnableVertexAttribArray(1)
+
+        glVertexAttribPointer(2, 3, GL_FLOAT, GL_FALSE, 8 * itemsize, ctypes.c_void_p(5 * itemsize))  # Normal
+        glEnableVertexAttribArray(2)
 
     def render(self, viewProjMatrix):
-        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
-        glBindVertexArray(self.vao)
+        glstate.bindvertexarray(self.vao)
 
-        glUseProgram(self.shader.getshaderprogram())
+        program = self.shader.getshaderprogram()
+        glstate.useprogram(program)
 
-        uniformLoc = glGetUniformLocation(self.shader.getshaderprogram(), "MVP")
+        modelMatrix = self.getModelMatrix()
+        uniformLoc = glstate.uniformlocation(program, "MVP")
+        if not uniformLoc == -1:
+            glUniformMatrix4fv(uniformLoc, 1, GL_TRUE, viewProjMatrix * modelMatrix)
+        uniformLoc = glstate.uniformlocation(program, "M")  # World space, for lighting
         if not uniformLoc == -1:
-            glUniformMatrix4fv(uniformLoc, 1, GL_TRUE, viewProjMatrix * self.getModelMatrix())
+            glUniformMatrix4fv(uniformLoc, 1, GL_TRUE, modelMatrix)
 
         for uniformName in self.uniforms:
             uniform = self.uniforms[uniformName]
-            uniformLoc = glGetUniformLocation(self.shader.getshaderprogram(), uniformName)
+            uniformLoc = glstate.uniformlocation(program, uniformName)
             if not uniformLoc == -1:
                 if type(uniform) == float or type(uniform) == int:
                     glUniform1f(uniformLoc, float(uniform))
@@ -90,17 +104,73 @@ class ModelObject(GeometryObject):
 
         texUnit = GL_TEXTURE0
         for tex in self.textures:
-            glActiveTexture(texUnit)
-            glBindTexture(GL_TEXTURE_2D, tex)
+            glstate.bindtexture(GL_TEXTURE_2D, tex, texUnit)
             texUnit += 1
 
+        self.draw()
+
+    def draw(self):
         glDrawArrays(GL_TRIANGLES, 0, self.tricount)
 
-    def __del__(self):
-        if self.vbo is not None:
-            glDeleteBuffers(1, [self.vbo])
-        if self.vao is not None:
-            glDeleteVertexArrays(1, [self.vao])
+    def release(self):
+        gpuresources.delete("buffer", self.vbo)
+        gpuresources.delete("vertexarray", self.vao)
+        self.vbo = None
+        self.vao = None
+
+
+class DynamicModelObject(ModelObject):
+    """ModelObject for geometry that changes every frame, e.g. audio waveforms or procedural meshes
+
+    Vertices live in a persistently mapped StreamingBuffer. Write them directly into the array returned by
+    mapVerts(), then call commitVerts() with the number of vertices written:
+
+        verts = obj.mapVerts()
+        verts[:n, 0:3] = positions
+        obj.commitVerts(n)
+    """
+
+    def __init__(self, maxverts: int, segments: int = 3, primitive: int = GL_TRIANGLES):
+        self.stream: StreamingBuffer = None
+        super(DynamicModelObject, self).__init__()
+
+        self.maxverts: int = maxverts
+        self.primitive: int = primitive
+        self.stream = StreamingBuffer(maxverts * 8 * np.dtype(np.float32).itemsize, segments)
+        self.vbo = self.stream.buffer
+        self.setupVertexArray()
+
+        self.tricount = 0
+        self.firstvert: int = 0  # First vertex of the segment that is drawn
+        self.drawsegment: int = None  # Segment that is drawn, mapVerts() may have moved the stream on since
+
+    def mapVerts(self) -> np.ndarray:
+        """Acquire the next segment, returns a (maxverts, 8) float32 view of it"""
+        return self.stream.acquire(np.float32).reshape((self.maxverts, 8))
+
+    def commitVerts(self, vertcount: int):
+        """Draw vertcount vertices from the segment returned by the last mapVerts()"""
+        self.tricount = min(vertcount, self.maxverts)
+        self.drawsegment = self.stream.current
+        self.firstvert = self.drawsegment * self.maxverts
+
+    def loadFromVerts(self, verts: List[float]):
+        verts = np.asarray(verts, np.float32).reshape((-1, 8))
+        mapped = self.mapVerts()
+        count = min(len(verts), self.maxverts)
+        mapped[:count] = verts[:count]
+        self.commitVerts(count)
+
+    def draw(self):
+        if self.tricount > 0:
+            glDrawArrays(self.primitive, self.firstvert, self.tricount)
+            self.stream.fence(self.drawsegment)
+
+    def release(self):
+        if self.stream is not None:
+            self.stream.release()
+        self.vbo = None
+        super(DynamicModelObject, self).release()
 
 
 class FSQuad(ModelObject):
@@ -0,0 +1,74 @@
+"""GL buffer helpers"""
+
+from OpenGL.GL import *
+
+import numpy as np
+import ctypes
+
+from PyreeEngine.glstate import glstate
+from PyreeEngine.gpuresources import gpuresources, GPUObject
+
+
+class StreamingBuffer(GPUObject):
+    """Persistently mapped ring buffer for data that is rewritten every frame
+
+    The buffer is split into segments. Each frame the next segment is acquired and written to through a NumPy view of
+    the mapped memory, so there is neither a reallocation nor an extra copy. A fence is placed after the draw that uses
+    a segment, and the segment is only handed out again once the GPU passed that fence."""
+
+    def __init__(self, segmentsize: int, segments: int = 3, target: int = GL_ARRAY_BUFFER):
+        self.segmentsize: int = segmentsize  # Bytes
+        self.segments: int = segments
+        self.target: int = target
+        self.size: int = segmentsize * segments
+        self.buffer: int = None
+        self.mapped: np.ndarray = None
+        self.fences = [None] * segments
+
+        mapflags = GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT | GL_MAP_COHERENT_BIT
+        self.buffer = gpuresources.genbuffer(self.size, "StreamingBuffer")
+        glstate.bindbuffer(self.target, self.buffer)
+        glBufferStorage(self.target, self.size, None, mapflags)
+        pointer = glMapBufferRange(self.target, 0, self.size, mapflags)
+        self.mapped = np.ctypeslib.as_array(ctypes.cast(pointer, ctypes.POINTER(ctypes.c_ubyte)), shape=(self.size,))
+
+        self.current: int = segments - 1  # First acquire() starts at segment 0
+
+    @property
+    def offset(self) -> int:
+        """Byte offset of current segment"""
+        return self.current * self.segmentsize
+
+    def acquire(self, dtype=np.uint8) -> np.ndarray:
+        """Advance to next segment and return a writable view of it, waiting for the GPU if it still reads from it"""
+        self.current = (self.current + 1) % self.segments
+        self.waitfence(self.current)
+        return self.mapped[self.offset:self.offset + self.segmentsize].view(dtype)
+
+    def waitfence(self, segment: int) -> None:
+        fence = self.fences[segment]
+        if fence is None:
+            return
+        while glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, 1000000) == GL_TIMEOUT_EXPIRED:
+            pass
+        glDeleteSync(fence)
+        self.fences[segment] = None
+
+    def fence(self, segment: int = None) -> None:
+        """Call after the last command reading from segment (default: the current one) was issued"""
+        if segment is None:
+            segment = self.current
+        if self.fences[segment] is not None:
+            glDeleteSync(self.fences[segment])
+        self.fences[segment] = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+
+    def release(self) -> None:
+        if gpuresources.islive("buffer", self.buffer):
+            for segment in range(self.segments):
+                self.waitfence(segment)
+            if self.mapped is not None:
+                glstate.bindbuffer(self.target, self.buffer)
+                glUnmapBuffer(self.target)
+            gpuresources.delete("buffer", self.buffer)
+        self.buffer = None
+        self.mapped = None
@@ -0,0 +1,193 @@
+"""Asynchronous framebuffer capture
+
+glReadPixels into client memory waits for all rendering to finish. FrameCapture instead reads into a ring of slots in
+a persistently mapped pixel pack buffer and puts a fence behind each readback. Slots are collected once their fence
+passed, usually 2-3 frames later, so the render loop never waits for the GPU. Collected frames are NumPy views of the
+mapped memory and are handed to a writer thread as they are, without copying. A slot is only reused after the writer
+is done with it; if the writer falls behind and no slot is free, the frame is dropped and counted instead of stalling
+the render loop. For offline rendering dropframes can be disabled, then the render loop waits for the writer."""
+
+from typing import List
+from pathlib import Path
+
+import ctypes
+import queue
+import subprocess
+import threading
+
+from OpenGL.GL import *
+
+import numpy as np
+
+from PyreeEngine.util import Resolution
+from PyreeEngine.glstate import glstate
+from PyreeEngine.gpuresources import gpuresources
+from PyreeEngine import log
+
+
+class CaptureSink():
+    """Receives captured frames on the writer thread. pixels is (height, width, 4) uint8, bottom row first, and only
+    valid during write()."""
+
+    def write(self, frame: int, pixels: np.ndarray) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class ImageSequenceSink(CaptureSink):
+    def __init__(self, directory: Path, pattern: str = "frame%06d.png"):
+        self.directory: Path = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.pattern: str = pattern  # Formatted with the frame number
+
+    def write(self, frame: int, pixels: np.ndarray) -> None:
+        import imageio
+        imageio.imwrite(self.directory / (self.pattern % frame), pixels[::-1])
+
+
+class FFmpegSink(CaptureSink):
+    """Pipes raw frames into an ffmpeg process"""
+
+    def __init__(self, path: Path, resolution: Resolution, fps: float = 60.,
+                 outputargs: List[str] = ("-c:v", "libx264", "-preset", "fast", "-pix_fmt", "yuv420p")):
+        command = ["ffmpeg", "-y", "-loglevel", "error",
+                   "-f", "rawvideo", "-pix_fmt", "rgba", "-s", "%ix%i" % (resolution.width, resolution.height),
+                   "-r", str(fps), "-i", "-",
+                   "-vf", "vflip", *outputargs, str(path)]
+        self.process: subprocess.Popen = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def write(self, frame: int, pixels: np.ndarray) -> None:
+        self.process.stdin.write(pixels.data)
+
+    def close(self) -> None:
+        self.process.stdin.close()
+        self.process.wait()
+
+
+FREE, PENDING, WRITING = 0, 1, 2  # Slot states
+
+
+class FrameCapture():
+    def __init__(self, resolution: Resolution, sink: CaptureSink, ringsize: int = 4, maxqueue: int = 8,
+                 dropframes: bool = True):
+        self.resolution: Resolution = resolution
+        self.dropframes: bool = dropframes  # Drop frames if the writer falls behind, otherwise wait for it
+        self.sink: CaptureSink = sink
+        self.ringsize: int = ringsize
+        self.framesize: int = resolution.width * resolution.height * 4
+
+        mapflags = GL_MAP_READ_BIT | GL_MAP_PERSISTENT_BIT | GL_MAP_COHERENT_BIT
+        self.buffer = gpuresources.genbuffer(self.framesize * ringsize, "FrameCapture")
+        glstate.bindbuffer(GL_PIXEL_PACK_BUFFER, self.buffer)
+        glBufferStorage(GL_PIXEL_PACK_BUFFER, self.framesize * ringsize, None, mapflags)
+        pointer = glMapBufferRange(GL_PIXEL_PACK_BUFFER, 0, self.framesize * ringsize, mapflags)
+        glstate.bindbuffer(GL_PIXEL_PACK_BUFFER, 0)
+        mapped = np.ctypeslib.as_array(ctypes.cast(pointer, ctypes.POINTER(ctypes.c_ubyte)),
+                                       shape=(ringsize, resolution.height, resolution.width, 4))
+        self.slots: List[np.ndarray] = [mapped[i] for i in range(ringsize)]
+
+        self.states: List[int] = [FREE] * ringsize  # Writer thread sets WRITING slots back to FREE
+        self.freed: threading.Condition = threading.Condition()  # Notified by writer thread when a slot is free
+        self.fences: list = [None] * ringsize
+        self.frames: List[int] = [0] * ringsize
+        self.next: int = 0
+
+        self.writequeue: queue.Queue = queue.Queue(maxsize=maxqueue)
+        self.writer: threading.Thread = threading.Thread(target=self.writerthread, name="pyree-capture", daemon=True)
+        self.writer.start()
+
+        # Statistics
+        self.captured: int = 0  # Frames handed to the sink
+        self.dropped: int = 0  # Frames skipped because the writer fell behind
+
+    def capture(self, fbo: int = 0, frame: int = None) -> None:
+        """Start readback of fbo's color buffer. Call after the frame was rendered, before swapping buffers."""
+        self.poll()
+
+        slot = self.next
+        if self.states[slot] == PENDING:
+            self.collect(slot, wait=True, block=not self.dropframes)  # GPU is more than ringsize frames behind
+        if self.states[slot] == WRITING and not self.dropframes:
+            with self.freed:
+                self.freed.wait_for(lambda: self.states[slot] != WRITING)
+        if self.states[slot] != FREE:
+            self.dropped += 1
+            return
+
+        glstate.bindframebuffer(fbo, GL_READ_FRAMEBUFFER)
+        glstate.bindbuffer(GL_PIXEL_PACK_BUFFER, self.buffer)
+        glPixelStorei(GL_PACK_ALIGNMENT, 4)
+        glReadPixels(0, 0, self.resolution.width, self.resolution.height, GL_RGBA, GL_UNSIGNED_BYTE,
+                     ctypes.c_void_p(slot * self.framesize))
+        glstate.bindbuffer(GL_PIXEL_PACK_BUFFER, 0)
+
+        self.fences[slot] = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        self.frames[slot] = frame if frame is not None else self.captured + self.dropped
+        self.states[slot] = PENDING
+        self.next = (slot + 1) % self.ringsize
+
+    def poll(self) -> None:
+        """Hand all finished readbacks to the writer, oldest first"""
+        for i in range(self.ringsize):
+            slot = (self.next + i) % self.ringsize
+            if self.states[slot] == PENDING and not self.collect(slot, wait=False, block=not self.dropframes):
+                break  # Later readbacks can't be done either
+
+    def collect(self, slot: int, wait: bool, block: bool = False) -> bool:
+        """Hand slot to the writer once its readback finished. With block set, wait for room in the write queue
+        instead of dropping the frame."""
+        timeout = 1000000 if wait else 0
+        while True:
+            result = glClientWaitSync(self.fences[slot], GL_SYNC_FLUSH_COMMANDS_BIT, timeout)
+            if result != GL_TIMEOUT_EXPIRED:
+                break
+            if not wait:
+                return False
+        glDeleteSync(self.fences[slot])
+        self.fences[slot] = None
+
+        self.states[slot] = WRITING
+        try:
+            self.writequeue.put((slot, self.frames[slot]), block=block)
+        except queue.Full:
+            self.states[slot] = FREE
+            self.dropped += 1
+        return True
+
+    def writerthread(self) -> None:
+        while True:
+            item = self.writequeue.get()
+            if item is None:
+                return
+            slot, frame = item
+            try:
+                self.sink.write(frame, self.slots[slot])
+                self.captured += 1
+            except Exception as exc:
+                log.error("CAPTURE", "Failed to write frame %i: %s" % (frame, exc))
+            with self.freed:
+                self.states[slot] = FREE
+                self.freed.notify()
+
+    def stop(self) -> None:
+        """Write outstanding frames, close sink and free the buffer"""
+        for i in range(self.ringsize):
+            slot = (self.next + i) % self.ringsize
+            if self.states[slot] == PENDING:
+                self.collect(slot, wait=True, block=True)
+        self.writequeue.put(None)
+        self.writer.join()
+        self.sink.close()
+
+        glstate.bindbuffer(GL_PIXEL_PACK_BUFFER, self.buffer)
+        glUnmapBuffer(GL_PIXEL_PACK_BUFFER)
+        glstate.bindbuffer(GL_PIXEL_PACK_BUFFER, 0)
+        gpuresources.delete("buffer", self.buffer)
+        self.slots = []
+
+        if self.dropped:
+            log.warning("CAPTURE", "%i frames captured, %i dropped" % (self.captured, self.dropped))
+        else:
+            log.info("CAPTURE", "%i frames captured, none dropped" % self.captured)
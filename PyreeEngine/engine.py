@@ -28,37 +28,44 @@ class PyreeObject():
         pass
 
     def getModelMatrix(self) -> np.matrix:
+        """Local transform, applied after the full transform of the parent chain"""
         pos = self.pos
-        if self.parent is not None:
-            pos += self.parent.pos
         translationMat = np.matrix([[1, 0, 0, pos[0]],
                                     [0, 1, 0, pos[1]],
                                     [0, 0, 1, pos[2]],
                                     [0, 0, 0, 1]])
 
         orientMat = np.identity(4)
-        rot = self.rot
-        if self.parent is not None:
-            rot = rot * self.parent.rot
-        orientMat[:3, :3] = quaternion.as_rotation_matrix(rot)
+        orientMat[:3, :3] = quaternion.as_rotation_matrix(self.rot)
 
         scale = self.scale
-        if self.parent is not None:
-            scale *= self.parent.scale
         scaleMat = np.matrix([[scale[0], 0, 0, 0],
                               [0, scale[1], 0, 0],
                               [0, 0, scale[2], 0],
                               [0, 0, 0, 1]])
 
-        return translationMat * orientMat * scaleMat
+        modelMat = translationMat * orientMat * scaleMat
+        if self.parent is not None:
+            modelMat = self.parent.getModelMatrix() * modelMat
+        return modelMat
 
 class GeometryObject(PyreeObject):
     def __init__(self):
         super(GeometryObject, self).__init__()
 
 class LightObject(PyreeObject):
-    def __init__(self):
+    """Point light, drawn by PyreeEngine.lighting.ClusteredLighting"""
+
+    def __init__(self, color: np.ndarray = None, intensity: float = 1., radius: float = 5.):
         super(LightObject, self).__init__()
+        self.color: np.ndarray = color if color is not None else Vec3(1, 1, 1)  # Linear RGB
+        self.intensity: float = intensity
+        self.radius: float = radius  # No effect beyond this distance
+
+    def worldpos(self) -> np.ndarray:
+        if self.parent is not None:
+            return np.asarray(self.parent.getModelMatrix() @ np.append(self.pos, 1.)).ravel()[:3]
+        return self.pos
 
 
 class NodeGlobalData():
@@ -90,15 +97,51 @@ class Monitor():
 
 
 from PyreeEngine.layers import LayerContext, LayerManager, ProgramConfig
+from PyreeEngine.shadercache import programcache
+from PyreeEngine.framepacing import FrameScheduler
+from PyreeEngine.oscthread import OSCReceiveThread
+from PyreeEngine.oscparams import UnmappedLogger
+from PyreeEngine.oscoutput import OSCOutputQueue
+from PyreeEngine.filewatch import filewatchservice
+from PyreeEngine.capture import FrameCapture, FFmpegSink, ImageSequenceSink
+from PyreeEngine.preload import Preloader, StartupReport
+from PyreeEngine.glstate import glstate
+from PyreeEngine.gpuresources import gpuresources
+from PyreeEngine import log
 import json
-import pythonosc.dispatcher
-import pythonosc.osc_server
-import pythonosc.udp_client
+from pathlib import Path
 import asyncio
 
+
 class Engine():
     def __init__(self):
+        self.startup: StartupReport = StartupReport()
+        with self.startup.phase("config"):
+            self.loadconfig()
+        self.preloader: Preloader = Preloader(self.programconfig.preloadthreads, self.startup)
+        self.preloader.warm()  # Heavy imports happen while the window opens
+
+        resolution = (1280, 720)
+        with self.startup.phase("context"):
+            self.createcontext(resolution)
 
+        glEnable(GL_MULTISAMPLE)
+        glEnable(GL_DEPTH_TEST)
+
+        self.init()
+
+        with self.startup.phase("setup"):
+            self.setupcontext(resolution)
+        self.layercontext.time = glfw.get_time()
+
+        ## Frame pacing
+        primarymonitor = glfw.get_primary_monitor()
+        refreshrate = glfw.get_video_mode(primarymonitor).refresh_rate if primarymonitor else 60
+        self.setupframepacing(self.programconfig.framemode, refreshrate)
+        glfw.swap_interval(self.scheduler.swapinterval)
+
+    def createcontext(self, resolution: Tuple[int, int]) -> None:
+        """Create window and make its GL context current"""
         self.initglfw()
 
         self.monitors: Dict[str, Monitor] = {}
@@ -106,8 +149,6 @@ class Engine():
 
         print(self.monitors)
 
-        resolution = (1280, 720)
-
         # self.window = glfw.create_window(resolution[0], resolution[1], "PyreeEngine", self.monitors[b"CSO 0x1400"].monitorptr, None)
         #self.window = glfw.create_window(1920, 1080, "PyreeEngine", self.monitors[b"AOC Q3279WG5B"].monitorptr, None)
         self.window = glfw.create_window(resolution[0], resolution[1], "PyreeEngine", None, None)
@@ -115,32 +156,99 @@ class Engine():
 
         glfw.make_context_current(self.window)
 
-        glEnable(GL_MULTISAMPLE)
-        glEnable(GL_DEPTH_TEST)
-
-        self.init()
-
+    def loadconfig(self, path: str = "programconfig.json") -> None:
         ## Program Config
-        with open("programconfig.json", "r") as f:
+        with open(path, "r") as f:
             self.programconfig = ProgramConfig(**json.load(f))
 
+    def setupcontext(self, resolution: Tuple[int, int]) -> None:
+        """Create layer context and OSC client/dispatcher from program config"""
+        import pythonosc.dispatcher  # Deferred, usually imported by the preloader by now
+
+        log.setlevel(getattr(log, self.programconfig.loglevel.upper()))
+        if self.programconfig.logjsonpath is not None:
+            log.setjsonsink(self.programconfig.logjsonpath)
+
+        ## Layer Context
+        self.layercontext: LayerContext = LayerContext()
+        self.layercontext.profiler.enabled = self.programconfig.profiling
+
         # OSC setup
         self.oscdispatcher = pythonosc.dispatcher.Dispatcher()
-        self.oscclient = pythonosc.udp_client.SimpleUDPClient(self.programconfig.oscclientaddress, self.programconfig.oscclientport)
+        self.oscclient = OSCOutputQueue(self.programconfig.oscclientaddress, self.programconfig.oscclientport,
+                                        self.programconfig.oscmtu)
+        self.oscreceiver: OSCReceiveThread = None  # Started in startmainloop
 
-        def defaultosc(*args):
-            print(f"*Unmapped OSC message: {args}")
+        self.oscdispatcher.set_default_handler(UnmappedLogger())
 
-        self.oscdispatcher.set_default_handler(defaultosc)
+        def capturetrace(address, frames=120):
+            path = "pyreetrace-%s.json" % time.strftime("%Y%m%d-%H%M%S")
+            log.info("PROFILER", "Capturing %i frames to %s" % (frames, path))
+            self.layercontext.profiler.capture(int(frames), path)
+
+        if self.programconfig.profilercapturepath is not None:
+            self.oscdispatcher.map(self.programconfig.profilercapturepath, capturetrace)
+
+        ## Recording
+        self.capture: FrameCapture = None
+
+        def record(address, path=None):
+            if path:
+                self.startrecording(Path(path))
+            else:
+                self.stoprecording()
+
+        if self.programconfig.recordoscpath is not None:
+            self.oscdispatcher.map(self.programconfig.recordoscpath, record)
 
-        ## Layer Context and Manager
-        self.layercontext: LayerContext = LayerContext()
         self.layercontext.setresolution(resolution[0], resolution[1])
-        self.layercontext.time = glfw.get_time()
 
         self.layercontext.oscdispatcher = self.oscdispatcher
         self.layercontext.oscclient = self.oscclient
 
+        self.layercontext.gpuprofiler.enabled = self.programconfig.gpuprofiling
+
+    def setupframepacing(self, framemode: str, refreshrate: float) -> None:
+        self.scheduler: FrameScheduler = FrameScheduler(framemode, self.programconfig.targetfps,
+                                                        self.programconfig.fixedtimestep, refreshrate=refreshrate)
+        self.layercontext.framestats = self.scheduler.stats
+        self.layercontext.fixeddt = self.programconfig.fixedtimestep
+
+    def startosc(self) -> None:
+        self.oscreceiver = OSCReceiveThread(self.programconfig.oscserveraddress, self.programconfig.oscserverport,
+                                            self.layercontext.params)
+        self.layercontext.oscreceiver = self.oscreceiver
+        self.oscreceiver.start()
+
+    def startrecording(self, path: Path, dropframes: bool = True) -> None:
+        """Record every frame from now on. Paths with a suffix are encoded to video by ffmpeg, others become a
+        directory of PNG images. If dropframes is set, frames are skipped instead of waiting for a slow writer."""
+        self.stoprecording()
+        resolution = self.layercontext.resolution
+        if path.suffix:
+            sink = FFmpegSink(path, resolution, self.programconfig.recordfps)
+        else:
+            sink = ImageSequenceSink(path)
+        log.info("CAPTURE", "Recording %ix%i to %s" % (resolution.width, resolution.height, path))
+        self.capture = FrameCapture(resolution, sink, dropframes=dropframes)
+
+    def stoprecording(self) -> None:
+        if self.capture is not None:
+            self.capture.stop()
+            self.capture = None
+
+    def captureframe(self) -> None:
+        """Read back the finished frame if recording"""
+        if self.capture is None:
+            return
+        from PyreeEngine.framebuffers import DefaultFramebuffer  # Imports basicObjects, which imports this module
+        if self.capture.resolution != self.layercontext.resolution:
+            log.warning("CAPTURE", "Resolution changed, recording stopped")
+            self.stoprecording()
+            return
+        with self.layercontext.profiler.scope("capture"):
+            self.capture.capture(DefaultFramebuffer.screenfbo, self.layercontext.frame)
+
     def getmonitors(self) -> Dict[str, ctypes.POINTER(ctypes.POINTER(glfw._GLFWmonitor))]:
         monitors = {}
         for monitor in glfw.get_monitors():
@@ -167,31 +275,67 @@ class Engine():
         self.layercontext.dt = newtime - self.layercontext.time
         self.layercontext.time = newtime
 
-        self.layermanager: LayerManager = LayerManager(self.programconfig, self.layercontext)
+        self.layermanager: LayerManager = LayerManager(self.programconfig, self.layercontext, self.preloader)
+        programcache.report()
+        gpuresources.report()
+        self.startup.report()
 
         ## Async Loop
         self.asyncloop = asyncio.get_running_loop()
         self.asyncloop.set_debug(True)
+        filewatchservice.attach(self.asyncloop)
 
         ## OSC setup
-        self.oscserver = pythonosc.osc_server.AsyncIOOSCUDPServer(
-            (self.programconfig.oscserveraddress, self.programconfig.oscserverport), self.oscdispatcher, self.asyncloop)
+        self.startosc()
 
-        self.transport, protocol = await self.oscserver.create_serve_endpoint()
         while (not glfw.window_should_close(self.window)):
             self.mainLoop()
-            await asyncio.sleep(0)  # Give other tasks a chance
-        self.transport.close()
+            await self.scheduler.wait()  # Give other tasks a chance until next frame is due
+        gpuresources.report()
+        self.stoprecording()
+        self.oscreceiver.stop()
+        self.oscclient.stop()
+        filewatchservice.detach()
 
     def mainLoop(self) -> None:
         glfw.make_context_current(self.window)
 
-        glfw.poll_events()
+        self.layercontext.profiler.beginframe()
+
+        with self.layercontext.profiler.scope("poll_events"):
+            glfw.poll_events()
+
+        self.receiveosc()
+
+        self.scheduler.beginframe()
 
         newtime = glfw.get_time()
-        self.layercontext.dt = min(0.2, newtime - self.layercontext.time)   # Limit delta time to 0.2 to prevent fuckery
+        dt = min(self.programconfig.maxdt, newtime - self.layercontext.time)   # Limit delta time to prevent fuckery
+        self.renderframe(dt, newtime)
+
+        with self.layercontext.profiler.scope("swap_buffers"):
+            glfw.swap_buffers(self.window)
+
+        self.layercontext.profiler.endframe()
+
+        self.layercontext.frame = self.layercontext.frame + 1
+
+    def receiveosc(self) -> None:
+        if self.oscreceiver is None:
+            return
+        with self.layercontext.profiler.scope("osc"):
+            self.oscreceiver.drain(self.oscdispatcher, self.programconfig.oscbudget)
+
+    def renderframe(self, dt: float, newtime: float) -> None:
+        """Advance time and run all layers once, into the currently bound framebuffer"""
+        self.layercontext.gpuprofiler.beginframe()
+        glstate.reset()
+
+        self.layercontext.dt = dt
         self.layercontext.time = newtime
 
+        self.layercontext.params.update(self.layercontext.dt)
+
         # Run async loop once
         #self.asyncloop.stop()
         #self.asyncloop.run_forever()
@@ -203,17 +347,23 @@ class Engine():
 
         self.loop()
 
-        glfw.swap_buffers(self.window)
+        self.layercontext.gpuprofiler.endframe()
+        if self.programconfig.gpuprofileroscpath is not None and self.layercontext.gpuprofiler.enabled and \
+                self.layercontext.frame % self.programconfig.gpuprofilerinterval == 0:
+            self.layercontext.gpuprofiler.sendstats(self.oscclient, self.programconfig.gpuprofileroscpath)
 
-        glfw.swap_interval(1)
+        self.captureframe()
 
-        self.layercontext.frame = self.layercontext.frame + 1
+        self.oscclient.flush()
 
     def framebufferResizeCallback(self, window, width, height):
         glViewport(0, 0, width, height)
         self.layercontext.setresolution(width, height)
 
     def loop(self):
+        for i in range(self.scheduler.fixedsteps(self.layercontext.dt)):
+            self.layermanager.fixedtick()
+        self.layercontext.alpha = self.scheduler.alpha
         self.layermanager.tick()
 
     def render(self, objects: List[PyreeObject], camera: Camera, framebuffer) -> None:
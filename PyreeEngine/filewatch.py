@@ -0,0 +1,142 @@
+"""Shared file watching
+
+A single inotify instance serves all layers and shaders. Each directory is watched once, no matter how many files in it
+have subscribers, and events are dispatched to subscribers by full path. Editors tend to produce bursts of events for a
+single save, so events are collected until no new event arrived for the debounce period, and each subscriber is called
+once per path with the combined event mask.
+
+Once attached to an asyncio loop, the inotify fd is registered with add_reader, so nothing is polled per frame.
+Until then (or when there is no loop at all), poll() has to be called regularly.
+
+Callbacks are stored as weak references, so subscribing doesn't keep objects alive."""
+
+from typing import Dict, List, Callable, Optional
+from pathlib import Path
+
+import asyncio
+import time
+import weakref
+
+from inotify_simple import INotify, flags, Event
+
+from PyreeEngine import log
+
+
+class Subscription():
+    def __init__(self, path: Path, callback: Callable[[Event], None]):
+        self.path: Path = path
+        if hasattr(callback, "__self__"):
+            self.callbackref = weakref.WeakMethod(callback)
+        else:
+            self.callbackref = lambda: callback
+
+    @property
+    def callback(self) -> Optional[Callable[[Event], None]]:
+        return self.callbackref()
+
+
+class FileWatchService():
+    watchflags = flags.CREATE | flags.MODIFY | flags.MOVED_TO | flags.DELETE | flags.MOVED_FROM
+
+    def __init__(self, debounce: float = 0.05):
+        self.debounce: float = debounce  # Seconds without new events before pending events are dispatched
+
+        self.inotify: INotify = None  # Created on first subscription
+        self.watches: Dict[int, Path] = {}  # Watch descriptor -> directory
+        self.directories: Dict[Path, int] = {}
+        self.subscriptions: Dict[Path, List[Subscription]] = {}
+
+        self.pending: Dict[Path, Event] = {}  # Path -> combined event
+        self.lastevent: float = 0.
+
+        self.loop: asyncio.AbstractEventLoop = None
+        self.flushhandle: asyncio.TimerHandle = None
+
+    def subscribe(self, path: Path, callback: Callable[[Event], None]) -> Subscription:
+        """Call callback(event) when the file at path changes"""
+        if self.inotify is None:
+            self.inotify = INotify()
+            if self.loop is not None:
+                self.loop.add_reader(self.inotify.fileno(), self.onreadable)
+
+        path = Path(path).resolve()  # Symlinked directories share one watch descriptor, so always resolve
+        directory = path.parent
+        if directory not in self.directories:
+            wd = self.inotify.add_watch(directory, self.watchflags)
+            self.directories[directory] = wd
+            self.watches[wd] = directory
+
+        subscription = Subscription(path, callback)
+        self.subscriptions.setdefault(path, []).append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscriptions = self.subscriptions.get(subscription.path, [])
+        if subscription in subscriptions:
+            subscriptions.remove(subscription)
+        if not subscriptions:
+            self.subscriptions.pop(subscription.path, None)
+        # Directory watches are kept, they're cheap and likely to be needed again on the next reload
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Have loop dispatch events as they arrive instead of polling"""
+        self.loop = loop
+        if self.inotify is not None:
+            loop.add_reader(self.inotify.fileno(), self.onreadable)
+
+    def detach(self) -> None:
+        if self.loop is not None and self.inotify is not None:
+            self.loop.remove_reader(self.inotify.fileno())
+        if self.flushhandle is not None:
+            self.flushhandle.cancel()
+            self.flushhandle = None
+        self.loop = None
+
+    @property
+    def attached(self) -> bool:
+        return self.loop is not None
+
+    def read(self) -> None:
+        for event in self.inotify.read(timeout=0):
+            directory = self.watches.get(event.wd)
+            if directory is None or not event.name:
+                continue
+            path = directory / event.name
+            if path not in self.subscriptions:
+                continue
+            previous = self.pending.get(path)
+            mask = event.mask if previous is None else previous.mask | event.mask
+            self.pending[path] = Event(event.wd, mask, event.cookie, event.name)
+            self.lastevent = time.perf_counter()
+
+    def onreadable(self) -> None:
+        self.read()
+        if self.pending:
+            if self.flushhandle is not None:
+                self.flushhandle.cancel()
+            self.flushhandle = self.loop.call_later(self.debounce, self.flush)
+
+    def poll(self) -> None:
+        """Read and dispatch events, only needed if not attached to a loop"""
+        if self.inotify is None:
+            return
+        self.read()
+        if self.pending and time.perf_counter() - self.lastevent >= self.debounce:
+            self.flush()
+
+    def flush(self) -> None:
+        self.flushhandle = None
+        pending, self.pending = self.pending, {}
+        for path, event in pending.items():
+            for subscription in list(self.subscriptions.get(path, [])):
+                callback = subscription.callback
+                if callback is None:  # Subscriber was garbage collected
+                    self.unsubscribe(subscription)
+                    continue
+                try:
+                    callback(event)
+                except Exception as exc:
+                    log.error("FILEWATCH", "Callback for %s failed: %s" % (path, exc))
+
+
+filewatchservice: FileWatchService = FileWatchService()  # Shared by all layers and shaders
@@ -5,26 +5,30 @@ from PyreeEngine.util import Resolution
 from PyreeEngine.basicObjects import FSQuad
 from PyreeEngine.shaders import FullscreenTexture
 from PyreeEngine.camera import Camera
+from PyreeEngine.glstate import glstate
+from PyreeEngine.gpuresources import gpuresources, GPUObject, texturebytes
 
 class Framebuffer():
     def __init__(self):
         self.fbo = None
 
     def bindFramebuffer(self):
-        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glstate.bindframebuffer(self.fbo)
 
 
 class DefaultFramebuffer():
     """Default OpenGL framebuffer object required for rendering to screen"""
 
+    screenfbo: int = 0  # Framebuffer standing in for the screen, replaced by the headless engine's render target
+
     def __init__(self):
-        self.fbo = 0  # OpenGL default framebuffer
+        self.fbo = DefaultFramebuffer.screenfbo  # OpenGL default framebuffer
 
     def bindFramebuffer(self):
-        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        glstate.bindframebuffer(DefaultFramebuffer.screenfbo)
 
 
-class RegularFramebuffer(Framebuffer):
+class RegularFramebuffer(Framebuffer, GPUObject):
     """Framebuffer with 2d Texture and depth attachment"""
 
     fsquad: FSQuad = None
@@ -33,18 +37,21 @@ class RegularFramebuffer(Framebuffer):
 
     def __init__(self, resolution: Resolution):
         super(RegularFramebuffer, self).__init__()
-        self.fbo = glGenFramebuffers(1)
-        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        self.fbo = self.texture = self.depthBuf = None
+        self.fbo = gpuresources.genframebuffer("RegularFramebuffer")
+        glstate.bindframebuffer(self.fbo)
 
-        self.texture = glGenTextures(1)
-        glBindTexture(GL_TEXTURE_2D, self.texture)
+        self.texture = gpuresources.gentexture(texturebytes(resolution.width, resolution.height, 16),
+                                               "RegularFramebuffer color")
+        glstate.bindtexture(GL_TEXTURE_2D, self.texture)
         glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA32F, resolution.width, resolution.height, 0, GL_RGBA, GL_FLOAT, None)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
 
         glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, self.texture, 0)
 
-        self.depthBuf = glGenRenderbuffers(1)
+        self.depthBuf = gpuresources.genrenderbuffer(texturebytes(resolution.width, resolution.height, 4),
+                                                     "RegularFramebuffer depth")
         glBindRenderbuffer(GL_RENDERBUFFER, self.depthBuf)
 
         glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT, resolution.width, resolution.height)
@@ -52,14 +59,19 @@ class RegularFramebuffer(Framebuffer):
 
         self.initrendertoscreen()
 
-    def __del__(self):
-        glDeleteFramebuffers(1, [self.fbo])
-        glDeleteTextures([self.texture])
+    def release(self):
+        gpuresources.delete("framebuffer", self.fbo)
+        gpuresources.delete("texture", self.texture)
+        gpuresources.delete("renderbuffer", self.depthBuf)
+        self.fbo = None
+        self.texture = None
+        self.depthBuf = None
 
     def initrendertoscreen(self):
         """Sets up the objects required to render framebuffer contents to default framebuffer"""
         if RegularFramebuffer.fsquad is None:
-            RegularFramebuffer.fsquad = FSQuad()
+            with gpuresources.ownedby("engine"):  # Shared by all framebuffers, outlives the layer creating it
+                RegularFramebuffer.fsquad = FSQuad()
         if RegularFramebuffer.fstextureshader is None:
             RegularFramebuffer.fstextureshader = FullscreenTexture()
             RegularFramebuffer.fsquad.shader = RegularFramebuffer.fstextureshader
@@ -68,6 +80,6 @@ class RegularFramebuffer(Framebuffer):
 
     def rendertoscreen(self):
         """Renders the framebuffer to default framebuffer (Aka the screen)"""
-        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        glstate.bindframebuffer(DefaultFramebuffer.screenfbo)
         RegularFramebuffer.fsquad.textures = [self.texture]
         RegularFramebuffer.fsquad.render(RegularFramebuffer.fscamera.viewMatrix)
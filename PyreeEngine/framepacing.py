@@ -0,0 +1,110 @@
+"""Frame pacing and frame time statistics"""
+
+from typing import List, Dict
+
+import asyncio
+import time
+
+from PyreeEngine.stats import RollingStats
+
+
+class FrameStats(RollingStats):
+    """Frame time histogram with percentiles of the last window frame times (in ms) and missed vsync count"""
+
+    def __init__(self, window: int = 1000, binwidth: float = 0.5, bins: int = 200):
+        super(FrameStats, self).__init__(window)
+        self.binwidth: float = binwidth  # ms
+        self.histogram: List[int] = [0] * (bins + 1)  # Since start, last bin collects everything above the range
+        self.missedvsync: int = 0
+        self.frames: int = 0
+
+    def add(self, frametime: float, refreshinterval: float = None) -> None:
+        """Add frame time in seconds. Frames taking more than 1.5 refresh intervals count as missed vsync."""
+        ms = frametime * 1000
+        super(FrameStats, self).add(ms)
+        self.histogram[min(int(ms / self.binwidth), len(self.histogram) - 1)] += 1
+        self.frames += 1
+        if refreshinterval is not None and frametime > 1.5 * refreshinterval:
+            self.missedvsync += 1
+
+    def summary(self) -> Dict[str, float]:
+        return {"p50": self.p50, "p95": self.p95, "p99": self.p99, "missedvsync": self.missedvsync,
+                "frames": self.frames}
+
+
+class FrameScheduler():
+    """Decides when the next frame starts and how many fixed timestep updates it runs
+
+    Modes:
+      vsync:    Swap is synchronized to the display, no additional pacing
+      uncapped: No vsync and no pacing, for benchmarks
+      fixed:    No vsync, frames are paced to targetfps by sleeping and spinning for the last few ms
+
+    If fixedtimestep is set, every frame runs as many updates of fixedtimestep seconds as have accumulated. The
+    remainder is exposed as alpha (0..1) for interpolating between the last two update states."""
+
+    modes = ["vsync", "uncapped", "fixed"]
+
+    def __init__(self, mode: str = "vsync", targetfps: float = 60., fixedtimestep: float = None,
+                 maxfixedsteps: int = 5, refreshrate: float = 60., spinmargin: float = 0.002):
+        if mode not in FrameScheduler.modes:
+            raise ValueError("Invalid frame pacing mode (mode=%s)" % mode)
+        self.mode: str = mode
+        self.targetfps: float = targetfps
+        self.fixedtimestep: float = fixedtimestep
+        self.maxfixedsteps: int = maxfixedsteps  # Prevents spiral of death when updates are slower than realtime
+        self.refreshrate: float = refreshrate
+        self.spinmargin: float = spinmargin  # Seconds before deadline at which sleeping turns into spinning
+
+        self.stats: FrameStats = FrameStats()
+
+        self.accumulator: float = 0.
+        self.alpha: float = 0.
+        self.laststart: float = None
+        self.deadline: float = None
+
+    @property
+    def swapinterval(self) -> int:
+        return 1 if self.mode == "vsync" else 0
+
+    def beginframe(self) -> None:
+        """Record frame time of the previous frame"""
+        now = time.perf_counter()
+        if self.laststart is not None:
+            refreshinterval = 1. / self.refreshrate if self.mode == "vsync" else None
+            self.stats.add(now - self.laststart, refreshinterval)
+        self.laststart = now
+
+    def fixedsteps(self, dt: float) -> int:
+        """Number of fixed timestep updates to run this frame"""
+        if self.fixedtimestep is None:
+            return 0
+        self.accumulator += dt
+        steps = int(self.accumulator / self.fixedtimestep)
+        if steps > self.maxfixedsteps:
+            self.accumulator = 0.
+            steps = self.maxfixedsteps
+        else:
+            self.accumulator -= steps * self.fixedtimestep
+        self.alpha = self.accumulator / self.fixedtimestep
+        return steps
+
+    async def wait(self) -> None:
+        """Wait until the next frame is due. Sleeps on the event loop, so other tasks run in the meantime."""
+        if self.mode != "fixed":
+            await asyncio.sleep(0)
+            return
+
+        interval = 1. / self.targetfps
+        now = time.perf_counter()
+        if self.deadline is None or now - self.deadline > interval:
+            self.deadline = now  # Fell behind by more than a frame, don't try to catch up
+        self.deadline += interval
+
+        remaining = self.deadline - time.perf_counter()
+        if remaining > self.spinmargin:
+            await asyncio.sleep(remaining - self.spinmargin)
+        else:
+            await asyncio.sleep(0)
+        while time.perf_counter() < self.deadline:
+            pass
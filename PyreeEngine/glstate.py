@@ -0,0 +1,153 @@
+"""GL state cache
+
+Every PyOpenGL call costs several microseconds of argument conversion and error checking, even if it changes nothing.
+The engine's objects therefore bind buffers, vertex arrays, programs, textures and framebuffers through the glstate
+singleton, which remembers what is bound and skips binds that wouldn't change anything. Uniform locations are cached
+per program as well.
+
+The cache only knows about binds that went through it. It is reset at the start of every frame and before every layer
+tick, but code that binds directly with glBind*/glUseProgram in between has to call glstate.reset() afterwards, or
+use glstate itself. Objects that delete GL names have to call glstate.forget() with them, as GL reuses names.
+
+With PYREE_GLMODE=debug every skipped bind is checked against the actual GL state, and mismatches are logged and
+corrected. See PyreeEngine/__init__.py for the modes."""
+
+from typing import Dict, Tuple
+
+from OpenGL.GL import *
+
+import PyreeEngine
+from PyreeEngine import log
+
+bindingqueries = {GL_ARRAY_BUFFER: GL_ARRAY_BUFFER_BINDING, GL_ELEMENT_ARRAY_BUFFER: GL_ELEMENT_ARRAY_BUFFER_BINDING,
+                  GL_UNIFORM_BUFFER: GL_UNIFORM_BUFFER_BINDING, GL_SHADER_STORAGE_BUFFER: GL_SHADER_STORAGE_BUFFER_BINDING,
+                  GL_PIXEL_PACK_BUFFER: GL_PIXEL_PACK_BUFFER_BINDING,
+                  GL_PIXEL_UNPACK_BUFFER: GL_PIXEL_UNPACK_BUFFER_BINDING,
+                  GL_DRAW_INDIRECT_BUFFER: GL_DRAW_INDIRECT_BUFFER_BINDING,
+                  GL_TEXTURE_2D: GL_TEXTURE_BINDING_2D, GL_TEXTURE_2D_ARRAY: GL_TEXTURE_BINDING_2D_ARRAY,
+                  GL_TEXTURE_3D: GL_TEXTURE_BINDING_3D, GL_TEXTURE_CUBE_MAP: GL_TEXTURE_BINDING_CUBE_MAP,
+                  GL_DRAW_FRAMEBUFFER: GL_DRAW_FRAMEBUFFER_BINDING, GL_READ_FRAMEBUFFER: GL_READ_FRAMEBUFFER_BINDING}
+
+
+class GLState():
+    def __init__(self):
+        self.enabled: bool = True  # Pass every bind through to GL if disabled
+        self.verify: bool = PyreeEngine.glmode == "debug"  # Check skipped binds against GL
+        self.uniforms: Dict[Tuple[int, str], int] = {}  # (program, name) -> location, kept across reset()
+        self.reset()
+
+        # Statistics
+        self.issued: int = 0  # Binds passed to GL
+        self.skipped: int = 0  # Redundant binds that were skipped
+
+    def reset(self, uniforms: bool = False) -> None:
+        """Forget bindings, call after binding objects without going through the cache. Uniform locations stay valid
+        until their program is deleted, they are only forgotten with uniforms set, e.g. when the context is destroyed."""
+        if uniforms:
+            self.uniforms = {}
+        self.buffers: Dict[int, int] = {}  # Target -> buffer
+        self.vertexarray: int = None
+        self.program: int = None
+        self.unit: int = None  # Active texture unit, GL_TEXTURE0 + i
+        self.textures: Dict[Tuple[int, int], int] = {}  # (unit, target) -> texture
+        self.framebuffers: Dict[int, int] = {}  # GL_DRAW_FRAMEBUFFER / GL_READ_FRAMEBUFFER -> framebuffer
+
+    def forget(self, *names: int) -> None:
+        """Drop deleted GL names from the cache. Buffers, textures etc. have separate name spaces, so this may forget
+        more than necessary, which is harmless."""
+        names = set(int(name) for name in names)
+        self.buffers = {target: buffer for target, buffer in self.buffers.items() if buffer not in names}
+        self.textures = {key: texture for key, texture in self.textures.items() if texture not in names}
+        self.framebuffers = {target: fbo for target, fbo in self.framebuffers.items() if fbo not in names}
+        self.uniforms = {key: location for key, location in self.uniforms.items() if key[0] not in names}
+        if self.vertexarray in names:
+            self.vertexarray = None
+        if self.program in names:
+            self.program = None
+
+    def cached(self, current, value, query: int) -> bool:
+        """Whether value is already bound according to the cache"""
+        if not self.enabled or current is None or int(current) != int(value):
+            return False
+        if self.verify:
+            actual = glGetIntegerv(query)
+            if int(actual) != int(value):
+                log.warning("GLSTATE", "Expected %i to be bound for 0x%x, found %i. Something bound it without going "
+                                       "through glstate." % (value, query, actual))
+                return False
+        self.skipped += 1
+        return True
+
+    def bindbuffer(self, target: int, buffer: int) -> None:
+        if self.cached(self.buffers.get(target), buffer, bindingqueries.get(target, GL_ARRAY_BUFFER_BINDING)):
+            return
+        glBindBuffer(target, buffer)
+        self.buffers[target] = buffer
+        self.issued += 1
+
+    def bindbufferbase(self, target: int, index: int, buffer: int) -> None:
+        """Bind buffer to an indexed binding point. GL binds it to the generic target as well, so the cache follows.
+        Indexed bindings themselves aren't cached."""
+        glBindBufferBase(target, index, buffer)
+        self.buffers[target] = buffer
+        self.issued += 1
+
+    def bindvertexarray(self, vertexarray: int) -> None:
+        if self.cached(self.vertexarray, vertexarray, GL_VERTEX_ARRAY_BINDING):
+            return
+        glBindVertexArray(vertexarray)
+        self.vertexarray = vertexarray
+        self.buffers.pop(GL_ELEMENT_ARRAY_BUFFER, None)  # Element buffer binding is part of the vertex array
+        self.issued += 1
+
+    def useprogram(self, program: int) -> None:
+        if self.cached(self.program, program, GL_CURRENT_PROGRAM):
+            return
+        glUseProgram(program)
+        self.program = program
+        self.issued += 1
+
+    def activetexture(self, unit: int) -> None:
+        """unit is GL_TEXTURE0 + i"""
+        if self.cached(self.unit, unit, GL_ACTIVE_TEXTURE):
+            return
+        glActiveTexture(unit)
+        self.unit = unit
+        self.issued += 1
+
+    def bindtexture(self, target: int, texture: int, unit: int = None) -> None:
+        """Bind texture to unit (GL_TEXTURE0 + i), or to the active unit if unit is None"""
+        if unit is not None:
+            self.activetexture(unit)
+        elif self.unit is None:
+            self.unit = glGetIntegerv(GL_ACTIVE_TEXTURE)
+        key = (int(self.unit), target)
+        if self.cached(self.textures.get(key), texture, bindingqueries.get(target, GL_TEXTURE_BINDING_2D)):
+            return
+        glBindTexture(target, texture)
+        self.textures[key] = texture
+        self.issued += 1
+
+    def bindframebuffer(self, fbo: int, target: int = GL_FRAMEBUFFER) -> None:
+        if target == GL_FRAMEBUFFER:
+            if self.framebuffers.get(GL_READ_FRAMEBUFFER) == fbo and \
+                    self.cached(self.framebuffers.get(GL_DRAW_FRAMEBUFFER), fbo, GL_DRAW_FRAMEBUFFER_BINDING):
+                return
+            self.framebuffers[GL_DRAW_FRAMEBUFFER] = self.framebuffers[GL_READ_FRAMEBUFFER] = fbo
+        else:
+            if self.cached(self.framebuffers.get(target), fbo, bindingqueries[target]):
+                return
+            self.framebuffers[target] = fbo
+        glBindFramebuffer(target, fbo)
+        self.issued += 1
+
+    def uniformlocation(self, program: int, name: str) -> int:
+        key = (int(program), name)
+        location = self.uniforms.get(key)
+        if location is None or not self.enabled:
+            location = glGetUniformLocation(program, name)
+            self.uniforms[key] = location
+        return location
+
+
+glstate: GLState = GLState()
@@ -0,0 +1,122 @@
+"""GPU profiling with timestamp queries
+
+Every scope records two GL_TIMESTAMP queries. Queries of a frame are only read back once the ring buffer wraps around
+to that frame again, several frames later, so reading results never waits for the GPU. Scopes nest, their names are
+joined with "/" (e.g. "mylayer/pass")."""
+
+from typing import List, Dict
+from contextlib import contextmanager
+
+from OpenGL.GL import *
+from OpenGL.raw.GL.VERSION.GL_3_3 import glGetQueryObjectui64v as rawglGetQueryObjectui64v
+
+import numpy as np
+
+from PyreeEngine.stats import RollingStats
+
+
+class GPUScopeStats(RollingStats):
+    """Rolling statistics of a single scope, in milliseconds"""
+
+
+def queryresult(query: int) -> int:
+    """The glGetQueryObjectui64v wrapper of PyOpenGL 3.1.10 has no array type for GLuint64 outputs and raises KeyError,
+    so read through the raw entry point"""
+    result = GLuint64(0)
+    rawglGetQueryObjectui64v(query, GL_QUERY_RESULT, result)
+    return result.value
+
+
+class GPUProfiler():
+    def __init__(self, framelatency: int = 4, window: int = 120):
+        self.enabled: bool = False
+        self.framelatency: int = max(3, framelatency)  # Number of frames in flight before results are read back
+        self.window: int = window
+
+        self.freequeries: List[int] = []
+        self.frames: List[List[list]] = [[] for i in range(self.framelatency)]  # [name, start, end] per scope
+        self.lastquery: List[int] = [None] * self.framelatency  # Query issued last in each frame
+        self.frameindex: int = 0
+        self.stack: List[str] = []  # Names of open scopes
+        self.openscopes: List[list] = []
+
+        self.stats: Dict[str, GPUScopeStats] = {}
+        self.dropped: int = 0  # Frames whose results weren't available in time
+
+    def getquery(self) -> int:
+        if not self.freequeries:
+            self.freequeries = [int(query) for query in np.atleast_1d(glGenQueries(64))]
+        return self.freequeries.pop()
+
+    def beginframe(self) -> None:
+        """Advance ring buffer and collect results of the frame that is about to be reused"""
+        if not self.enabled:
+            return
+        self.frameindex = (self.frameindex + 1) % self.framelatency
+        self.collect(self.frames[self.frameindex], self.lastquery[self.frameindex])
+        self.frames[self.frameindex] = []
+        self.lastquery[self.frameindex] = None
+        self.stack = []
+        self.openscopes = []
+
+    def collect(self, scopes: List[list], lastquery: int) -> None:
+        if not scopes:
+            return
+
+        # Queries complete in order, so if the last one is available all of them are
+        if glGetQueryObjectiv(lastquery, GL_QUERY_RESULT_AVAILABLE) == GL_TRUE:
+            frametimes: Dict[str, float] = {}
+            for name, start, end in scopes:
+                elapsed = queryresult(end) - queryresult(start)
+                frametimes[name] = frametimes.get(name, 0.) + elapsed / 1e6  # Same-named scopes are summed
+            for name, ms in frametimes.items():
+                if name not in self.stats:
+                    self.stats[name] = GPUScopeStats(self.window)
+                self.stats[name].add(ms)
+        else:
+            self.dropped += 1
+
+        for name, start, end in scopes:
+            self.freequeries += [start, end]
+
+    def begin(self, name: str) -> None:
+        if not self.enabled:
+            return
+        self.stack.append(name)
+        start = self.getquery()
+        glQueryCounter(start, GL_TIMESTAMP)
+        scope = ["/".join(self.stack), start, None]
+        self.frames[self.frameindex].append(scope)
+        self.openscopes.append(scope)
+
+    def end(self) -> None:
+        if not self.enabled or not self.stack:
+            return
+        self.stack.pop()
+        scope = self.openscopes.pop()
+        scope[2] = self.getquery()
+        glQueryCounter(scope[2], GL_TIMESTAMP)
+        self.lastquery[self.frameindex] = scope[2]
+
+    @contextmanager
+    def scope(self, name: str):
+        """Time GPU work issued within the with block"""
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end()
+
+    def endframe(self) -> None:
+        """Drop scopes that were never closed, e.g. because of an exception between begin() and end()"""
+        if not self.enabled:
+            return
+        frame = self.frames[self.frameindex]
+        for scope in [scope for scope in frame if scope[2] is None]:
+            self.freequeries.append(scope[1])
+            frame.remove(scope)
+
+    def sendstats(self, oscclient, oscpath: str = "/pyree/gpu") -> None:
+        """Send average and max of each scope as [avg, max] in ms to oscpath/<scope name>"""
+        for name, stats in self.stats.items():
+            oscclient.send_message("%s/%s" % (oscpath, name), [stats.avg, stats.max])
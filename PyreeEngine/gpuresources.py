@@ -0,0 +1,236 @@
+"""Registry of GL objects
+
+Buffers, textures, framebuffers, renderbuffers, vertex arrays, shaders and programs are created and deleted through the
+gpuresources singleton. Every live object is recorded with an estimate of its size and the owner it was created
+under, which is the name of the layer that was initializing or ticking at the time, or "engine" otherwise.
+
+Objects are freed deterministically by calling release() on the engine class owning them (or by using it as a context
+manager), __del__ only remains as a fallback. Each layer reload starts a new generation for the layer's owner. Objects
+from older generations that are still alive once the new instance took over are reported as leaks, unless they were
+handed over on purpose through LayerResources."""
+
+from typing import Dict, List, Tuple, Iterable, Optional
+from contextlib import contextmanager
+from collections import defaultdict
+
+from OpenGL.GL import *
+
+import gc
+
+from PyreeEngine.glstate import glstate
+from PyreeEngine import log
+
+
+ResourceKey = Tuple[str, int]  # (kind, GL name)
+
+
+class GPUResource():
+    __slots__ = ("kind", "name", "nbytes", "owner", "generation", "label")
+
+    def __init__(self, kind: str, name: int, nbytes: int, owner: str, generation: int, label: str):
+        self.kind: str = kind
+        self.name: int = name
+        self.nbytes: int = nbytes  # Estimated
+        self.owner: str = owner
+        self.generation: int = generation
+        self.label: str = label
+
+    def __repr__(self):
+        return "<%s %i %s %s, %s>" % (self.kind, self.name, self.label or "unlabeled", formatbytes(self.nbytes),
+                                      self.owner)
+
+
+def formatbytes(nbytes: int) -> str:
+    if nbytes >= 1 << 20:
+        return "%.1f MiB" % (nbytes / (1 << 20))
+    if nbytes >= 1 << 10:
+        return "%.1f KiB" % (nbytes / (1 << 10))
+    return "%i B" % nbytes
+
+
+def texturebytes(width: int, height: int, bytesperpixel: int = 4, layers: int = 1, mipmaps: bool = False) -> int:
+    """Estimated size of a texture, a full mipmap chain adds a third"""
+    nbytes = width * height * bytesperpixel * layers
+    return nbytes * 4 // 3 if mipmaps else nbytes
+
+
+class GPUObject():
+    """Base for engine classes owning GL objects. release() frees them, usable as context manager. __del__ releases
+    as well, but only runs once the last reference is gone, which may be much later than expected. Classes whose GL
+    names are commonly used without keeping the object around set releaseondel to False."""
+
+    releaseondel: bool = True
+
+    def release(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exctype, excvalue, tb) -> None:
+        self.release()
+
+    def __del__(self):
+        if self.releaseondel:
+            self.release()
+
+
+class GPUResourceRegistry():
+    kinds = ("buffer", "texture", "framebuffer", "renderbuffer", "vertexarray", "program", "shader")
+
+    def __init__(self):
+        self.resources: Dict[ResourceKey, GPUResource] = {}
+        self.owner: str = "engine"  # Owner of newly created objects, see ownedby()
+        self.generations: Dict[str, int] = defaultdict(int)  # Owner -> current generation
+        self.collectors: List[List[ResourceKey]] = []  # Active collect() blocks
+
+        # Statistics
+        self.created: int = 0
+        self.deleted: int = 0
+
+    @contextmanager
+    def ownedby(self, owner: str):
+        """Objects created inside are attributed to owner"""
+        previous = self.owner
+        self.owner = owner
+        try:
+            yield
+        finally:
+            self.owner = previous
+
+    @contextmanager
+    def collect(self):
+        """Yields a list that receives the keys of all objects created inside"""
+        created = []
+        self.collectors.append(created)
+        try:
+            yield created
+        finally:
+            self.collectors.remove(created)
+
+    def newgeneration(self, owner: str) -> int:
+        """Everything owner created so far is expected to be freed or adopted by the next instance"""
+        self.generations[owner] += 1
+        return self.generations[owner]
+
+    def adopt(self, keys: Iterable[ResourceKey]) -> None:
+        """Move objects that were handed to a new instance on purpose to their owner's current generation"""
+        for key in keys:
+            resource = self.resources.get(key)
+            if resource is not None:
+                resource.generation = self.generations[resource.owner]
+
+    def register(self, kind: str, name: int, nbytes: int = 0, label: str = "") -> int:
+        """Record an object created outside of the gen* functions below, returns name"""
+        key = (kind, int(name))
+        self.resources[key] = GPUResource(kind, int(name), nbytes, self.owner, self.generations[self.owner], label)
+        for created in self.collectors:
+            created.append(key)
+        self.created += 1
+        return name
+
+    def resize(self, kind: str, name: int, nbytes: int) -> None:
+        """Update the size estimate after (re)allocating storage"""
+        resource = self.resources.get((kind, int(name)))
+        if resource is not None:
+            resource.nbytes = nbytes
+
+    def genbuffer(self, nbytes: int = 0, label: str = "") -> int:
+        return self.register("buffer", glGenBuffers(1), nbytes, label)
+
+    def gentexture(self, nbytes: int = 0, label: str = "") -> int:
+        return self.register("texture", glGenTextures(1), nbytes, label)
+
+    def genframebuffer(self, label: str = "") -> int:
+        return self.register("framebuffer", glGenFramebuffers(1), 0, label)
+
+    def genrenderbuffer(self, nbytes: int = 0, label: str = "") -> int:
+        return self.register("renderbuffer", glGenRenderbuffers(1), nbytes, label)
+
+    def genvertexarray(self, label: str = "") -> int:
+        return self.register("vertexarray", glGenVertexArrays(1), 0, label)
+
+    def createprogram(self, label: str = "") -> int:
+        return self.register("program", glCreateProgram(), 0, label)
+
+    def createshader(self, stagetype: int, label: str = "") -> int:
+        return self.register("shader", glCreateShader(stagetype), 0, label)
+
+    def delete(self, kind: str, name: Optional[int]) -> bool:
+        """Delete a registered GL object and drop it from the registry and the state cache. Unknown names and None are
+        ignored, so releasing twice or after the context was destroyed (see clear()) does nothing."""
+        if name is None or self.resources.pop((kind, int(name)), None) is None:
+            return False
+        name = int(name)
+        if kind == "buffer":
+            glDeleteBuffers(1, [name])
+        elif kind == "texture":
+            glDeleteTextures([name])
+        elif kind == "framebuffer":
+            glDeleteFramebuffers(1, [name])
+        elif kind == "renderbuffer":
+            glDeleteRenderbuffers(1, [name])
+        elif kind == "vertexarray":
+            glDeleteVertexArrays(1, [name])
+        elif kind == "program":
+            glDeleteProgram(name)
+        elif kind == "shader":
+            glDeleteShader(name)
+        else:
+            raise ValueError("Unknown GL object kind %s" % kind)
+        glstate.forget(name)
+        self.deleted += 1
+        return True
+
+    def islive(self, kind: str, name: Optional[int]) -> bool:
+        return name is not None and (kind, int(name)) in self.resources
+
+    def live(self, owner: str = None) -> List[GPUResource]:
+        return [resource for resource in self.resources.values() if owner is None or resource.owner == owner]
+
+    def totals(self, owner: str = None) -> Dict[str, Tuple[int, int]]:
+        """kind -> (count, estimated bytes)"""
+        totals = {}
+        for resource in self.live(owner):
+            count, nbytes = totals.get(resource.kind, (0, 0))
+            totals[resource.kind] = (count + 1, nbytes + resource.nbytes)
+        return totals
+
+    def byowner(self) -> Dict[str, Tuple[int, int]]:
+        """owner -> (count, estimated bytes)"""
+        owners = {}
+        for resource in self.resources.values():
+            count, nbytes = owners.get(resource.owner, (0, 0))
+            owners[resource.owner] = (count + 1, nbytes + resource.nbytes)
+        return owners
+
+    def stale(self, owner: str) -> List[GPUResource]:
+        """Objects of owner from older generations"""
+        generation = self.generations[owner]
+        return [resource for resource in self.live(owner) if resource.generation < generation]
+
+    def reportleaks(self, owner: str) -> List[GPUResource]:
+        """Log objects owner created before its last reload that are still alive, after collecting garbage so objects
+        in reference cycles had a chance to be freed"""
+        gc.collect()
+        leaked = self.stale(owner)
+        if leaked:
+            log.warning("GPURESOURCES", "%s leaked %i GL objects (%s) from earlier reloads: %s" % (
+                owner, len(leaked), formatbytes(sum(resource.nbytes for resource in leaked)),
+                ", ".join(repr(resource) for resource in leaked[:10]) + (", ..." if len(leaked) > 10 else "")))
+        return leaked
+
+    def report(self) -> None:
+        """Log live objects and estimated memory per owner and kind"""
+        for owner, (count, nbytes) in sorted(self.byowner().items()):
+            kinds = ", ".join("%i %s (%s)" % (kindcount, kind, formatbytes(kindbytes))
+                              for kind, (kindcount, kindbytes) in sorted(self.totals(owner).items()))
+            log.info("GPURESOURCES", "%s: %i objects, %s | %s" % (owner, count, formatbytes(nbytes), kinds))
+        log.info("GPURESOURCES", "%i created, %i deleted, %i live" % (self.created, self.deleted, len(self.resources)))
+
+    def clear(self) -> None:
+        """Forget everything without deleting, for when the context is destroyed"""
+        self.resources = {}
+
+
+gpuresources = GPUResourceRegistry()
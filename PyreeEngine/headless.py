@@ -0,0 +1,182 @@
+"""Headless engine without window, vsync or wall clock
+
+HeadlessEngine renders into a RegularFramebuffer on an offscreen context and advances LayerContext.time by a fixed dt
+per frame, as fast as the GPU (or Mesa's software rasterizer) allows. Frames are driven explicitly with step(n), which
+makes it usable for render farms, pre-rendering and automated checks.
+
+The context is created through EGL (surfaceless, works with Mesa's llvmpipe on GPU-less machines) or OSMesa. PyOpenGL
+selects its platform when OpenGL is first imported, so this module has to be imported before anything else that
+imports OpenGL. Set PYOPENGL_PLATFORM=osmesa beforehand to use OSMesa, EGL is the default."""
+
+import os
+import sys
+
+if "OpenGL.GL" not in sys.modules:
+    os.environ.setdefault("PYOPENGL_PLATFORM", "egl")
+
+from typing import Tuple
+from pathlib import Path
+
+import ctypes
+
+import numpy as np
+
+from OpenGL.GL import *
+
+from PyreeEngine.engine import Engine
+from PyreeEngine.layers import LayerManager, ProgramConfig
+from PyreeEngine.framebuffers import RegularFramebuffer, DefaultFramebuffer
+from PyreeEngine.shadercache import programcache
+from PyreeEngine.util import Resolution
+from PyreeEngine.glstate import glstate
+from PyreeEngine.gpuresources import gpuresources
+from PyreeEngine.preload import Preloader, StartupReport
+from PyreeEngine import log
+
+
+class HeadlessEngine(Engine):
+    def __init__(self, resolution: Tuple[int, int] = (1280, 720), dt: float = 1 / 60,
+                 programconfig: ProgramConfig = None, configpath: str = "programconfig.json", osc: bool = False):
+        """programconfig takes precedence over configpath. OSC input is only received if osc is set."""
+        self.dt: float = dt
+        self.platform: str = os.environ.get("PYOPENGL_PLATFORM")
+        if self.platform not in ("egl", "osmesa"):
+            raise RuntimeError("Headless rendering needs PYOPENGL_PLATFORM egl or osmesa, got %s. "
+                               "Import PyreeEngine.headless before OpenGL." % self.platform)
+
+        self.startup: StartupReport = StartupReport()
+        with self.startup.phase("config"):
+            if programconfig is not None:
+                self.programconfig = programconfig
+            else:
+                self.loadconfig(configpath)
+        self.preloader: Preloader = Preloader(self.programconfig.preloadthreads, self.startup)
+        self.preloader.warm()
+
+        with self.startup.phase("context"):
+            self.createcontext(resolution)
+
+        glEnable(GL_DEPTH_TEST)
+
+        self.init()
+
+        with self.startup.phase("setup"):
+            self.setupcontext(resolution)
+        self.layercontext.time = 0.
+
+        self.setupframepacing("uncapped", 1 / dt)
+
+        # Render target standing in for the screen
+        self.target: RegularFramebuffer = RegularFramebuffer(Resolution(width=resolution[0], height=resolution[1]))
+        DefaultFramebuffer.screenfbo = self.target.fbo
+
+        if osc:
+            self.startosc()
+
+        self.layermanager: LayerManager = LayerManager(self.programconfig, self.layercontext, self.preloader)
+        programcache.report()
+        self.startup.report()
+
+    def createcontext(self, resolution: Tuple[int, int]) -> None:
+        """Create offscreen context, no default framebuffer is needed as everything renders into self.target"""
+        self.window = None
+        if self.platform == "egl":
+            self.createeglcontext()
+        else:
+            self.createosmesacontext()
+        log.info("HEADLESS", "%s context: %s, %s" % (self.platform, glGetString(GL_VERSION).decode(),
+                                                     glGetString(GL_RENDERER).decode()))
+
+    def createeglcontext(self) -> None:
+        # Works around PyOpenGL 3.1.10 (and earlier 3.1.x): with OpenGL.ERROR_CHECKING disabled (PYREE_GLMODE=performance)
+        # OpenGL/raw/EGL/_errors.py assigns "_ErrorChecker = None" instead of "_error_checker = None", so importing any
+        # EGL function fails with an AttributeError. Define the name it meant before OpenGL.EGL gets imported.
+        from OpenGL.raw.EGL import _errors
+        if not hasattr(_errors, "_error_checker"):
+            _errors._error_checker = None
+        from OpenGL import EGL
+        from OpenGL.EGL.EXT.platform_base import eglGetPlatformDisplayEXT
+
+        EGL_PLATFORM_SURFACELESS_MESA = 0x31DD  # Not exposed by PyOpenGL
+
+        self.egldisplay = eglGetPlatformDisplayEXT(EGL_PLATFORM_SURFACELESS_MESA, EGL.EGL_DEFAULT_DISPLAY, None)
+        major, minor = EGL.EGLint(), EGL.EGLint()
+        EGL.eglInitialize(self.egldisplay, ctypes.pointer(major), ctypes.pointer(minor))
+
+        configattribs = (EGL.EGLint * 5)(EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+                                         EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT, EGL.EGL_NONE)
+        config = EGL.EGLConfig()
+        numconfigs = EGL.EGLint()
+        EGL.eglChooseConfig(self.egldisplay, configattribs, ctypes.pointer(config), 1, ctypes.pointer(numconfigs))
+        if numconfigs.value == 0:
+            raise RuntimeError("No EGL config with OpenGL support")
+
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        contextattribs = (EGL.EGLint * 7)(EGL.EGL_CONTEXT_MAJOR_VERSION, 4, EGL.EGL_CONTEXT_MINOR_VERSION, 5,
+                                          EGL.EGL_CONTEXT_OPENGL_PROFILE_MASK, EGL.EGL_CONTEXT_OPENGL_CORE_PROFILE_BIT,
+                                          EGL.EGL_NONE)
+        self.eglcontext = EGL.eglCreateContext(self.egldisplay, config, EGL.EGL_NO_CONTEXT, contextattribs)
+        EGL.eglMakeCurrent(self.egldisplay, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, self.eglcontext)
+
+    def createosmesacontext(self) -> None:
+        from OpenGL import osmesa, arrays
+
+        attribs = [osmesa.OSMESA_FORMAT, osmesa.OSMESA_RGBA,
+                   osmesa.OSMESA_PROFILE, osmesa.OSMESA_CORE_PROFILE,
+                   osmesa.OSMESA_CONTEXT_MAJOR_VERSION, 4,
+                   osmesa.OSMESA_CONTEXT_MINOR_VERSION, 5, 0]
+        self.osmesacontext = osmesa.OSMesaCreateContextAttribs((ctypes.c_int * len(attribs))(*attribs), None)
+        if not self.osmesacontext:
+            raise RuntimeError("Failed to create OSMesa context")
+        self.osmesabuffer = arrays.GLubyteArray.zeros((1, 1, 4))  # Never rendered to, but a context needs one
+        osmesa.OSMesaMakeCurrent(self.osmesacontext, self.osmesabuffer, GL_UNSIGNED_BYTE, 1, 1)
+
+    def step(self, frames: int = 1) -> None:
+        """Render frames, each advancing time by exactly dt"""
+        for i in range(frames):
+            self.layercontext.profiler.beginframe()
+            self.receiveosc()
+            self.scheduler.beginframe()
+
+            self.target.bindFramebuffer()
+            self.renderframe(self.dt, self.layercontext.time + self.dt)
+
+            self.layercontext.profiler.endframe()
+            self.layercontext.frame = self.layercontext.frame + 1
+
+    def startrecording(self, path: Path, dropframes: bool = False) -> None:
+        """Not real time, so by default every frame is recorded, waiting for the writer if necessary"""
+        super(HeadlessEngine, self).startrecording(path, dropframes)
+
+    def readpixels(self) -> np.ndarray:
+        """Contents of the render target as (height, width, 4) float32 array, bottom row first. Stalls the pipeline."""
+        self.target.bindFramebuffer()
+        width, height = self.layercontext.resolution
+        data = glReadPixels(0, 0, width, height, GL_RGBA, GL_FLOAT)
+        return np.frombuffer(data, dtype=np.float32).reshape(height, width, 4)
+
+    async def startmainloop(self) -> None:
+        raise RuntimeError("HeadlessEngine has no main loop, drive it with step()")
+
+    def close(self) -> None:
+        self.stoprecording()
+        if self.oscreceiver is not None:
+            self.oscreceiver.stop()
+        self.oscclient.stop()
+        self.layermanager = None
+        self.target = None
+        DefaultFramebuffer.screenfbo = 0
+        RegularFramebuffer.fsquad = None  # Shared objects must go while the context is still current
+        RegularFramebuffer.fstextureshader = None
+        gpuresources.report()
+
+        if self.platform == "egl":
+            from OpenGL import EGL
+            EGL.eglMakeCurrent(self.egldisplay, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+            EGL.eglDestroyContext(self.egldisplay, self.eglcontext)
+            EGL.eglTerminate(self.egldisplay)
+        else:
+            from OpenGL import osmesa
+            osmesa.OSMesaDestroyContext(self.osmesacontext)
+        glstate.reset(uniforms=True)  # Names are meaningless without the context
+        gpuresources.clear()
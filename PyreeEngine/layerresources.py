@@ -0,0 +1,113 @@
+"""Resources that survive layer reloads
+
+Every layer owns a LayerResources registry that lives as long as the layer, not the entry instance. Entry classes
+create GL objects through claim(key, factory) instead of constructing them directly. On the first load the factory is
+called, on every reload the new instance gets the object the previous instance registered under the same key, so
+VBOs, textures, framebuffers and shader programs aren't rebuilt when only tick logic changed.
+
+Resources the new instance doesn't claim during __init__ and init() are released once the reload succeeded. If the
+reload fails, nothing is released and the old resources stay available for the next attempt.
+
+Every reload starts a new generation of the layer's GL objects in the gpuresources registry. Objects handed over
+through claim() move along to the new generation, anything else the old instance created that is still alive after
+the reload is reported as leak."""
+
+from typing import Any, Callable, Dict, Hashable, Set, List
+
+from PyreeEngine.gpuresources import gpuresources, GPUObject, ResourceKey, formatbytes
+from PyreeEngine import log
+
+
+class ResourceEntry():
+    __slots__ = ("resource", "release", "signature", "globjects")
+
+    def __init__(self, resource: Any, release: Callable[[Any], None], signature: Hashable,
+                 globjects: List[ResourceKey]):
+        self.resource = resource
+        self.release: Callable[[Any], None] = release
+        self.signature: Hashable = signature
+        self.globjects: List[ResourceKey] = globjects  # Created by the factory, see gpuresources.adopt()
+
+
+class LayerResources():
+    def __init__(self, owner: str):
+        self.owner: str = owner  # Layer name, for log messages
+        self.entries: Dict[Hashable, ResourceEntry] = {}
+        self.claimed: Set[Hashable] = set()  # Keys claimed by the instance currently being loaded
+        self.reloading: bool = False
+
+        self.reused: int = 0  # Resources handed over on the last reload
+        self.created: int = 0  # Resources created on the last load
+        self.leaked: int = 0  # GL objects of earlier instances still alive after the last reload
+
+    def claim(self, key: Hashable, factory: Callable[[], Any], release: Callable[[Any], None] = None,
+              signature: Hashable = None) -> Any:
+        """Return resource registered under key, calling factory() to create it if there is none
+
+        release(resource) is called when the resource is dropped, without it GPUObjects are release()d and anything
+        else is simply dropped, leaving it to __del__. If signature differs from the one the resource was created with (e.g. a
+        resolution or a file path), the old resource is released and a new one created."""
+        self.claimed.add(key)
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry.signature == signature:
+                self.reused += 1
+                gpuresources.adopt(entry.globjects)
+                return entry.resource
+            self.releaseentry(key)
+
+        with gpuresources.collect() as globjects:
+            resource = factory()
+        self.entries[key] = ResourceEntry(resource, release, signature, globjects)
+        self.created += 1
+        return resource
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self.entries.get(key)
+        return default if entry is None else entry.resource
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def beginreload(self) -> None:
+        gpuresources.newgeneration(self.owner)
+        self.claimed = set()
+        self.reloading = True
+        self.reused = 0
+        self.created = 0
+
+    def commitreload(self) -> None:
+        """New instance is in place, release everything it didn't claim"""
+        self.reloading = False
+        unclaimed = [key for key in self.entries if key not in self.claimed]
+        for key in unclaimed:
+            self.releaseentry(key)
+        if self.reused or unclaimed:
+            log.info("RESOURCES", "Layer %s: %s resources reused, %s created, %s released" % (
+                self.owner, self.reused, self.created, len(unclaimed)))
+
+        self.leaked = len(gpuresources.reportleaks(self.owner))
+        count, nbytes = gpuresources.byowner().get(self.owner, (0, 0))
+        log.info("RESOURCES", "Layer %s: %i GL objects live, %s" % (self.owner, count, formatbytes(nbytes)))
+
+    def abortreload(self) -> None:
+        """New instance failed, keep all resources around for the next attempt"""
+        self.reloading = False
+
+    def releaseentry(self, key: Hashable) -> None:
+        entry = self.entries.pop(key)
+        if entry.release is not None or isinstance(entry.resource, GPUObject):
+            try:
+                if entry.release is not None:
+                    entry.release(entry.resource)
+                else:
+                    entry.resource.release()
+            except Exception as exc:
+                log.error("RESOURCES", "Failed to release resource %s of layer %s: %s" % (key, self.owner, exc))
+
+    def releaseall(self) -> None:
+        for key in list(self.entries):
+            self.releaseentry(key)
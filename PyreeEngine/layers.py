@@ -2,7 +2,7 @@
 
 import types
 import typing
-from typing import List, Tuple, Union, Any
+from typing import List, Tuple, Union, Any, Dict, Set
 
 from pathlib import Path
 
@@ -10,24 +10,30 @@ import importlib
 import sys
 import traceback
 
-from inotify_simple import INotify, flags, masks
+from inotify_simple import flags
 import inotify_simple
 
 import time
 
 from PyreeEngine import log
 
-from inotify_simple import INotify, flags, masks
-import inotify_simple
-
 from pathlib import Path
 
 import json
-
-import pythonosc.dispatcher
-import pythonosc.udp_client
+import functools
 
 from PyreeEngine.util import Resolution
+from PyreeEngine.gpuprofiler import GPUProfiler
+from PyreeEngine.profiler import Profiler
+from PyreeEngine.oscparams import ParameterStore
+from PyreeEngine.oscoutput import OSCOutputQueue
+from PyreeEngine.filewatch import filewatchservice, Subscription
+from PyreeEngine.framepacing import FrameStats
+from PyreeEngine.moduledeps import ModuleGraph
+from PyreeEngine.layerresources import LayerResources
+from PyreeEngine.preload import Preloader, StartupReport
+from PyreeEngine.glstate import glstate
+from PyreeEngine.gpuresources import gpuresources
 
 class LayerConfig(typing.NamedTuple):
     """Configuration for layers"""
@@ -40,6 +46,9 @@ class LayerConfig(typing.NamedTuple):
     onloadoscmessage: str = "LOAD"  # Message to send on load to onloadoscpath
     sortkey: Any = 0
 
+    worker: bool = False  # Run entry class (a WorkerEntry) in a worker process, see PyreeEngine.workerlayers
+    workerinterval: float = 1 / 60  # Minimum seconds between two ticks of a worker layer
+
 
 class ProgramConfig(typing.NamedTuple):
     layerdefs: List[LayerConfig] = []  # Layers read from configpath
@@ -48,6 +57,28 @@ class ProgramConfig(typing.NamedTuple):
     oscserverport: int = 1337  # Port of OSC server
     oscclientaddress: str = "127.0.0.1"  # IP address of OSC client
     oscclientport: int = 1337  # Port of OSC client
+    oscmtu: int = 1400  # Maximum size of outgoing OSC bundles in bytes
+    oscbudget: float = 0.002  # Seconds per frame for applying received OSC messages, the rest waits for next frame
+
+    framemode: str = "vsync"  # Frame pacing: "vsync", "uncapped" or "fixed"
+    targetfps: float = 60.  # Frame rate in "fixed" mode
+    fixedtimestep: float = None  # Seconds per fixed update (BaseEntry.fixedtick), None to disable fixed updates
+    maxdt: float = 0.2  # Upper limit of LayerContext.dt
+
+    profiling: bool = False  # Time layer ticks, reloads, OSC dispatch and buffer swaps on the CPU
+    profilercapturepath: str = "/pyree/profiler/capture"  # OSC path to trigger a trace capture, argument: frames
+
+    gpuprofiling: bool = False  # Time every layer and pass on the GPU
+    gpuprofileroscpath: str = "/pyree/gpu"  # OSC path prefix GPU timings are sent to, None to disable sending
+    gpuprofilerinterval: int = 60  # Send GPU timings every n frames
+
+    recordoscpath: str = "/pyree/record"  # OSC path to start recording, argument: video file or image directory, none to stop
+    recordfps: float = 60.  # Frame rate of recorded videos
+
+    preloadthreads: int = 4  # Threads importing layers and decoding assets at startup, 0 to load sequentially
+
+    loglevel: str = "info"  # Minimum level of log messages: "debug", "info", "success", "warning" or "error"
+    logjsonpath: str = None  # Additionally write log messages as JSON lines to this file
 
 
 class LayerContext():
@@ -58,12 +89,21 @@ class LayerContext():
         self.dt: float = 1.
         self.frame: int = 0
 
+        self.fixeddt: float = None  # Timestep of fixedtick(), None if fixed updates are disabled
+        self.alpha: float = 0.  # Interpolation factor between the last two fixed updates
+        self.framestats: FrameStats = FrameStats()
+
         self.resolution: Resolution = Resolution(width=800, height=600)
         self.aspect = self.resolution.width / self.resolution.height
         self.resolutionChangeCallbacks: List[types.FunctionType] = []
 
-        self.oscdispatcher: pythonosc.dispatcher.Dispatcher = None  # Server for receiving messages
-        self.oscclient: Union[pythonosc.udp_client.UDPClient, pythonosc.udp_client.SimpleUDPClient] = None  # Client for sending out messages
+        self.oscdispatcher: "pythonosc.dispatcher.Dispatcher" = None  # Server for receiving messages
+        self.oscclient: OSCOutputQueue = None  # Client for sending out messages, batched and sent at end of frame
+        self.params: ParameterStore = ParameterStore()  # Typed OSC parameters, snapshot taken once per frame
+        self.oscreceiver = None  # OSCReceiveThread, exposes receive-to-apply latency as oscreceiver.latency
+
+        self.profiler: Profiler = Profiler()  # Use profiler.scope("name") to time custom CPU work
+        self.gpuprofiler: GPUProfiler = GPUProfiler()  # Use gpuprofiler.scope("name") to time custom GPU work
 
         self.data = {}  # Additional misc. data that can be shared across layers
 
@@ -82,6 +122,9 @@ class LayerContext():
 
 
 class BaseEntry():
+    resources: LayerResources = None  # Set by Layer before __init__, see PyreeEngine.layerresources
+    assets: List[str] = []  # Image and obj files decoded in parallel at startup, see PyreeEngine.preload
+
     def __init__(self, context: LayerContext):
         self.context: LayerContext = context
 
@@ -97,6 +140,10 @@ class BaseEntry():
     def tick(self):
         pass
 
+    def fixedtick(self):
+        """Called with a fixed timestep of context.fixeddt before tick, if fixed updates are enabled"""
+        pass
+
 
 class Layer():
     """Layer of Pyree.
@@ -112,38 +159,58 @@ class Layer():
         self.config: LayerConfig = config
         self.context: LayerContext = context
 
-        self.inotify: INotify = None
-        self.watch: int = None
+        self.loadscopename: str = "load/%s" % self.config.name  # Profiler scope names, formatted once
+        self.tickscopename: str = "tick/%s" % self.config.name
+
+        self.filewatch: Subscription = None
+        self.filechanged: bool = False  # Set by file watch callback, consumed in tick
 
         self.module = None
         self.entryclass = None
         self.entryinstance: BaseEntry = None
         self.entrytick = None
+        self.resources: LayerResources = LayerResources(self.config.name)  # Handed from instance to instance
 
-        if self.loadmodule():
+        self.reload()
+        self.installfilewatch()
+
+    def reload(self):
+        with self.context.profiler.scope(self.loadscopename):
+            loaded = self.loadmodule()
+        if loaded:
             self.valid = True
             self.old = False
         else:
             self.valid = False
 
-        self.installfilewatch()
+    def reloaddependencies(self, helpers: List[str]) -> None:
+        """Called after helper modules this layer imports were reloaded, replaces the module and the instance"""
+        log.info("LAYER", "Reloading layer %s after change in %s" % (self.config.name, ", ".join(helpers)))
+        self.reload()
 
     def tick(self):
         """Check iwatch and replace module if necessary"""
         if self.checkfilewatch():
-            if self.loadmodule():
-                self.valid = True
-                self.old = False
-            else:
+            self.reload()
+
+        if self.valid:
+            try:
+                with gpuresources.ownedby(self.config.name):
+                    with self.context.profiler.scope(self.tickscopename):
+                        self.entryinstance.tick()
+            except Exception as exc:
+                log.exception("LAYER", "TICK EXCEPTION in module %s on layer %s", exc, self.config.module, self.config.name)
                 self.valid = False
+                self.entryinstance = None
 
+    def fixedtick(self):
         if self.valid:
             try:
-                self.entryinstance.tick()
+                with gpuresources.ownedby(self.config.name):
+                    self.entryinstance.fixedtick()
             except Exception as exc:
-                print(traceback.format_exc(), file=sys.stderr)
-                print(exc, file=sys.stderr)
-                log.error("LAYER", "TICK EXCEPTION in module %s on layer %s" % (self.config.module, self.config.name))
+                log.exception("LAYER", "FIXEDTICK EXCEPTION in module %s on layer %s", exc,
+                              self.config.module, self.config.name)
                 self.valid = False
                 self.entryinstance = None
 
@@ -168,10 +235,8 @@ class Layer():
             raise
             return False
         except Exception as exc:
-            print(traceback.format_exc(), file=sys.stderr)
-            print(exc, file=sys.stderr)
-            log.error("LAYER", "Module %s load exception, old instance persists on Layer %s" % (
-                self.config.module, self.config.name))
+            log.exception("LAYER", "Module %s load exception, old instance persists on Layer %s" % (
+                self.config.module, self.config.name), exc)
             self.old = True
             return False
 
@@ -183,32 +248,39 @@ class Layer():
             return False
 
         # Replace old instance with new instance
+        self.resources.beginreload()
         try:
-            newinstance: BaseEntry = self.entryclass(self.context)  # TODO: add context here
-            if self.entryinstance is not None:
-                newinstance.__deserialize__(self.entryinstance.__serialize__())
-            del self.entryinstance
-            self.entryinstance = newinstance
-            self.entryinstance.init()
+            with gpuresources.ownedby(self.config.name):  # GL objects the instance creates count towards this layer
+                newinstance: BaseEntry = self.entryclass.__new__(self.entryclass)
+                newinstance.resources = self.resources  # Available in __init__ already
+                newinstance.__init__(self.context)
+                if self.entryinstance is not None:
+                    newinstance.__deserialize__(self.entryinstance.__serialize__())
+                del self.entryinstance
+                self.entryinstance = newinstance
+                self.entryinstance.init()
         except Exception as exc:
-            print(traceback.format_exc(), file=sys.stderr)
-            print(exc, file=sys.stderr)
-            log.error("LAYER", "Failed to replace old instance with new instance on Layer %s" % self.config.name)
+            self.resources.abortreload()
+            log.exception("LAYER", "Failed to replace old instance with new instance on Layer %s", exc, self.config.name)
             return False
+        self.resources.commitreload()
+
+        if self.context.oscclient is not None and self.config.onloadoscpath is not None:
+            self.context.oscclient.send_message(self.config.onloadoscpath, self.config.onloadoscmessage, dedup=False)
 
         return True
 
     def installfilewatch(self) -> None:
-        fl = flags.CREATE | flags.MODIFY | flags.MOVED_TO
-        self.iNotify = INotify()
-        self.watch = self.iNotify.add_watch(self.config.filepath.parent, fl)
+        self.filewatch = filewatchservice.subscribe(self.config.filepath, self.onfileevent)
+
+    def onfileevent(self, event: inotify_simple.Event) -> None:
+        if self.checkevent(event):
+            self.filechanged = True
 
     def checkfilewatch(self) -> bool:
-        retVal = False
-        events = self.iNotify.read(timeout=0)
-        for event in events:
-            if self.checkevent(event):
-                retVal = True
+        """Returns True once after the layer file changed"""
+        retVal = self.filechanged
+        self.filechanged = False
         return retVal
 
     def checkevent(self, event: inotify_simple.Event) -> bool:
@@ -217,28 +289,110 @@ class Layer():
             if event.mask & (flags.CREATE | flags.MODIFY | flags.MOVED_TO):
                 log.info("LAYER", "Layer %s updated" % self.config.name)
                 retVal = True
-            elif event.mask & (flags.DELETE | flags.DELETE_SELF):
+            elif event.mask & (flags.DELETE | flags.DELETE_SELF | flags.MOVED_FROM):
                 self.valid = False
                 log.info("LAYER", "Layer %s deleted" % self.config.name)
         return retVal
 
 
 class LayerManager():
-    def __init__(self, config: ProgramConfig, context: LayerContext):
+    def __init__(self, config: ProgramConfig, context: LayerContext, preloader: Preloader = None):
         self.config: ProgramConfig = config
         self.context: LayerContext = context
         self.layers: List[Layer] = []
 
+        self.modulegraph: ModuleGraph = ModuleGraph()  # Local helper modules imported by layer modules
+        self.helperwatches: Dict[str, Subscription] = {}  # Helper module -> watch on its file
+        self.changedhelpers: Set[str] = set()  # Set by file watch callbacks, consumed in tick
+
+        self.preloader: Preloader = preloader if preloader is not None else Preloader(config.preloadthreads)
         self.loadlayers()
+        self.updatedependencies()
 
     def loadlayers(self) -> None:
+        from PyreeEngine.workerlayers import WorkerLayer
+        from PyreeEngine.shaders import ShaderBatch
+
+        layerconfs = []
         for layerdef in self.config.layerdefs:
             layerdef["filepath"] = Path(layerdef["module"].replace(".", "/") + ".py")
-            layerconf = LayerConfig(**layerdef)
-            newlayer = Layer(layerconf, self.context)
-            self.layers.append(newlayer)
+            layerconfs.append(LayerConfig(**layerdef))
+
+        report = self.preloader.report
+        self.preloader.preload([layerconf for layerconf in layerconfs if not layerconf.worker])
+
+        with report.phase("init"), ShaderBatch():
+            for layerconf in layerconfs:
+                start = time.perf_counter()
+                if layerconf.worker:
+                    newlayer = WorkerLayer(layerconf, self.context)
+                else:
+                    newlayer = Layer(layerconf, self.context)
+                report.addlayer(layerconf.name, "init", time.perf_counter() - start)
+                self.layers.append(newlayer)
         self.layers = sorted(self.layers, key=lambda x: x.config.sortkey)
 
+        self.preloader.finish()
+
+    def updatedependencies(self) -> None:
+        """Rescan imports of all layer modules and watch every helper module they depend on"""
+        layermodules = {layer.config.module for layer in self.layers}
+        helpers = set()
+        for layer in self.layers:
+            helpers |= self.modulegraph.scan(layer.config.module)
+        helpers -= layermodules  # Layers watch their own files
+
+        for name in set(self.helperwatches) - helpers:
+            filewatchservice.unsubscribe(self.helperwatches.pop(name))
+        for name in helpers - set(self.helperwatches):
+            path = self.modulegraph.paths.get(name)
+            if path is not None:
+                self.helperwatches[name] = filewatchservice.subscribe(path, functools.partial(self.onhelperevent, name))
+
+    def onhelperevent(self, modulename: str, event: inotify_simple.Event) -> None:
+        if event.mask & (flags.CREATE | flags.MODIFY | flags.MOVED_TO):
+            log.info("LAYER", "Helper module %s updated" % modulename)
+            self.changedhelpers.add(modulename)
+
+    def reloadhelpers(self) -> None:
+        """Reload changed helpers and everything importing them in dependency order, then replace affected layers"""
+        changed, self.changedhelpers = self.changedhelpers, set()
+        affected = self.modulegraph.dependents(changed)
+        layermodules = {layer.config.module for layer in self.layers}
+        helpers = [name for name in self.modulegraph.reloadorder(affected) if name not in layermodules]
+
+        importlib.invalidate_caches()
+        for name in helpers:
+            if name not in sys.modules:  # Only imported by worker layers
+                continue
+            try:
+                with self.context.profiler.scope("load/%s" % name):
+                    importlib.reload(sys.modules[name])
+            except Exception as exc:
+                log.exception("LAYER", "Helper module %s load exception, layers keep the old version" % name, exc)
+                return
+
+        for layer in self.layers:
+            if layer.config.module in affected:
+                layer.reloaddependencies(helpers)
+
+        self.updatedependencies()  # Reloaded modules may import different helpers now
+
+    def fixedtick(self):
+        for layer in self.layers:
+            layer.fixedtick()
+
     def tick(self):
+        if not filewatchservice.attached:
+            filewatchservice.poll()
+
+        if self.changedhelpers:
+            self.reloadhelpers()
+
+        layerchanged = any(layer.filechanged for layer in self.layers)
         for layer in self.layers:
-            layer.tick()
+            glstate.reset()  # Previous layer may have bound things directly
+            with self.context.gpuprofiler.scope(layer.config.name):
+                layer.tick()
+        if layerchanged:
+            self.updatedependencies()  # Layer module may import different helpers now
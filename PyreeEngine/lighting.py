@@ -0,0 +1,254 @@
+"""Clustered forward lighting
+
+The view frustum is split into a grid of clusters: tiles in screen space, and slices in view depth that grow
+exponentially from near to far plane. Once per frame update() packs all LightObjects into a shader storage buffer and
+assigns each light to every cluster its sphere of influence overlaps, vectorized with NumPy. A fragment shader then
+only loops over the lights listed for its own cluster, so the cost per pixel depends on how many lights actually reach
+it, not on the total number of lights.
+
+Shaders get access by including the GLSL in ClusteredLighting.glsl (or writeinclude() it as file for #include) and
+calling clusteredlight(worldpos, normal, albedo). LitShader is a ready made material using it:
+
+    self.lighting = ClusteredLighting()
+    self.lighting.lights = [LightObject(Vec3(1, 0.5, 0.2), radius=3.) for i in range(1000)]
+    self.model.shader = LitShader()
+    ...
+    self.lighting.update(camera, self.context.resolution)  # Before rendering lit objects
+    self.model.render(camera.projectionMatrix * camera.viewMatrix)
+
+Uses uniform block binding 2 and shader storage bindings 2 to 4."""
+
+from typing import List, Tuple
+
+from OpenGL.GL import *
+
+import numpy as np
+from pathlib import Path
+
+from PyreeEngine.engine import LightObject
+from PyreeEngine.camera import Camera
+from PyreeEngine.shaders import Shader
+from PyreeEngine.shadercache import programcache
+from PyreeEngine.glstate import glstate
+from PyreeEngine.gpuresources import gpuresources, GPUObject
+from PyreeEngine.util import Resolution
+
+InfoBinding = 2  # Uniform block
+LightBinding = 2  # Shader storage blocks
+ClusterBinding = 3
+IndexBinding = 4
+
+
+class ClusteredLighting(GPUObject):
+    glsl = """
+    layout (std140, binding = %i) uniform ClusterInfo {
+        mat4 clusterview;  // View matrix of the camera the clusters were built for
+        uvec4 clustergrid;  // Tiles x, tiles y, depth slices, light count
+        vec4 clusterparams;  // Screen width, screen height, near plane, far plane
+    };
+
+    struct Light {
+        vec4 posradius;
+        vec4 color;  // Color times intensity
+    };
+    layout (std430, binding = %i) readonly buffer Lights { Light lights[]; };
+    layout (std430, binding = %i) readonly buffer Clusters { uvec2 clusters[]; };  // Offset and count in lightindices
+    layout (std430, binding = %i) readonly buffer LightIndices { uint lightindices[]; };
+
+    uint clusterindex(vec3 worldpos)
+    {
+        float depth = -(clusterview * vec4(worldpos, 1.)).z;
+        float slice = log(max(depth, clusterparams.z) / clusterparams.z) / log(clusterparams.w / clusterparams.z);
+        uvec3 cell = uvec3(clamp(vec3(gl_FragCoord.xy / clusterparams.xy, slice) * vec3(clustergrid.xyz),
+                                 vec3(0.), vec3(clustergrid.xyz) - 1.));
+        return (cell.z * clustergrid.y + cell.y) * clustergrid.x + cell.x;
+    }
+
+    vec3 clusteredlight(vec3 worldpos, vec3 normal, vec3 albedo)
+    {
+        uvec2 cluster = clusters[clusterindex(worldpos)];
+        vec3 result = vec3(0.);
+        for (uint i = cluster.x; i < cluster.x + cluster.y; i++) {
+            Light light = lights[lightindices[i]];
+            vec3 tolight = light.posradius.xyz - worldpos;
+            float distance = length(tolight);
+            float window = clamp(1. - pow(distance / light.posradius.w, 4.), 0., 1.);  // Reaches 0 at the radius
+            float attenuation = window * window / (distance * distance + 1.);
+            result += albedo * light.color.rgb * max(dot(normal, tolight / max(distance, 1e-4)), 0.) * attenuation;
+        }
+        return result;
+    }
+    """ % (InfoBinding, LightBinding, ClusterBinding, IndexBinding)
+
+    def __init__(self, grid: Tuple[int, int, int] = (16, 9, 24), near: float = 0.1, far: float = 100.):
+        self.grid: Tuple[int, int, int] = grid  # Tiles x, tiles y, depth slices
+        self.near: float = near  # Depth range that is sliced, lights outside are ignored
+        self.far: float = far
+        self.lights: List[LightObject] = []
+        self.arrays: Tuple[np.ndarray, np.ndarray, np.ndarray] = None  # Positions, colors, radii, see setarrays()
+
+        self.infobuffer = self.lightbuffer = self.clusterbuffer = self.indexbuffer = None  # For release() if gen fails
+        self.infobuffer, self.lightbuffer, self.clusterbuffer, self.indexbuffer = [
+            gpuresources.genbuffer(label="ClusteredLighting %s" % name) for name in ("info", "lights", "clusters",
+                                                                                    "indices")]
+
+        # Statistics of last update
+        self.visible: int = 0  # Lights overlapping the view frustum
+        self.assignments: int = 0  # Light-cluster pairs
+
+    def setarrays(self, positions: np.ndarray, colors: np.ndarray, radii: np.ndarray) -> None:
+        """Use (n, 3) world positions, (n, 3) colors (times intensity) and (n,) radii instead of self.lights. Cheaper
+        for thousands of lights animated with NumPy. Pass None to go back to self.lights."""
+        self.arrays = (positions, colors, radii) if positions is not None else None
+
+    def packlights(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if self.arrays is not None:
+            positions, colors, radii = self.arrays
+            return (np.asarray(positions, np.float32).reshape((-1, 3)), np.asarray(colors, np.float32).reshape((-1, 3)),
+                    np.asarray(radii, np.float32).reshape(-1))
+        positions = np.array([light.worldpos() for light in self.lights], np.float32).reshape((-1, 3))
+        colors = np.array([light.color * light.intensity for light in self.lights], np.float32).reshape((-1, 3))
+        radii = np.array([light.radius for light in self.lights], np.float32)
+        return positions, colors, radii
+
+    def slices(self, depth: np.ndarray) -> np.ndarray:
+        """Depth slice index of view space depths, not clipped"""
+        gz = self.grid[2]
+        return np.floor(np.log(np.maximum(depth, self.near) / self.near) / np.log(self.far / self.near) * gz)
+
+    def assign(self, viewpos: np.ndarray, radii: np.ndarray, projection: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Cluster ranges of lights at view space positions. Returns (light, cluster) index pairs."""
+        gx, gy, gz = self.grid
+        depth = -viewpos[:, 2]
+        nearest = np.maximum(depth - radii, self.near)
+        farthest = np.maximum(depth + radii, self.near)
+        visible = (depth + radii >= self.near) & (depth - radii <= self.far)
+
+        ndcmin = np.empty((len(radii), 2), np.float32)
+        ndcmax = np.empty((len(radii), 2), np.float32)
+        for axis in (0, 1):
+            scale = projection[axis, axis]
+            low, high = viewpos[:, axis] - radii, viewpos[:, axis] + radii
+            if projection[3, 3] == 1:  # Orthographic
+                ndcmin[:, axis] = scale * low + projection[axis, 3]
+                ndcmax[:, axis] = scale * high + projection[axis, 3]
+            else:  # Bounds of x / depth over the light's bounding box, which is monotonic in both
+                ndcmin[:, axis] = scale * np.minimum(low / nearest, low / farthest)
+                ndcmax[:, axis] = scale * np.maximum(high / nearest, high / farthest)
+        visible &= np.all(ndcmax >= -1, axis=1) & np.all(ndcmin <= 1, axis=1)
+
+        sizes = np.array([gx, gy])
+        first = np.clip(np.floor((ndcmin * 0.5 + 0.5) * sizes), 0, sizes - 1).astype(np.int64)
+        last = np.clip(np.floor((ndcmax * 0.5 + 0.5) * sizes), 0, sizes - 1).astype(np.int64)
+        zfirst = np.clip(self.slices(depth - radii), 0, gz - 1).astype(np.int64)
+        zlast = np.clip(self.slices(depth + radii), 0, gz - 1).astype(np.int64)
+
+        lightindex = np.nonzero(visible)[0]
+        x0, y0, z0 = first[lightindex, 0], first[lightindex, 1], zfirst[lightindex]
+        nx = last[lightindex, 0] - x0 + 1
+        ny = last[lightindex, 1] - y0 + 1
+        nz = zlast[lightindex] - z0 + 1
+        counts = nx * ny * nz
+
+        # Expand every light's box of clusters into one entry per cluster
+        pairlight = np.repeat(np.arange(len(lightindex)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        nxp, nyp = nx[pairlight], ny[pairlight]
+        ix = x0[pairlight] + local % nxp
+        iy = y0[pairlight] + (local // nxp) % nyp
+        iz = z0[pairlight] + local // (nxp * nyp)
+        self.visible = len(lightindex)
+        return lightindex[pairlight], (iz * gy + iy) * gx + ix
+
+    def update(self, camera: Camera, resolution: Resolution) -> None:
+        """Assign lights to the clusters of camera's view and upload everything, call once per frame before drawing"""
+        gx, gy, gz = self.grid
+        positions, colors, radii = self.packlights()
+        view = np.asarray(camera.viewMatrix, np.float32)
+        viewpos = positions @ view[:3, :3].T + view[:3, 3]
+        lights, clusters = self.assign(viewpos, radii, np.asarray(camera.projectionMatrix, np.float32))
+        self.assignments = len(lights)
+
+        order = np.argsort(clusters, kind="stable")
+        indices = lights[order].astype(np.uint32)
+        clustercounts = np.bincount(clusters, minlength=gx * gy * gz).astype(np.uint32)
+        clusterranges = np.stack([np.cumsum(clustercounts) - clustercounts, clustercounts], axis=1).astype(np.uint32)
+
+        info = np.zeros(24, np.float32)
+        info[0:16] = view.T.reshape(-1)  # std140 matrices are column major
+        info.view(np.uint32)[16:20] = (gx, gy, gz, len(radii))
+        info[20:24] = (resolution[0], resolution[1], self.near, self.far)
+
+        lightdata = np.zeros((max(len(radii), 1), 8), np.float32)
+        lightdata[:len(radii), 0:3] = positions
+        lightdata[:len(radii), 3] = radii
+        lightdata[:len(radii), 4:7] = colors
+
+        for target, binding, buffer, data in ((GL_UNIFORM_BUFFER, InfoBinding, self.infobuffer, info),
+                                              (GL_SHADER_STORAGE_BUFFER, LightBinding, self.lightbuffer, lightdata),
+                                              (GL_SHADER_STORAGE_BUFFER, ClusterBinding, self.clusterbuffer,
+                                               clusterranges),
+                                              (GL_SHADER_STORAGE_BUFFER, IndexBinding, self.indexbuffer,
+                                               indices if len(indices) else np.zeros(1, np.uint32))):
+            glstate.bindbuffer(target, buffer)
+            glBufferData(target, data.nbytes, data, GL_STREAM_DRAW)  # Orphans last frame's storage
+            gpuresources.resize("buffer", buffer, data.nbytes)
+            glstate.bindbufferbase(target, binding, buffer)
+
+    def writeinclude(self, directory: Path, name: str = "clusteredlighting.glsl") -> Path:
+        """Write the GLSL to a file, so HotloadingShaders can #include it"""
+        path = Path(directory) / name
+        if not path.exists() or path.read_text() != ClusteredLighting.glsl:
+            path.write_text(ClusteredLighting.glsl)
+        return path
+
+    def release(self):
+        for buffer in (self.infobuffer, self.lightbuffer, self.clusterbuffer, self.indexbuffer):
+            gpuresources.delete("buffer", buffer)
+        self.infobuffer = self.lightbuffer = self.clusterbuffer = self.indexbuffer = None
+
+
+class LitShader(Shader):
+    """Diffuse material lit by ClusteredLighting. Set the albedo and ambient uniforms on the ModelObject."""
+
+    vertexCode = """#version 450 core
+    layout (location = 0) in vec3 posIn;
+    layout (location = 1) in vec2 uvIn;
+    layout (location = 2) in vec3 normIn;
+
+    layout (location = 0) out vec3 worldposOut;
+    layout (location = 1) out vec3 normalOut;
+
+    uniform mat4 MVP;
+    uniform mat4 M;
+
+    void main()
+    {
+        gl_Position = MVP * vec4(posIn, 1);
+        worldposOut = (M * vec4(posIn, 1)).xyz;
+        normalOut = mat3(transpose(inverse(M))) * normIn;
+    }
+    """
+
+    fragCode = """#version 450 core
+    %s
+    layout (location = 0) in vec3 worldposIn;
+    layout (location = 1) in vec3 normalIn;
+
+    uniform vec3 albedo = vec3(0.8);
+    uniform vec3 ambient = vec3(0.02);
+
+    layout (location = 0) out vec4 colorOut;
+    void main()
+    {
+        colorOut = vec4(albedo * ambient + clusteredlight(worldposIn, normalize(normalIn), albedo), 1.);
+    }
+    """ % ClusteredLighting.glsl
+
+    program = None
+
+    def getshaderprogram(self):
+        if LitShader.program is None:
+            LitShader.program = programcache.getprogram([(GL_VERTEX_SHADER, LitShader.vertexCode),
+                                                         (GL_FRAGMENT_SHADER, LitShader.fragCode)])
+        return LitShader.program
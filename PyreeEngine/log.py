@@ -1,17 +1,191 @@
-from sys import stderr
+"""Logging
+
+Messages are put on a queue and written by a background thread, so a slow terminal or pipe never blocks the render
+loop. Messages below the current level are discarded before anything is formatted. Identical consecutive messages are
+collapsed into a single "repeated n times" line, and if the queue fills up messages are dropped and counted instead of
+blocking. Optionally every message is also written to a JSON lines file."""
+
+from sys import stdout, stderr
 from datetime import datetime
+from typing import Any, Optional, TextIO
+
+import atexit
+import json
+import queue
+import threading
+import traceback
+import time as _time
+
+DEBUG = 10
+INFO = 20
+SUCCESS = 25
+WARNING = 30
+ERROR = 40
+
+colors = {DEBUG: "\033[90m", INFO: "\033[96m", SUCCESS: "\033[92m", WARNING: "\033[93m", ERROR: "\033[91m"}
+levelnames = {DEBUG: "debug", INFO: "info", SUCCESS: "success", WARNING: "warning", ERROR: "error"}
+
+_level: int = INFO
+_queue: queue.Queue = queue.Queue(maxsize=10000)
+_writer: threading.Thread = None
+_writerlock: threading.Lock = threading.Lock()
+_jsonsink: Optional[TextIO] = None
+_dropped: int = 0
+repeatinterval: float = 1.  # Seconds after which a pending "repeated" count is written even without a new message
+
 
 def time() -> str:
     return datetime.now().strftime("%H:%M:%S")
 
-def info(modulename: str, text: str):
-    print("[%s] \033[96m%s: \033[0m%s" % (time(), modulename, text))
 
-def warning(modulename: str, text: str):
-    print("[%s] \033[93m%s: \033[0m%s" % (time(), modulename, text))
+def setlevel(level: int) -> None:
+    """Discard messages below level"""
+    global _level
+    _level = level
+
+
+def setjsonsink(path: Optional[str]) -> None:
+    """Additionally write every message as a JSON object per line to path, None to stop"""
+    flush()
+    global _jsonsink
+    if _jsonsink is not None:
+        _jsonsink.close()
+    _jsonsink = open(path, "a") if path is not None else None
+
+
+def log(level: int, modulename: str, text: str, *args: Any, exc: BaseException = None) -> None:
+    """Queue message. If args are given, text is %-formatted with them on the writer thread."""
+    global _dropped
+    if level < _level:
+        return
+    if _writer is None:
+        startwriter()
+    try:
+        _queue.put_nowait((_time.time(), level, modulename, text, args, exc))
+    except queue.Full:
+        _dropped += 1
+
+
+def debug(modulename: str, text: str, *args: Any):
+    log(DEBUG, modulename, text, *args)
+
+
+def info(modulename: str, text: str, *args: Any):
+    log(INFO, modulename, text, *args)
+
+
+def warning(modulename: str, text: str, *args: Any):
+    log(WARNING, modulename, text, *args)
+
+
+def success(modulename: str, text: str, *args: Any):
+    log(SUCCESS, modulename, text, *args)
+
+
+def error(modulename: str, text: str, *args: Any):
+    log(ERROR, modulename, text, *args)
+
+
+def exception(modulename: str, text: str, exc: BaseException, *args: Any):
+    """Error with traceback of exc, the traceback is formatted on the writer thread"""
+    log(ERROR, modulename, text, *args, exc=exc)
+
+
+def startwriter() -> None:
+    global _writer
+    with _writerlock:
+        if _writer is None:
+            _writer = threading.Thread(target=writerthread, name="pyree-log", daemon=True)
+            _writer.start()
+            atexit.register(flush)
+
+
+def flush() -> None:
+    """Block until all queued messages are written"""
+    if _writer is not None and _writer.is_alive():
+        _queue.put(None)  # Makes the writer write out a pending repeat count
+        _queue.join()
+
+
+def formatmessage(record: tuple) -> str:
+    timestamp, level, modulename, text, args, exc = record
+    if args:
+        try:
+            text = text % args
+        except (TypeError, ValueError):
+            text = "%s %s" % (text, args)
+    if exc is not None:
+        text = "%s\n%s" % (text, "".join(traceback.format_exception(type(exc), exc, exc.__traceback__)).rstrip())
+    return text
+
+
+def write(record: tuple, text: str, repeated: int = 0) -> None:
+    timestamp, level, modulename = record[:3]
+    stamp = datetime.fromtimestamp(timestamp).strftime("%H:%M:%S")
+    if repeated:
+        text = "(last message repeated %i times)" % repeated
+    print("[%s] %s%s: \033[0m%s" % (stamp, colors.get(level, ""), modulename, text),
+          file=stderr if level >= ERROR else stdout)
+
+    if _jsonsink is not None:
+        entry = {"time": timestamp, "level": levelnames.get(level, level), "module": modulename, "text": text}
+        if repeated:
+            entry["repeated"] = repeated
+        _jsonsink.write(json.dumps(entry) + "\n")
+
+
+def writerthread() -> None:
+    global _dropped
+    last = None  # (level, modulename, text) of last written message
+    lastrecord = None
+    repeated = 0
+    while True:
+        try:
+            record = _queue.get(timeout=repeatinterval if repeated else None)
+        except queue.Empty:
+            write(lastrecord, "", repeated)  # Nothing new for a while, don't hold back the count any longer
+            repeated = 0
+            last = None
+            continue
+
+        if record is None:  # flush() waits for this, so everything written so far has to reach the files
+            try:
+                if repeated:
+                    write(lastrecord, "", repeated)
+                stdout.flush()
+                if _jsonsink is not None:
+                    _jsonsink.flush()
+            except (OSError, ValueError):
+                pass  # Output already closed, e.g. at interpreter exit
+            finally:
+                _queue.task_done()
+            repeated = 0
+            last = None
+            continue
+
+        try:
+            text = formatmessage(record)
+            key = (record[1], record[2], text)
+            if key == last:
+                repeated += 1
+                lastrecord = record
+            else:
+                if repeated:
+                    write(lastrecord, "", repeated)
+                    repeated = 0
+                write(record, text)
+                last = key
+                lastrecord = record
 
-def success(modulename: str, text: str):
-    print("[%s] \033[92m%s: \033[0m%s" % (time(), modulename, text))
+            if _dropped:
+                dropped, _dropped = _dropped, 0
+                write((record[0], WARNING, "LOG"), "%i messages dropped, log queue was full" % dropped)
 
-def error(modulename: str, text: str):
-    print("[%s] \033[91m%s: \033[0m%s" % (time(), modulename, text), file=stderr)
\ No newline at end of file
+            if _queue.empty():
+                stdout.flush()
+                if _jsonsink is not None:
+                    _jsonsink.flush()
+        except Exception as exc:
+            print("Failed to write log message: %s" % exc, file=stderr)
+        finally:
+            _queue.task_done()
@@ -0,0 +1,136 @@
+"""Import graph of layer modules
+
+Layer modules often share helper modules from the project. The graph is built statically from the import statements of
+each module, so it also covers worker layers whose modules are never imported in the render process. Only modules
+within the project directory are tracked; the standard library, installed packages and PyreeEngine itself are never
+reloaded."""
+
+from typing import Dict, Set, List, Optional
+from pathlib import Path
+
+import ast
+import importlib.util
+
+import PyreeEngine
+from PyreeEngine import log
+
+
+class ModuleGraph():
+    def __init__(self, root: Path = None):
+        self.root: Path = (root if root is not None else Path.cwd()).resolve()
+        self.enginedir: Path = Path(PyreeEngine.__file__).parent.resolve()
+
+        self.imports: Dict[str, Set[str]] = {}  # Module -> local modules it imports directly
+        self.paths: Dict[str, Path] = {}  # Module -> source file
+
+    def findsource(self, modulename: str) -> Optional[Path]:
+        try:
+            spec = importlib.util.find_spec(modulename)
+        except (ImportError, ValueError):
+            return None
+        if spec is None or spec.origin is None or not spec.origin.endswith(".py"):
+            return None
+        return Path(spec.origin).resolve()
+
+    def islocal(self, path: Path) -> bool:
+        if self.enginedir == path or self.enginedir in path.parents:
+            return False
+        if "site-packages" in path.parts or "dist-packages" in path.parts:
+            return False
+        return self.root in path.parents
+
+    def scan(self, modulename: str) -> Set[str]:
+        """(Re)scan module and everything it imports, returns all local modules it depends on, directly or not"""
+        self.forget(modulename)
+        self.scanmodule(modulename)
+        return self.dependencies(modulename)
+
+    def forget(self, modulename: str) -> None:
+        """Drop cached imports of module and its dependencies, so they are parsed again on next scan"""
+        for dependency in self.dependencies(modulename) | {modulename}:
+            self.imports.pop(dependency, None)
+
+    def scanmodule(self, modulename: str) -> None:
+        if modulename in self.imports:
+            return
+        path = self.findsource(modulename)
+        if path is None:
+            self.imports[modulename] = set()
+            return
+
+        self.paths[modulename] = path
+        self.imports[modulename] = set()  # Set before recursing, handles import cycles
+        imports = set()
+        for name in self.findimports(modulename, path):
+            importpath = self.findsource(name)
+            if importpath is not None and self.islocal(importpath):
+                imports.add(name)
+        self.imports[modulename] = imports
+
+        for name in imports:
+            self.scanmodule(name)
+
+    @staticmethod
+    def findimports(modulename: str, path: Path) -> Set[str]:
+        """Names of all modules imported in file, relative imports resolved"""
+        try:
+            tree = ast.parse(path.read_text(), str(path))
+        except (OSError, SyntaxError, ValueError) as exc:
+            log.warning("MODULEDEPS", "Can't parse %s: %s" % (path, exc))
+            return set()
+
+        package = modulename if path.name == "__init__.py" else modulename.rpartition(".")[0]
+        names = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names.update(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom):
+                base = ("." * node.level) + (node.module or "")
+                try:
+                    base = importlib.util.resolve_name(base, package) if node.level else base
+                except (ImportError, ValueError):
+                    continue
+                names.add(base)
+                names.update("%s.%s" % (base, alias.name) for alias in node.names)  # Might be submodules
+        return names
+
+    def dependencies(self, modulename: str) -> Set[str]:
+        """All modules module depends on, directly or not"""
+        result = set()
+        stack = list(self.imports.get(modulename, ()))
+        while stack:
+            name = stack.pop()
+            if name not in result:
+                result.add(name)
+                stack += self.imports.get(name, ())
+        return result
+
+    def dependents(self, modulenames: Set[str]) -> Set[str]:
+        """Modules in modulenames plus all modules that depend on any of them, directly or not"""
+        result = set(modulenames)
+        changed = True
+        while changed:
+            changed = False
+            for name, imports in self.imports.items():
+                if name not in result and imports & result:
+                    result.add(name)
+                    changed = True
+        return result
+
+    def reloadorder(self, modulenames: Set[str]) -> List[str]:
+        """Sort modules so that every module comes after the modules it imports"""
+        order = []
+        visited = set()
+
+        def visit(name):
+            if name in visited:
+                return
+            visited.add(name)
+            for dependency in sorted(self.imports.get(name, ())):
+                if dependency in modulenames:
+                    visit(dependency)
+            order.append(name)
+
+        for name in sorted(modulenames):
+            visit(name)
+        return order
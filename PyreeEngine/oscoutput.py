@@ -0,0 +1,129 @@
+"""Batched OSC output
+
+OSCOutputQueue is a drop-in replacement for SimpleUDPClient. send_message() only records the message. At the end of
+the frame flush() hands everything to a sender thread, which packs the messages into OSC bundles of at most mtu bytes
+and sends them. Repeated sends to the same address within a frame collapse to the last value, and addresses can be
+rate limited, in which case the latest value is sent as soon as the address is allowed to send again."""
+
+from typing import Any, Dict, List, Tuple
+from collections import OrderedDict
+
+import queue
+import socket
+import struct
+import threading
+import time
+
+from PyreeEngine import log
+
+
+class OSCOutputQueue():
+    def __init__(self, address: str, port: int, mtu: int = 1400):
+        self.address: Tuple[str, int] = (address, port)
+        self.mtu: int = mtu  # Maximum datagram size
+
+        self.pending: "OrderedDict[Any, Tuple[str, Any]]" = OrderedDict()  # Key -> (address, value)
+        self.ratelimits: Dict[str, float] = {}  # Address -> minimum seconds between two sends
+        self.lastsent: Dict[str, float] = {}
+        self.uniquekey: int = 0
+
+        self.sock: socket.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.outqueue: queue.SimpleQueue = queue.SimpleQueue()
+        self.thread: threading.Thread = threading.Thread(target=self.senderthread, name="pyree-osc-send", daemon=True)
+        self.thread.start()
+
+        # Statistics
+        self.sent: int = 0  # Messages
+        self.packets: int = 0  # Datagrams
+
+    def send_message(self, address: str, value: Any, dedup: bool = True) -> None:
+        """Queue message for sending at the end of the frame
+
+        If dedup is set, a later message to the same address in this frame replaces this one."""
+        if dedup:
+            key = address
+            self.pending.pop(key, None)  # Move to end, so messages keep the order of their last send
+        else:
+            key = self.uniquekey
+            self.uniquekey += 1
+        self.pending[key] = (address, value)
+
+    def setratelimit(self, address: str, rate: float) -> None:
+        """Send at most rate messages per second to address, None to remove limit"""
+        if rate is None:
+            self.ratelimits.pop(address, None)
+        else:
+            self.ratelimits[address] = 1. / rate
+
+    def flush(self) -> None:
+        """Hand all messages of this frame to the sender thread. Rate limited messages that aren't due yet are kept."""
+        if not self.pending:
+            return
+
+        now = time.perf_counter()
+        messages = []
+        for key, (address, value) in list(self.pending.items()):
+            interval = self.ratelimits.get(address)
+            if interval is not None:
+                if now - self.lastsent.get(address, -interval) < interval:
+                    continue
+                self.lastsent[address] = now
+            messages.append((address, value))
+            del self.pending[key]
+
+        if messages:
+            self.outqueue.put(messages)
+
+    def senderthread(self) -> None:
+        while True:
+            messages = self.outqueue.get()
+            if messages is None:
+                return
+            try:
+                self.sendbundles([self.builddgram(address, value) for address, value in messages])
+            except Exception as exc:
+                log.error("OSC", "Failed to send OSC messages: %s" % exc)
+
+    @staticmethod
+    def builddgram(address: str, value: Any) -> bytes:
+        from pythonosc.osc_message_builder import OscMessageBuilder  # Deferred, pythonosc is slow to import
+        builder = OscMessageBuilder(address=address)
+        if value is None:
+            values = []
+        elif isinstance(value, (list, tuple)):
+            values = value
+        else:
+            values = [value]
+        for val in values:
+            builder.add_arg(val)
+        return builder.build().dgram
+
+    def sendbundles(self, dgrams: List[bytes]) -> None:
+        header = b"#bundle\x00" + struct.pack(">Q", 1)  # Timetag 1 means immediately
+        bundle = []
+        size = len(header)
+        for dgram in dgrams:
+            elementsize = 4 + len(dgram)
+            if bundle and size + elementsize > self.mtu:
+                self.sendbundle(header, bundle)
+                bundle = []
+                size = len(header)
+            bundle.append(dgram)
+            size += elementsize
+        if bundle:
+            self.sendbundle(header, bundle)
+        self.sent += len(dgrams)
+
+    def sendbundle(self, header: bytes, dgrams: List[bytes]) -> None:
+        if len(dgrams) == 1:
+            data = dgrams[0]  # No need to wrap a single message
+        else:
+            data = header + b"".join(struct.pack(">i", len(dgram)) + dgram for dgram in dgrams)
+        self.sock.sendto(data, self.address)
+        self.packets += 1
+
+    def stop(self) -> None:
+        self.flush()
+        self.outqueue.put(None)
+        self.thread.join(timeout=1)
+        self.sock.close()
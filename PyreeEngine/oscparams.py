@@ -0,0 +1,136 @@
+"""Typed parameters fed by OSC
+
+Controllers send faders at hundreds of messages per second, but layers only care about the value at frame time. The
+OSC receive thread stores the raw arguments of registered addresses in a dict, overwriting older values, so there
+is no per-message dispatch at all. Once per frame update() converts and smooths the latest values, and layers read a
+consistent snapshot for the whole frame:
+
+    self.context.params.register("/fader/1", "float", default=0.5, smoothing=0.1)
+    ...
+    brightness = self.context.params["/fader/1"]
+"""
+
+from typing import Dict, Any, List
+
+import math
+import time
+
+import numpy as np
+
+from PyreeEngine import log
+
+
+class Parameter():
+    types = ["float", "int", "bool", "vec"]
+
+    def __init__(self, address: str, ptype: str = "float", default: Any = 0., smoothing: float = 0., size: int = None):
+        if ptype not in Parameter.types:
+            raise ValueError("Invalid parameter type (ptype=%s)" % ptype)
+        self.address: str = address
+        self.ptype: str = ptype
+        self.smoothing: float = smoothing  # Time constant in seconds, 0 to disable. Only for float and vec.
+        self.size: int = size if size is not None else (len(default) if ptype == "vec" else 1)
+
+        self.target: Any = self.convert(default if ptype != "vec" else list(default))
+        self.value: Any = self.target
+        self.lastraw: List[Any] = None
+
+    def convert(self, raw: Any) -> Any:
+        """Convert OSC arguments to parameter type"""
+        if self.ptype == "vec":
+            return np.array(raw[:self.size], np.float32)
+        if isinstance(raw, (list, tuple)):
+            raw = raw[0]
+        if self.ptype == "float":
+            return float(raw)
+        elif self.ptype == "int":
+            return int(raw)
+        return bool(raw)
+
+    def update(self, raw: List[Any], dt: float) -> None:
+        if raw is not None and raw is not self.lastraw:  # Receive thread stores a new list for every message
+            self.lastraw = raw
+            try:
+                self.target = self.convert(raw)
+            except (ValueError, TypeError, IndexError):
+                log.warning("OSCPARAMS", "Invalid value for %s: %s" % (self.address, raw))
+
+        if self.smoothing > 0 and self.ptype in ("float", "vec"):
+            self.value = self.value + (self.target - self.value) * (1 - math.exp(-dt / self.smoothing))
+        else:
+            self.value = self.target
+
+
+class ParameterStore():
+    def __init__(self):
+        self.parameters: Dict[str, Parameter] = {}
+        self.latest: Dict[str, List[Any]] = {}  # Address -> raw arguments of latest message, written by receive thread
+        self.values: Dict[str, Any] = {}  # Snapshot of this frame
+
+    def register(self, address: str, ptype: str = "float", default: Any = 0., smoothing: float = 0.,
+                 size: int = None) -> Parameter:
+        """Register typed parameter for OSC address. Registering an existing address returns the existing parameter.
+        If type or size differ, e.g. after a layer reload changed them, a warning is logged and the parameter replaced."""
+        existing = self.parameters.get(address)
+        if existing is not None:
+            if size is None:
+                size = len(default) if ptype == "vec" else 1
+            if existing.ptype == ptype and existing.size == size:
+                return existing
+            log.warning("OSCPARAMS", "%s re-registered as %s[%i], was %s[%i]. Replacing it." % (
+                address, ptype, size, existing.ptype, existing.size))
+        parameter = Parameter(address, ptype, default, smoothing, size)
+        self.parameters[address] = parameter
+        self.values[address] = parameter.value
+        return parameter
+
+    def unregister(self, address: str) -> None:
+        self.parameters.pop(address, None)
+        self.values.pop(address, None)
+        self.latest.pop(address, None)
+
+    def __contains__(self, address: str) -> bool:
+        return address in self.parameters
+
+    def __getitem__(self, address: str) -> Any:
+        return self.values[address]
+
+    def get(self, address: str, default: Any = None) -> Any:
+        return self.values.get(address, default)
+
+    def set(self, address: str, raw: List[Any]) -> None:
+        """Store raw message arguments, called from the receive thread"""
+        self.latest[address] = raw
+
+    def update(self, dt: float) -> None:
+        """Take snapshot of latest values, call once per frame on the render thread"""
+        for address, parameter in list(self.parameters.items()):
+            parameter.update(self.latest.get(address), dt)
+            self.values[address] = parameter.value
+
+
+class UnmappedLogger():
+    """Rate limited logging of unmapped OSC messages
+
+    The first message to an address is logged right away, after that the number of messages is summarized every
+    interval seconds."""
+
+    def __init__(self, interval: float = 5.):
+        self.interval: float = interval
+        self.counts: Dict[str, int] = {}
+        self.lastreport: float = time.perf_counter()
+
+    def __call__(self, address: str, *args):
+        if address not in self.counts:
+            log.warning("OSC", "Unmapped OSC message: %s %s" % (address, args))
+            self.counts[address] = 0
+        else:
+            self.counts[address] += 1
+
+        now = time.perf_counter()
+        if now - self.lastreport > self.interval:
+            for countaddress, count in self.counts.items():
+                if count > 0:
+                    log.warning("OSC", "%i more unmapped messages to %s" % (count, countaddress))
+                    self.counts[countaddress] = 0
+            self.lastreport = now
@@ -0,0 +1,90 @@
+"""OSC receiving on a dedicated thread
+
+The receive thread blocks on the UDP socket, decodes packets and appends the messages to a bounded deque. Appending
+and popping on a deque are atomic, so the render loop can drain messages without taking a lock. The engine drains
+the queue once per frame at a defined point and under a time budget, so a burst of messages can't eat the frame.
+Messages that didn't fit in the budget stay queued for the next frame.
+
+Messages to addresses registered in the ParameterStore never enter the queue, they only update the latest value."""
+
+from typing import Tuple, Deque
+from collections import deque
+
+import socket
+import threading
+import time
+
+from PyreeEngine import log
+from PyreeEngine.oscparams import ParameterStore
+from PyreeEngine.stats import RollingStats
+
+
+class LatencyStats(RollingStats):
+    """Rolling receive-to-apply latency in milliseconds"""
+
+
+class OSCReceiveThread(threading.Thread):
+    def __init__(self, address: str, port: int, parameters: ParameterStore = None, maxqueue: int = 8192):
+        super(OSCReceiveThread, self).__init__(name="pyree-osc-receive", daemon=True)
+        self.sock: socket.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((address, port))
+        self.sock.settimeout(0.1)  # Check for stop request regularly
+
+        self.parameters: ParameterStore = parameters  # Messages to registered parameters bypass the queue
+        self.queue: Deque[Tuple[int, Tuple[str, int], object]] = deque(maxlen=maxqueue)  # (receive ns, client, message)
+        self.stopevent: threading.Event = threading.Event()
+
+        self.received: int = 0
+        self.dropped: int = 0  # Messages pushed out of the full queue before they were applied
+        self.latency: LatencyStats = LatencyStats()
+
+    def run(self) -> None:
+        from pythonosc import osc_packet  # Deferred, pythonosc is slow to import
+
+        while not self.stopevent.is_set():
+            try:
+                data, clientaddress = self.sock.recvfrom(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+
+            receivetime = time.perf_counter_ns()
+            try:
+                packet = osc_packet.OscPacket(data)
+            except osc_packet.ParseError:
+                continue
+
+            for timedmessage in packet.messages:
+                self.received += 1
+                if self.parameters is not None and timedmessage.message.address in self.parameters:
+                    self.parameters.set(timedmessage.message.address, timedmessage.message.params)
+                    continue
+                if len(self.queue) == self.queue.maxlen:
+                    self.dropped += 1
+                self.queue.append((receivetime, clientaddress, timedmessage.message))
+
+        self.sock.close()
+
+    def drain(self, dispatcher: "pythonosc.dispatcher.Dispatcher", budget: float) -> int:
+        """Apply queued messages until queue is empty or budget (seconds) is used up. Call from the render thread."""
+        deadline = time.perf_counter_ns() + int(budget * 1e9)
+        applied = 0
+        while self.queue:
+            receivetime, clientaddress, message = self.queue.popleft()
+            for handler in dispatcher.handlers_for_address(message.address):
+                try:
+                    handler.invoke(clientaddress, message)
+                except Exception as exc:
+                    log.error("OSC", "Handler for %s failed: %s" % (message.address, exc))
+            applied += 1
+
+            now = time.perf_counter_ns()
+            self.latency.add((now - receivetime) / 1e6)
+            if now > deadline:
+                break
+        return applied
+
+    def stop(self) -> None:
+        self.stopevent.set()
+        self.join(timeout=1)
@@ -0,0 +1,356 @@
+"""GPU particle system
+
+Particle state lives in a shader storage buffer and never leaves the GPU. Each frame simulate() runs two compute
+passes: the first integrates forces and ages every live particle, pushing expired ones onto a free list with an atomic
+counter, the second pops indices off the free list for newly emitted particles. render() draws every slot as an
+instanced camera facing quad (or a point), dead particles are discarded in the vertex shader, so the CPU never needs to
+know how many particles are alive.
+
+Emitter settings are plain attributes of ParticleSystem.emitter, or can be bound to OSC addresses:
+
+    self.particles = ParticleSystem(100000)
+    self.particles.bindparams(self.context.params, "/particles")  # e.g. /particles/rate, /particles/position
+    ...
+    self.particles.simulate(self.context.dt)
+    self.particles.render(viewProjMatrix)
+
+Only needs GL 4.3 compute shaders and shader storage buffers, Mesa's llvmpipe is sufficient."""
+
+from typing import Dict
+
+from OpenGL.GL import *
+
+import numpy as np
+
+from PyreeEngine.engine import GeometryObject
+from PyreeEngine.shadercache import programcache
+from PyreeEngine.oscparams import ParameterStore
+from PyreeEngine.glstate import glstate
+from PyreeEngine.gpuresources import gpuresources, GPUObject
+
+WorkgroupSize = 64
+
+particlestruct = """
+struct Particle {
+    vec4 poslife;  // Position, remaining lifetime (dead if <= 0)
+    vec4 velmax;  // Velocity, initial lifetime
+};
+"""
+
+buffers = particlestruct + """
+layout (std430, binding = 0) buffer Particles { Particle particles[]; };
+layout (std430, binding = 1) buffer FreeList { int freecount; int freelist[]; };
+"""
+
+
+class Emitter():
+    """Emission and force parameters of a ParticleSystem"""
+
+    fields: Dict[str, str] = {"rate": "float", "position": "vec", "spread": "float", "velocity": "vec",
+                              "velocityspread": "float", "lifetime": "float", "lifetimespread": "float",
+                              "gravity": "vec", "drag": "float", "attractor": "vec", "attraction": "float",
+                              "size": "float", "endsize": "float", "color": "vec", "endcolor": "vec"}
+
+    def __init__(self):
+        self.rate: float = 1000.  # Particles per second
+        self.position: np.ndarray = np.zeros(3, np.float32)
+        self.spread: float = 0.1  # Radius of the sphere particles are spawned in
+        self.velocity: np.ndarray = np.array([0., 1., 0.], np.float32)
+        self.velocityspread: float = 0.5  # Random velocity added, up to this length
+        self.lifetime: float = 2.  # Seconds
+        self.lifetimespread: float = 0.5  # Lifetime varies by up to this many seconds
+        self.gravity: np.ndarray = np.array([0., -1., 0.], np.float32)
+        self.drag: float = 0.  # Velocity decays by exp(-drag * dt)
+        self.attractor: np.ndarray = np.zeros(3, np.float32)
+        self.attraction: float = 0.  # Acceleration towards attractor, negative to repel
+        self.size: float = 0.02  # Quad size at birth and death
+        self.endsize: float = 0.
+        self.color: np.ndarray = np.array([1., 0.6, 0.2, 1.], np.float32)  # RGBA at birth and death
+        self.endcolor: np.ndarray = np.array([1., 0.1, 0., 0.], np.float32)
+
+
+class ParticleSystem(GeometryObject, GPUObject):
+    updateCode = """#version 450 core
+    layout (local_size_x = %i) in;
+    %s
+    uniform float dt;
+    uniform int capacity;
+    uniform vec3 gravity;
+    uniform float drag;
+    uniform vec3 attractor;
+    uniform float attraction;
+
+    void main()
+    {
+        int id = int(gl_GlobalInvocationID.x);
+        if (id >= capacity || particles[id].poslife.w <= 0.)
+            return;
+
+        Particle p = particles[id];
+        vec3 towards = attractor - p.poslife.xyz;
+        vec3 acceleration = gravity + (dot(towards, towards) > 1e-8 ? normalize(towards) * attraction : vec3(0));
+        p.velmax.xyz = (p.velmax.xyz + acceleration * dt) * exp(-drag * dt);
+        p.poslife.xyz += p.velmax.xyz * dt;
+        p.poslife.w -= dt;
+
+        if (p.poslife.w <= 0.) {
+            p.poslife.w = 0.;
+            freelist[atomicAdd(freecount, 1)] = id;
+        }
+        particles[id] = p;
+    }
+    """ % (WorkgroupSize, buffers)
+
+    emitCode = """#version 450 core
+    layout (local_size_x = %i) in;
+    %s
+    uniform int emitcount;
+    uniform uint seed;
+    uniform vec3 position;
+    uniform float spread;
+    uniform vec3 velocity;
+    uniform float velocityspread;
+    uniform float lifetime;
+    uniform float lifetimespread;
+
+    uint pcg(uint v)
+    {
+        uint state = v * 747796405u + 2891336453u;
+        uint word = ((state >> ((state >> 28u) + 4u)) ^ state) * 277803737u;
+        return (word >> 22u) ^ word;
+    }
+
+    float random(inout uint state)
+    {
+        state = pcg(state);
+        return float(state) / 4294967295.;
+    }
+
+    vec3 randomsphere(inout uint state)  // Uniformly distributed in unit sphere
+    {
+        float z = random(state) * 2. - 1.;
+        float angle = random(state) * 6.2831853;
+        float r = sqrt(1. - z * z);
+        return vec3(r * cos(angle), r * sin(angle), z) * pow(random(state), 1. / 3.);
+    }
+
+    void main()
+    {
+        int i = int(gl_GlobalInvocationID.x);
+        if (i >= emitcount)
+            return;
+
+        int slot = atomicAdd(freecount, -1) - 1;
+        if (slot < 0) {  // Out of free particles
+            atomicAdd(freecount, 1);
+            return;
+        }
+        int id = freelist[slot];
+
+        uint state = pcg(uint(i) ^ pcg(seed));
+        float life = max(lifetime + (random(state) * 2. - 1.) * lifetimespread, 1e-3);
+        particles[id].poslife = vec4(position + randomsphere(state) * spread, life);
+        particles[id].velmax = vec4(velocity + randomsphere(state) * velocityspread, life);
+    }
+    """ % (WorkgroupSize, buffers)
+
+    vertexCode = """#version 450 core
+    %s
+    layout (std430, binding = 0) readonly buffer Particles { Particle particles[]; };
+
+    layout (location = 0) out vec4 colorOut;
+    layout (location = 1) out vec2 uvOut;
+
+    uniform mat4 MVP;
+    uniform bool points;
+    uniform vec2 quadscale;
+    uniform float pointscale;
+    uniform float size;
+    uniform float endsize;
+    uniform vec4 color;
+    uniform vec4 endcolor;
+
+    void main()
+    {
+        Particle p = particles[points ? gl_VertexID : gl_InstanceID];
+        if (p.poslife.w <= 0.) {
+            gl_Position = vec4(2., 2., 2., 1.);  // Outside of clip space
+            gl_PointSize = 0.;
+            return;
+        }
+
+        float age = 1. - p.poslife.w / p.velmax.w;
+        float s = mix(size, endsize, age);
+        colorOut = mix(color, endcolor, age);
+        gl_Position = MVP * vec4(p.poslife.xyz, 1.);
+        if (points) {
+            gl_PointSize = s * pointscale / gl_Position.w;
+            uvOut = vec2(0.5);
+        } else {
+            vec2 corner = vec2(gl_VertexID & 1, gl_VertexID >> 1);  // Triangle strip (0,0) (1,0) (0,1) (1,1)
+            gl_Position.xy += (corner - 0.5) * s * quadscale;
+            uvOut = corner;
+        }
+    }
+    """ % particlestruct
+
+    fragCode = """#version 450 core
+    layout (location = 0) in vec4 colorIn;
+    layout (location = 1) in vec2 uvIn;
+
+    uniform bool points;
+
+    layout (location = 0) out vec4 colorOut;
+    void main()
+    {
+        float d = length((points ? gl_PointCoord : uvIn) - 0.5) * 2.;
+        colorOut = vec4(colorIn.rgb, colorIn.a * smoothstep(1., 0.6, d));  // Soft round sprite
+    }
+    """
+
+    updateprogram = None
+    emitprogram = None
+    renderprogram = None
+
+    def __init__(self, capacity: int = 100000, points: bool = False, additive: bool = True):
+        super(ParticleSystem, self).__init__()
+        self.particlebuffer = self.freebuffer = self.vao = None  # For release() if compiling the programs fails
+
+        self.capacity: int = capacity
+        self.points: bool = points  # Draw points instead of quads
+        self.additive: bool = additive  # Additive blending, alpha blending otherwise
+        self.emitter: Emitter = Emitter()
+        self.aspect: float = 1.  # Width / height of the target, keeps quads square
+        self.pointscale: float = 500.  # Point size in pixels is size * pointscale / distance
+
+        self.accumulated: float = 0.  # Fractional particles not yet emitted
+        self.pending: int = 0  # Particles to emit on next simulate(), from burst()
+        self.seed: int = 0
+
+        self.params: ParameterStore = None
+        self.paramaddresses: Dict[str, str] = {}  # Emitter field -> OSC address
+
+        if ParticleSystem.updateprogram is None:
+            ParticleSystem.updateprogram = programcache.getprogram([(GL_COMPUTE_SHADER, ParticleSystem.updateCode)])
+            ParticleSystem.emitprogram = programcache.getprogram([(GL_COMPUTE_SHADER, ParticleSystem.emitCode)])
+            ParticleSystem.renderprogram = programcache.getprogram([(GL_VERTEX_SHADER, ParticleSystem.vertexCode),
+                                                                    (GL_FRAGMENT_SHADER, ParticleSystem.fragCode)])
+
+        self.particlebuffer = gpuresources.genbuffer(self.capacity * 8 * 4, "ParticleSystem particles")
+        self.freebuffer = gpuresources.genbuffer((self.capacity + 1) * 4, "ParticleSystem freelist")
+        self.vao = gpuresources.genvertexarray("ParticleSystem")  # Empty, everything is read from the storage buffer
+        self.reset()
+
+    def reset(self) -> None:
+        """Kill all particles"""
+        glstate.bindbuffer(GL_SHADER_STORAGE_BUFFER, self.particlebuffer)
+        glBufferData(GL_SHADER_STORAGE_BUFFER, np.zeros(self.capacity * 8, np.float32), GL_DYNAMIC_COPY)
+        freelist = np.arange(-1, self.capacity, dtype=np.int32)
+        freelist[0] = self.capacity  # freecount, followed by every index
+        glstate.bindbuffer(GL_SHADER_STORAGE_BUFFER, self.freebuffer)
+        glBufferData(GL_SHADER_STORAGE_BUFFER, freelist, GL_DYNAMIC_COPY)
+        self.accumulated = 0.
+        self.pending = 0
+
+    def bindparams(self, params: ParameterStore, prefix: str = "/particles") -> None:
+        """Register every emitter field as OSC parameter prefix/field, with the current values as defaults. Bound
+        fields are overwritten from the parameter store on every simulate()."""
+        self.params = params
+        for field, ptype in Emitter.fields.items():
+            address = "%s/%s" % (prefix, field)
+            params.register(address, ptype, default=getattr(self.emitter, field))
+            self.paramaddresses[field] = address
+
+    def burst(self, count: int) -> None:
+        """Emit count particles on the next simulate(), in addition to the emission rate"""
+        self.pending += count
+
+    def simulate(self, dt: float) -> None:
+        """Advance all particles by dt seconds and emit new ones"""
+        emitter = self.emitter
+        if self.params is not None:
+            for field, address in self.paramaddresses.items():
+                setattr(emitter, field, self.params[address])
+
+        glstate.bindbufferbase(GL_SHADER_STORAGE_BUFFER, 0, self.particlebuffer)
+        glstate.bindbufferbase(GL_SHADER_STORAGE_BUFFER, 1, self.freebuffer)
+
+        program = ParticleSystem.updateprogram
+        glstate.useprogram(program)
+        glUniform1f(glstate.uniformlocation(program, "dt"), dt)
+        glUniform1i(glstate.uniformlocation(program, "capacity"), self.capacity)
+        glUniform3f(glstate.uniformlocation(program, "gravity"), *emitter.gravity)
+        glUniform1f(glstate.uniformlocation(program, "drag"), emitter.drag)
+        glUniform3f(glstate.uniformlocation(program, "attractor"), *emitter.attractor)
+        glUniform1f(glstate.uniformlocation(program, "attraction"), emitter.attraction)
+        glDispatchCompute((self.capacity + WorkgroupSize - 1) // WorkgroupSize, 1, 1)
+        glMemoryBarrier(GL_SHADER_STORAGE_BARRIER_BIT)  # Emission pops what the update pushed
+
+        self.accumulated += max(emitter.rate, 0.) * dt
+        emitcount = min(int(self.accumulated) + self.pending, self.capacity)
+        self.accumulated -= int(self.accumulated)
+        self.pending = 0
+        if emitcount > 0:
+            self.seed = (self.seed + 1) & 0xFFFFFFFF
+            program = ParticleSystem.emitprogram
+            glstate.useprogram(program)
+            glUniform1i(glstate.uniformlocation(program, "emitcount"), emitcount)
+            glUniform1ui(glstate.uniformlocation(program, "seed"), self.seed)
+            glUniform3f(glstate.uniformlocation(program, "position"), *emitter.position)
+            glUniform1f(glstate.uniformlocation(program, "spread"), emitter.spread)
+            glUniform3f(glstate.uniformlocation(program, "velocity"), *emitter.velocity)
+            glUniform1f(glstate.uniformlocation(program, "velocityspread"), emitter.velocityspread)
+            glUniform1f(glstate.uniformlocation(program, "lifetime"), emitter.lifetime)
+            glUniform1f(glstate.uniformlocation(program, "lifetimespread"), emitter.lifetimespread)
+            glDispatchCompute((emitcount + WorkgroupSize - 1) // WorkgroupSize, 1, 1)
+        glMemoryBarrier(GL_SHADER_STORAGE_BARRIER_BIT)  # Rendering reads the particles
+
+    def alive(self) -> int:
+        """Number of live particles. Reads back from the GPU and stalls, meant for debugging and tests."""
+        glstate.bindbuffer(GL_SHADER_STORAGE_BUFFER, self.freebuffer)
+        freecount = np.frombuffer(glGetBufferSubData(GL_SHADER_STORAGE_BUFFER, 0, 4), np.int32)[0]
+        return self.capacity - int(freecount)
+
+    def render(self, viewProjMatrix):
+        emitter = self.emitter
+        program = ParticleSystem.renderprogram
+        glstate.useprogram(program)
+        glUniformMatrix4fv(glstate.uniformlocation(program, "MVP"), 1, GL_TRUE, viewProjMatrix * self.getModelMatrix())
+        glUniform1i(glstate.uniformlocation(program, "points"), self.points)
+        glUniform2f(glstate.uniformlocation(program, "quadscale"), 1. / self.aspect, 1.)
+        glUniform1f(glstate.uniformlocation(program, "pointscale"), self.pointscale)
+        glUniform1f(glstate.uniformlocation(program, "size"), emitter.size)
+        glUniform1f(glstate.uniformlocation(program, "endsize"), emitter.endsize)
+        glUniform4f(glstate.uniformlocation(program, "color"), *emitter.color)
+        glUniform4f(glstate.uniformlocation(program, "endcolor"), *emitter.endcolor)
+        glstate.bindbufferbase(GL_SHADER_STORAGE_BUFFER, 0, self.particlebuffer)
+
+        # Restored afterwards, the layer may render with its own blending
+        blend = glIsEnabled(GL_BLEND)
+        blendfunc = [int(glGetIntegerv(query)) for query in (GL_BLEND_SRC_RGB, GL_BLEND_DST_RGB,
+                                                             GL_BLEND_SRC_ALPHA, GL_BLEND_DST_ALPHA)]
+        depthmask = glGetBooleanv(GL_DEPTH_WRITEMASK)
+        pointsize = glIsEnabled(GL_PROGRAM_POINT_SIZE)
+
+        glEnable(GL_BLEND)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE if self.additive else GL_ONE_MINUS_SRC_ALPHA)
+        glDepthMask(GL_FALSE)  # Particles aren't sorted, don't let them occlude each other
+        glstate.bindvertexarray(self.vao)
+        if self.points:
+            glEnable(GL_PROGRAM_POINT_SIZE)
+            glDrawArrays(GL_POINTS, 0, self.capacity)
+            if not pointsize:
+                glDisable(GL_PROGRAM_POINT_SIZE)
+        else:
+            glDrawArraysInstanced(GL_TRIANGLE_STRIP, 0, 4, self.capacity)
+
+        glDepthMask(depthmask)
+        glBlendFuncSeparate(*blendfunc)
+        if not blend:
+            glDisable(GL_BLEND)
+
+    def release(self):
+        gpuresources.delete("buffer", self.particlebuffer)
+        gpuresources.delete("buffer", self.freebuffer)
+        gpuresources.delete("vertexarray", self.vao)
+        self.particlebuffer = self.freebuffer = self.vao = None
@@ -0,0 +1,167 @@
+"""Parallel startup
+
+Starting a program used to import and initialize one layer after the other, each one waiting for its files. The
+Preloader splits startup into phases:
+
+- warm: heavy third party modules (pythonosc, imageio, PIL) are imported on worker threads while the window is created
+- import: all layer modules are imported on worker threads
+- assets: files listed in the entry classes' assets attribute are decoded on worker threads into the asset cache, where
+  TextureFromImage and ModelObject pick them up instead of decoding again
+- init: entry classes are instantiated on the main thread (they need the GL context), shader programs created during
+  this phase are compiled as one batch, see PyreeEngine.shaders.ShaderBatch
+
+Every phase and every layer is timed and listed in the startup report.
+
+Layer modules are imported without a GL context, so they must not call GL at import time. A module that fails to
+import on a worker is simply imported again on the main thread, where errors are reported as usual."""
+
+from typing import Dict, List, Iterable, Any, Callable
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+from contextlib import contextmanager
+from pathlib import Path
+
+import importlib
+import sys
+import threading
+import time
+
+import numpy as np
+
+from PyreeEngine import log
+
+
+def decodeimage(path: Path) -> np.ndarray:
+    from imageio import imread  # Deferred, imageio takes long to import
+    return np.flipud(imread(path))
+
+
+def decodeobj(path: Path) -> np.ndarray:
+    from PyreeEngine.objloader import ObjLoader
+    verts = []
+    for group in ObjLoader(Path(path)).verts:
+        verts += group
+    return np.array(verts, np.float32)
+
+
+class AssetCache():
+    """Decoded files waiting to be uploaded, keyed by resolved path"""
+
+    decoders: Dict[str, Callable[[Path], Any]] = {".obj": decodeobj}  # Suffix -> decoder, images are the default
+
+    def __init__(self):
+        self.lock: threading.Lock = threading.Lock()
+        self.entries: Dict[Path, Any] = {}
+
+    def decode(self, path: Path) -> Any:
+        """Decode file and keep the result until it is taken, called on worker threads"""
+        path = Path(path).resolve()
+        data = self.decoders.get(path.suffix.lower(), decodeimage)(path)
+        with self.lock:
+            self.entries[path] = data
+        return data
+
+    def take(self, path: Path) -> Any:
+        """Remove and return preloaded data for path, None if it wasn't preloaded"""
+        with self.lock:
+            return self.entries.pop(Path(path).resolve(), None)
+
+    def clear(self) -> None:
+        """Drop everything that wasn't taken during startup"""
+        with self.lock:
+            self.entries = {}
+
+
+assetcache: AssetCache = AssetCache()
+
+
+class StartupReport():
+    def __init__(self):
+        self.starttime: float = time.perf_counter()
+        self.phases: "OrderedDict[str, float]" = OrderedDict()  # Phase -> seconds
+        self.layers: "OrderedDict[str, Dict[str, float]]" = OrderedDict()  # Layer -> phase -> seconds
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.) + time.perf_counter() - start
+
+    def addlayer(self, layer: str, phase: str, seconds: float) -> None:
+        phases = self.layers.setdefault(layer, {})
+        phases[phase] = phases.get(phase, 0.) + seconds
+
+    def report(self) -> None:
+        total = time.perf_counter() - self.starttime
+        log.info("STARTUP", "Started in %.0f ms: %s" % (total * 1000, ", ".join(
+            "%s %.0f ms" % (phase, seconds * 1000) for phase, seconds in self.phases.items())))
+        for layer, phases in sorted(self.layers.items(), key=lambda item: -sum(item[1].values())):
+            log.info("STARTUP", "  %-24s %7.1f ms (%s)" % (layer, sum(phases.values()) * 1000, ", ".join(
+                "%s %.1f" % (phase, seconds * 1000) for phase, seconds in phases.items())))
+
+
+class Preloader():
+    warmmodules: List[str] = ["pythonosc.dispatcher", "pythonosc.osc_packet", "pythonosc.osc_message_builder",
+                              "imageio", "PIL.Image"]
+
+    def __init__(self, threads: int = 4, report: StartupReport = None):
+        self.threads: int = threads
+        self.report: StartupReport = report if report is not None else StartupReport()
+        self.pool: ThreadPoolExecutor = ThreadPoolExecutor(max(1, threads), thread_name_prefix="pyree-preload") \
+            if threads > 0 else None
+        self.warming: List[Future] = []
+
+    def warm(self, modules: Iterable[str] = None) -> None:
+        """Start importing modules in the background, returns immediately"""
+        if self.pool is None:
+            return
+        for name in modules if modules is not None else self.warmmodules:
+            self.warming.append(self.pool.submit(self.tryimport, name))
+
+    @staticmethod
+    def tryimport(name: str) -> float:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except Exception:
+            pass  # Imported again on the main thread, which reports the error properly
+        return time.perf_counter() - start
+
+    def preload(self, layerconfigs: list) -> None:
+        """Import layer modules and decode their assets in parallel. layerconfigs are LayerConfigs of local layers."""
+        if self.pool is None:
+            return
+
+        with self.report.phase("import"):
+            futures = [(config, self.pool.submit(self.tryimport, config.module)) for config in layerconfigs]
+            for config, future in futures:
+                self.report.addlayer(config.name, "import", future.result())
+
+        with self.report.phase("assets"):
+            futures = []
+            for config in layerconfigs:
+                module = sys.modules.get(config.module)
+                entryclass = getattr(module, config.entryclass, None)
+                for path in getattr(entryclass, "assets", ()):
+                    futures.append((config, path, self.pool.submit(self.timeddecode, path)))
+            for config, path, future in futures:
+                try:
+                    self.report.addlayer(config.name, "assets", future.result())
+                except Exception as exc:
+                    log.warning("STARTUP", "Failed to preload %s for layer %s: %s" % (path, config.name, exc))
+
+    @staticmethod
+    def timeddecode(path: Path) -> float:
+        start = time.perf_counter()
+        assetcache.decode(path)
+        return time.perf_counter() - start
+
+    def finish(self) -> None:
+        if self.pool is not None:
+            for future in self.warming:
+                future.result()
+            self.pool.shutdown(wait=False)
+            self.pool = None
+        assetcache.clear()
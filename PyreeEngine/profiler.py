@@ -0,0 +1,125 @@
+"""Low overhead CPU frame profiler
+
+Scopes are timed with perf_counter_ns. Every scope keeps a rolling window of durations for percentiles. A number of
+frames can be captured and written as Chrome trace event JSON, which can be opened in Perfetto or chrome://tracing.
+
+When disabled, scope() returns a shared no-op context manager, so instrumented code only pays for one method call."""
+
+from typing import List, Dict, Union
+from pathlib import Path
+
+import json
+import os
+import threading
+import time
+
+from PyreeEngine import log
+from PyreeEngine.stats import RollingStats
+
+
+class ScopeStats(RollingStats):
+    """Rolling durations of a single scope, in milliseconds"""
+
+
+class NullScope():
+    """Shared no-op scope returned while the profiler is disabled"""
+    __slots__ = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+class ProfilerScope():
+    __slots__ = ["profiler", "name", "start"]
+
+    def __init__(self, profiler: "Profiler", name: str):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.profiler.record(self.name, self.start, time.perf_counter_ns())
+        return False
+
+
+class Profiler():
+    def __init__(self, window: int = 300):
+        self.enabled: bool = False
+        self.window: int = window
+        self.stats: Dict[str, ScopeStats] = {}
+
+        self.nullscope: NullScope = NullScope()
+
+        # Trace capture
+        self.captureframes: int = 0  # Frames left to capture
+        self.capturepath: Path = None
+        self.enabledbeforecapture: bool = False
+        self.events: List[dict] = []
+        self.framestart: int = None
+        self.pid: int = os.getpid()
+
+    def scope(self, name: str) -> Union[ProfilerScope, NullScope]:
+        """Context manager timing the with block as scope name
+
+        While disabled the shared NullScope is returned, so call sites need no enabled check of their own."""
+        if not self.enabled:
+            return self.nullscope
+        return ProfilerScope(self, name)
+
+    def record(self, name: str, start: int, end: int) -> None:
+        """Add a measured duration, start and end in perf_counter_ns"""
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = ScopeStats(self.window)
+        stats.add((end - start) / 1e6)
+
+        if self.captureframes > 0:
+            self.events.append({"name": name, "ph": "X", "ts": start / 1000, "dur": (end - start) / 1000,
+                                "pid": self.pid, "tid": threading.get_ident()})
+
+    def beginframe(self) -> None:
+        if self.enabled:
+            self.framestart = time.perf_counter_ns()
+
+    def endframe(self) -> None:
+        if not self.enabled or self.framestart is None:
+            return
+        self.record("frame", self.framestart, time.perf_counter_ns())
+
+        if self.captureframes > 0:
+            self.captureframes -= 1
+            if self.captureframes == 0:
+                self.writetrace()
+                self.enabled = self.enabledbeforecapture
+
+    def capture(self, frames: int, path: Path) -> None:
+        """Record the next frames and write them to path as Chrome trace event JSON"""
+        if self.captureframes == 0:
+            self.enabledbeforecapture = self.enabled
+        self.enabled = True
+        self.events = []
+        self.captureframes = frames
+        self.capturepath = Path(path)
+
+    def writetrace(self) -> None:
+        try:
+            with self.capturepath.open("w") as f:
+                json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+            log.success("PROFILER", "Wrote trace of %i events to %s" % (len(self.events), self.capturepath))
+        except OSError as exc:
+            log.error("PROFILER", "Failed to write trace %s: %s" % (self.capturepath, exc))
+        self.events = []
+
+    def report(self) -> None:
+        """Log percentiles of all scopes"""
+        for name in sorted(self.stats):
+            stats = self.stats[name]
+            log.info("PROFILER", "%s: p50 %.2f ms, p95 %.2f ms, p99 %.2f ms, max %.2f ms" % (
+                name, stats.p50, stats.p95, stats.p99, stats.max))
@@ -0,0 +1,182 @@
+"""Batched quad renderer
+
+A QuadBatch draws any number of textured, tinted and rotated quads with a single instanced draw call. Quads are
+appended to a NumPy staging array, either one at a time with add() or vectorized with addmany(), and copied into a
+persistently mapped StreamingBuffer once per frame. The quad corners are generated in the vertex shader, so the only
+data per quad is one 64 byte instance record. Images come from a TextureArray, each quad picks its layer and the
+rectangle within it."""
+
+from typing import Tuple, Union
+
+from OpenGL.GL import *
+
+import numpy as np
+import ctypes
+
+from PyreeEngine.engine import GeometryObject
+from PyreeEngine.buffers import StreamingBuffer
+from PyreeEngine.shadercache import programcache
+from PyreeEngine.textures import TextureArray
+from PyreeEngine.glstate import glstate
+from PyreeEngine.gpuresources import gpuresources, GPUObject
+
+InstanceFloats = 16  # x y z, width height rotation, u0 v0 u1 v1, r g b a, layer, padding
+
+
+class QuadBatch(GeometryObject, GPUObject):
+    vertexCode = """#version 450 core
+    layout (location = 0) in vec3 posIn;
+    layout (location = 1) in vec3 sizeRotIn;
+    layout (location = 2) in vec4 uvRectIn;
+    layout (location = 3) in vec4 colorIn;
+    layout (location = 4) in float layerIn;
+
+    layout (location = 0) out vec3 uvOut;
+    layout (location = 1) out vec4 colorOut;
+
+    uniform mat4 MVP;
+
+    void main()
+    {
+        vec2 corner = vec2(gl_VertexID & 1, gl_VertexID >> 1);  // Triangle strip (0,0) (1,0) (0,1) (1,1)
+        vec2 offset = (corner - 0.5) * sizeRotIn.xy;
+        float s = sin(sizeRotIn.z);
+        float c = cos(sizeRotIn.z);
+        offset = vec2(c * offset.x - s * offset.y, s * offset.x + c * offset.y);
+
+        gl_Position = MVP * vec4(posIn.xy + offset, posIn.z, 1);
+        uvOut = vec3(mix(uvRectIn.xy, uvRectIn.zw, corner), layerIn);
+        colorOut = colorIn;
+    }
+    """
+
+    fragCode = """#version 450 core
+    layout (location = 0) in vec3 uvIn;
+    layout (location = 1) in vec4 colorIn;
+
+    layout (binding = 0) uniform sampler2DArray tex;
+    uniform bool textured;
+
+    layout (location = 0) out vec4 colorOut;
+    void main()
+    {
+        colorOut = textured ? texture(tex, uvIn) * colorIn : colorIn;
+    }
+    """
+
+    program = None
+    texturedloc: int = None
+
+    def __init__(self, capacity: int = 1024, texture: TextureArray = None, blend: bool = True, segments: int = 3):
+        super(QuadBatch, self).__init__()
+        self.vao = None
+        self.stream: StreamingBuffer = None
+
+        self.texture: TextureArray = texture
+        self.blend: bool = blend  # Alpha blending while drawing
+        self.segments: int = segments
+
+        self.instances: np.ndarray = np.zeros((capacity, InstanceFloats), np.float32)  # Staging array
+        self.count: int = 0
+
+        if QuadBatch.program is None:
+            QuadBatch.program = programcache.getprogram([(GL_VERTEX_SHADER, QuadBatch.vertexCode),
+                                                         (GL_FRAGMENT_SHADER, QuadBatch.fragCode)])
+            QuadBatch.texturedloc = glGetUniformLocation(QuadBatch.program, "textured")
+
+        self.createbuffers(capacity)
+
+    @property
+    def capacity(self) -> int:
+        return self.instances.shape[0]
+
+    def createbuffers(self, capacity: int) -> None:
+        """(Re)create instance buffer for capacity quads and point the vertex array at it"""
+        if self.stream is not None:
+            self.stream.release()
+        self.streamcapacity: int = capacity
+        self.stream = StreamingBuffer(capacity * InstanceFloats * 4, self.segments)
+
+        if self.vao is None:
+            self.vao = gpuresources.genvertexarray("QuadBatch")
+        glstate.bindvertexarray(self.vao)
+        glstate.bindbuffer(GL_ARRAY_BUFFER, self.stream.buffer)
+        stride = InstanceFloats * 4
+        for location, size, offset in ((0, 3, 0), (1, 3, 3), (2, 4, 6), (3, 4, 10), (4, 1, 14)):
+            glVertexAttribPointer(location, size, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(offset * 4))
+            glVertexAttribDivisor(location, 1)
+            glEnableVertexAttribArray(location)
+        glstate.bindvertexarray(0)
+
+    def reserve(self, count: int) -> None:
+        if count > self.capacity:
+            newcapacity = max(count, self.capacity * 2)
+            instances = np.zeros((newcapacity, InstanceFloats), np.float32)
+            instances[:self.count] = self.instances[:self.count]
+            self.instances = instances
+
+    def clear(self) -> None:
+        """Remove all quads, usually called at the start of a frame"""
+        self.count = 0
+
+    def add(self, x: float, y: float, width: float, height: float, rotation: float = 0.,
+            uvrect: Tuple[float, float, float, float] = (0., 0., 1., 1.),
+            color: Tuple[float, float, float, float] = (1., 1., 1., 1.), layer: int = 0, z: float = 0.) -> None:
+        """Append one quad centered on x, y. rotation is in radians, uvrect is (u0, v0, u1, v1)."""
+        if self.count >= self.capacity:
+            self.reserve(self.count + 1)
+        self.instances[self.count, :15] = (x, y, z, width, height, rotation, *uvrect, *color, layer)
+        self.count += 1
+
+    def addmany(self, positions: np.ndarray, sizes: Union[np.ndarray, Tuple[float, float]],
+                rotations: Union[np.ndarray, float] = 0., uvrects: Union[np.ndarray, Tuple] = (0., 0., 1., 1.),
+                colors: Union[np.ndarray, Tuple] = (1., 1., 1., 1.), layers: Union[np.ndarray, int] = 0,
+                z: float = 0.) -> None:
+        """Append quads from arrays with one row per quad. positions is (n, 2) or (n, 3), every other argument is
+        either an array with n rows or a single value used for all quads."""
+        positions = np.asarray(positions, np.float32)
+        count = len(positions)
+        self.reserve(self.count + count)
+        rows = self.instances[self.count:self.count + count]
+        rows[:, 0:2] = positions[:, :2]
+        rows[:, 2] = positions[:, 2] if positions.shape[1] > 2 else z
+        rows[:, 3:5] = sizes
+        rows[:, 5] = rotations
+        rows[:, 6:10] = uvrects
+        rows[:, 10:14] = colors
+        rows[:, 14] = layers
+        self.count += count
+
+    def render(self, viewProjMatrix):
+        if self.count == 0:
+            return
+        if self.capacity > self.streamcapacity:
+            self.createbuffers(self.capacity)
+
+        segment = self.stream.acquire(np.float32).reshape((self.streamcapacity, InstanceFloats))
+        segment[:self.count] = self.instances[:self.count]
+
+        glstate.useprogram(QuadBatch.program)
+        uniformLoc = glstate.uniformlocation(QuadBatch.program, "MVP")
+        glUniformMatrix4fv(uniformLoc, 1, GL_TRUE, viewProjMatrix * self.getModelMatrix())
+        glUniform1i(QuadBatch.texturedloc, self.texture is not None)
+        if self.texture is not None:
+            glstate.bindtexture(GL_TEXTURE_2D_ARRAY, self.texture.getTexture(), GL_TEXTURE0)
+
+        if self.blend:
+            glEnable(GL_BLEND)
+            glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+
+        glstate.bindvertexarray(self.vao)
+        glDrawArraysInstancedBaseInstance(GL_TRIANGLE_STRIP, 0, 4, self.count, self.stream.current * self.streamcapacity)
+        self.stream.fence()
+
+        if self.blend:
+            glDisable(GL_BLEND)
+
+    def release(self):
+        if self.stream is not None:
+            self.stream.release()
+            self.stream = None
+        gpuresources.delete("vertexarray", self.vao)
+        self.vao = None
@@ -0,0 +1,186 @@
+"""Persistent on-disk cache for linked shader program binaries
+
+Programs are keyed by a hash of all stage sources, the defines they were built with and the driver strings, so a
+driver update or a source change simply results in a cache miss."""
+
+from typing import List, Tuple, Dict, Optional
+
+from OpenGL.GL import *
+from OpenGL.GL import shaders
+from OpenGL.error import GLError
+
+import numpy as np
+
+import hashlib
+import struct
+import time
+
+from pathlib import Path
+
+from PyreeEngine.gpuresources import gpuresources
+from PyreeEngine import log
+
+
+class ProgramCache():
+    """Compiles and links shader programs, storing the resulting binaries on disk for faster subsequent startups"""
+
+    def __init__(self, cachedir: Path = Path(".pyreecache") / "programs"):
+        self.cachedir: Path = cachedir
+        self.enabled: bool = True
+
+        self.driverstring: bytes = None  # Queried lazily, requires a current context
+        self.binarysupport: bool = None
+
+        # Statistics
+        self.hits: int = 0
+        self.misses: int = 0
+        self.rejected: int = 0  # Binaries the driver refused to load
+        self.loadtime: float = 0.  # Seconds spent loading binaries
+        self.compiletime: float = 0.  # Seconds spent compiling and linking from source
+
+    def querydriver(self) -> None:
+        """Fetch driver strings and check if program binaries are supported at all"""
+        self.driverstring = b"|".join([glGetString(GL_VENDOR) or b"",
+                                       glGetString(GL_RENDERER) or b"",
+                                       glGetString(GL_VERSION) or b""])
+        self.binarysupport = glGetIntegerv(GL_NUM_PROGRAM_BINARY_FORMATS) > 0
+        if not self.binarysupport:
+            log.warning("SHADERCACHE", "Driver supports no program binary formats, cache disabled")
+
+    def key(self, stages: List[Tuple[int, str]], defines: Dict[str, str] = None) -> str:
+        """Hash of driver, stage sources and defines"""
+        keyhash = hashlib.sha256(self.driverstring)
+        for stagetype, source in stages:
+            keyhash.update(b"\0stage%d\0" % int(stagetype))
+            keyhash.update(source.encode("utf-8"))
+        if defines:
+            for name in sorted(defines):
+                keyhash.update(("\0define %s %s" % (name, defines[name])).encode("utf-8"))
+        return keyhash.hexdigest()
+
+    def getprogram(self, stages: List[Tuple[int, str]], defines: Dict[str, str] = None) -> shaders.ShaderProgram:
+        """Return a linked program for stages, a list of (shader type, source) tuples
+
+        Loads the program binary from disk if available, and compiles from source otherwise. The program is meant to be
+        shared, e.g. as class attribute, so it is attributed to the engine rather than the layer that happened to
+        request it first. Raises the usual PyOpenGL ShaderCompilationError/ShaderLinkError on failure."""
+        with gpuresources.ownedby("engine"):
+            program = self.lookup(stages, defines)
+            if program is not None:
+                return program
+
+            program = self.compile(stages, retrievable=self.usable())
+        self.store(program, stages, defines)
+
+        return program
+
+    def usable(self) -> bool:
+        """Cache is enabled and the driver supports program binaries"""
+        if self.driverstring is None:
+            self.querydriver()
+        return self.enabled and self.binarysupport
+
+    def cachepath(self, stages: List[Tuple[int, str]], defines: Dict[str, str] = None) -> Path:
+        return self.cachedir / ("%s.bin" % self.key(stages, defines))
+
+    def lookup(self, stages: List[Tuple[int, str]], defines: Dict[str, str] = None) -> Optional[shaders.ShaderProgram]:
+        """Return the cached program for stages, or None on a miss"""
+        if not self.usable():
+            return None
+
+        program = self.loadbinary(self.cachepath(stages, defines))
+        if program is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return program
+
+    def store(self, program: int, stages: List[Tuple[int, str]], defines: Dict[str, str] = None) -> None:
+        """Write binary of a program linked with GL_PROGRAM_BINARY_RETRIEVABLE_HINT to the cache"""
+        if self.usable():
+            self.storebinary(program, self.cachepath(stages, defines))
+
+    def loadbinary(self, cachepath: Path) -> Optional[shaders.ShaderProgram]:
+        """Try to create program from cached binary, returns None if missing or rejected by the driver"""
+        if not cachepath.exists():
+            return None
+
+        starttime = time.perf_counter()
+        try:
+            with cachepath.open("rb") as f:
+                binaryformat, = struct.unpack("<I", f.read(4))
+                binary = np.frombuffer(f.read(), np.uint8)
+        except (OSError, struct.error):
+            return None
+
+        program = gpuresources.createprogram(cachepath.stem[:12])
+        try:
+            glProgramBinary(program, binaryformat, binary, binary.nbytes)
+            linked = glGetProgramiv(program, GL_LINK_STATUS) == GL_TRUE
+        except GLError:
+            linked = False  # GL_INVALID_ENUM if the driver dropped support for binaryformat
+        if not linked:
+            # Binary is stale (e.g. driver update with same strings), drop it and recompile
+            gpuresources.delete("program", program)
+            self.rejected += 1
+            try:
+                cachepath.unlink()
+            except OSError:
+                pass
+            return None
+
+        self.loadtime += time.perf_counter() - starttime
+        return shaders.ShaderProgram(program)
+
+    def storebinary(self, program: int, cachepath: Path) -> None:
+        length = glGetProgramiv(program, GL_PROGRAM_BINARY_LENGTH)
+        if length <= 0:
+            return
+
+        binary = np.zeros(length, np.uint8)
+        binaryformat = np.zeros(1, np.uint32)
+        outlength = np.zeros(1, np.int32)
+        glGetProgramBinary(program, length, outlength, binaryformat, binary)
+
+        try:
+            self.cachedir.mkdir(parents=True, exist_ok=True)
+            tmppath = cachepath.with_suffix(".tmp")
+            with tmppath.open("wb") as f:
+                f.write(struct.pack("<I", int(binaryformat[0])))
+                f.write(binary[:int(outlength[0])].tobytes())
+            tmppath.replace(cachepath)  # Atomic, so a crash never leaves half-written binaries behind
+        except OSError as exc:
+            log.warning("SHADERCACHE", "Failed to write program binary %s: %s" % (cachepath, exc))
+
+    def compile(self, stages: List[Tuple[int, str]], retrievable: bool = False) -> shaders.ShaderProgram:
+        """Compile and link program from source"""
+        starttime = time.perf_counter()
+
+        shaderobjects = [shaders.compileShader(source, stagetype) for stagetype, source in stages]
+
+        program = gpuresources.createprogram()
+        if retrievable:
+            glProgramParameteri(program, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
+        for shader in shaderobjects:
+            glAttachShader(program, shader)
+        glLinkProgram(program)
+
+        for shader in shaderobjects:
+            glDetachShader(program, shader)
+            glDeleteShader(shader)
+
+        if glGetProgramiv(program, GL_LINK_STATUS) != GL_TRUE:
+            info = glGetProgramInfoLog(program)
+            gpuresources.delete("program", program)
+            raise shaders.ShaderLinkError("Link failure: %s" % info)
+
+        self.compiletime += time.perf_counter() - starttime
+        return shaders.ShaderProgram(program)
+
+    def report(self) -> None:
+        """Log hit/miss and timing statistics"""
+        log.info("SHADERCACHE", "%i hits, %i misses, %i rejected | load %.1f ms, compile %.1f ms" % (
+            self.hits, self.misses, self.rejected, self.loadtime * 1000, self.compiletime * 1000))
+
+
+programcache: ProgramCache = ProgramCache()  # Shared cache used by all shader classes
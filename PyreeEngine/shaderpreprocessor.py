@@ -0,0 +1,91 @@
+"""GLSL preprocessor resolving #include directives and injecting #defines
+
+Shared GLSL code (noise, SDF libraries, color spaces) can be kept in separate files and pulled in with
+`#include "noise.glsl"`. Includes are resolved relative to the including file first, then along the include paths.
+Every file is included at most once per stage, so include guards are not needed."""
+
+from typing import List, Dict, Any, Set, NamedTuple, Union
+
+from pathlib import Path
+
+import hashlib
+import re
+
+
+class ShaderIncludeError(RuntimeError):
+    """Include could not be resolved"""
+    pass
+
+
+class PreprocessedSource(NamedTuple):
+    source: str  # Final source with includes resolved and defines injected
+    files: List[Path]  # All files that were read, root file first. Index in list is the #line source string number.
+    contenthash: bytes  # Hash of raw file contents, independent of defines
+
+
+class ShaderPreprocessor():
+    includeregex = re.compile(r'^\s*#\s*include\s*[<"]([^>"]+)[>"]')
+    versionregex = re.compile(r'^\s*#\s*version\b')
+
+    def __init__(self, includepaths: List[Path] = None):
+        self.includepaths: List[Path] = includepaths if includepaths is not None else []
+
+    def process(self, path: Path, defines: Dict[str, Any] = None) -> PreprocessedSource:
+        """Read shader file at path and resolve all includes"""
+        files: List[Path] = []
+        contenthash = hashlib.sha1()
+        lines = self.processfile(path.resolve(), files, set(), contenthash)
+
+        # Defines have to go after #version, which must be the first statement of a shader
+        versionline = 0
+        for i, line in enumerate(lines):
+            if self.versionregex.match(line):
+                versionline = i + 1
+                break
+        if defines:
+            definelines = ["#define %s %s" % (name, self.formatvalue(value)) for name, value in sorted(defines.items())]
+            definelines.append("#line %i 0" % (versionline + 1))  # Assumes no include precedes #version
+            lines[versionline:versionline] = definelines
+
+        return PreprocessedSource(source="\n".join(lines) + "\n", files=files, contenthash=contenthash.digest())
+
+    def processfile(self, path: Path, files: List[Path], included: Set[Path], contenthash) -> List[str]:
+        included.add(path)
+        files.append(path)
+        fileindex = len(files) - 1
+
+        with path.open() as f:
+            content = f.read()
+        contenthash.update(str(path).encode("utf-8"))
+        contenthash.update(content.encode("utf-8"))
+
+        lines = []
+        if fileindex > 0:
+            lines.append("#line 1 %i" % fileindex)
+        for linenumber, line in enumerate(content.splitlines(), start=1):
+            match = self.includeregex.match(line)
+            if match is None:
+                lines.append(line)
+                continue
+
+            includepath = self.resolve(match.group(1), path)
+            if includepath in included:
+                lines.append("")  # Keep line numbers intact
+                continue
+            lines += self.processfile(includepath, files, included, contenthash)
+            lines.append("#line %i %i" % (linenumber + 1, fileindex))  # Continue numbering of this file
+
+        return lines
+
+    def resolve(self, name: str, includingfile: Path) -> Path:
+        for directory in [includingfile.parent] + self.includepaths:
+            candidate = Path(directory) / name
+            if candidate.exists():
+                return candidate.resolve()
+        raise ShaderIncludeError("Can't resolve #include \"%s\" in %s" % (name, includingfile))
+
+    @staticmethod
+    def formatvalue(value: Union[bool, int, float, str]) -> str:
+        if isinstance(value, bool):
+            return "1" if value else "0"
+        return str(value)
@@ -3,12 +3,27 @@
 from OpenGL.GL import *
 from OpenGL.GL import shaders
 
+from OpenGL.GL.KHR.parallel_shader_compile import GL_COMPLETION_STATUS_KHR, glMaxShaderCompilerThreadsKHR
+from OpenGL.GL.ARB.parallel_shader_compile import glMaxShaderCompilerThreadsARB
+from OpenGL.raw.GL.VERSION.GL_2_0 import glGetProgramiv as rawglGetProgramiv
+
 import traceback, sys
+import hashlib
+import time
+
+from typing import List, Tuple, Dict, Any, Set
 
 from pathlib import Path
 
 import inotify_simple
 
+from PyreeEngine.shadercache import programcache
+from PyreeEngine.shaderpreprocessor import ShaderPreprocessor
+from PyreeEngine.filewatch import filewatchservice, Subscription
+from PyreeEngine.glstate import glstate
+from PyreeEngine.gpuresources import gpuresources, GPUObject
+from PyreeEngine import log
+
 
 class Shader():
     def __init__(self):
@@ -51,15 +66,12 @@ class DebugShader(Shader):
     }
     """
 
-    vertShader = None
-    fragShader = None
     program = None
 
     def getshaderprogram(self):
         if DebugShader.program is None:
-            DebugShader.vertShader = shaders.compileShader(DebugShader.vertexCode, GL_VERTEX_SHADER)
-            DebugShader.fragShader = shaders.compileShader(DebugShader.fragCode, GL_FRAGMENT_SHADER)
-            DebugShader.program = shaders.compileProgram(DebugShader.vertShader, DebugShader.fragShader)
+            DebugShader.program = programcache.getprogram([(GL_VERTEX_SHADER, DebugShader.vertexCode),
+                                                           (GL_FRAGMENT_SHADER, DebugShader.fragCode)])
 
         return DebugShader.program
 
@@ -99,93 +111,328 @@ class FullscreenTexture(Shader):
         }
         """
 
-    vertShader = None
-    fragShader = None
     program = None
 
     def getshaderprogram(self):
         if FullscreenTexture.program is None:
-            FullscreenTexture.vertShader = shaders.compileShader(FullscreenTexture.vertexCode, GL_VERTEX_SHADER)
-            FullscreenTexture.fragShader = shaders.compileShader(FullscreenTexture.fragCode, GL_FRAGMENT_SHADER)
-            FullscreenTexture.program = shaders.compileProgram(FullscreenTexture.vertShader, FullscreenTexture.fragShader)
+            FullscreenTexture.program = programcache.getprogram([(GL_VERTEX_SHADER, FullscreenTexture.vertexCode),
+                                                                 (GL_FRAGMENT_SHADER, FullscreenTexture.fragCode)])
 
         return FullscreenTexture.program
 
-class HotloadingShader(Shader):
-    def __init__(self, vertexpath: Path, fragmentpath: Path, geometrypath: Path = None):
-        super(HotloadingShader, self).__init__()
-        self.shaderprogram = DebugShader().getshaderprogram()  # Have default shader program
-        self.vertShader = None
-        self.fragShader = None
-        self.geomShader = None
+def parallelcompilesupported() -> bool:
+    """Check for KHR/ARB_parallel_shader_compile and let the driver use as many compiler threads as it likes"""
+    global _parallelcompile
+    if _parallelcompile is None:
+        extensions = [glGetStringi(GL_EXTENSIONS, i) for i in range(glGetIntegerv(GL_NUM_EXTENSIONS))]
+        if b"GL_KHR_parallel_shader_compile" in extensions:
+            glMaxShaderCompilerThreadsKHR(0xFFFFFFFF)
+            _parallelcompile = True
+        elif b"GL_ARB_parallel_shader_compile" in extensions:
+            glMaxShaderCompilerThreadsARB(0xFFFFFFFF)  # Same enum values as the KHR version
+            _parallelcompile = True
+        else:
+            _parallelcompile = False
+    return _parallelcompile
+
+
+_parallelcompile: bool = None
+
+
+def programcompletionstatus(program: int) -> bool:
+    """The glGetProgramiv wrapper of PyOpenGL 3.1.10 has no output size registered for GL_COMPLETION_STATUS_KHR and
+    raises KeyError, so query through the raw entry point. glGetShaderiv handles it fine."""
+    status = GLint(0)
+    rawglGetProgramiv(program, GL_COMPLETION_STATUS_KHR, status)
+    return bool(status.value)
+
+
+class ProgramBuild():
+    """Compiles and links a program without blocking the frame
+
+    Stages that are already compiled can be passed in and are reused. With parallel shader compile support the build
+    progresses in the background and poll() only queries completion status. Without it, poll() compiles synchronously."""
+
+    def __init__(self, stages: List[Tuple[int, str]], reuse: Dict[int, int] = None, defines: Dict[str, Any] = None):
+        self.stages: List[Tuple[int, str]] = stages
+        self.defines: Dict[str, Any] = defines
+        self.shaderobjects: Dict[int, int] = {}  # Stage type -> shader object
+        self.newshaders: List[int] = []  # Shader objects compiled by this build (owned until success)
+        self.program: int = None
+        self.linking: bool = False
+        self.done: bool = False
+        self.error: str = None
+        self.starttime: float = time.perf_counter()
+
+        self.parallel = parallelcompilesupported()
+
+        for stagetype, source in stages:
+            if reuse is not None and stagetype in reuse:
+                self.shaderobjects[stagetype] = reuse[stagetype]
+                continue
+            shader = gpuresources.createshader(stagetype)
+            glShaderSource(shader, source)
+            glCompileShader(shader)
+            self.shaderobjects[stagetype] = shader
+            self.newshaders.append(shader)
+
+    def poll(self) -> bool:
+        """Advance the build, returns True once it finished (successfully or not)"""
+        if self.done:
+            return True
+
+        if not self.linking:
+            if self.parallel and not all(glGetShaderiv(shader, GL_COMPLETION_STATUS_KHR) for shader in self.newshaders):
+                return False
+            for shader in self.newshaders:
+                if glGetShaderiv(shader, GL_COMPILE_STATUS) != GL_TRUE:
+                    self.fail("Shader compile failure: %s" % glGetShaderInfoLog(shader))
+                    return True
+
+            self.program = gpuresources.createprogram()
+            if programcache.usable():
+                glProgramParameteri(self.program, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
+            for shader in self.shaderobjects.values():
+                glAttachShader(self.program, shader)
+            glLinkProgram(self.program)
+            self.linking = True
+
+        if self.parallel and not programcompletionstatus(self.program):
+            return False
+
+        for shader in self.shaderobjects.values():
+            glDetachShader(self.program, shader)
+
+        if glGetProgramiv(self.program, GL_LINK_STATUS) != GL_TRUE:
+            self.fail("Link failure: %s" % glGetProgramInfoLog(self.program))
+            return True
+
+        programcache.compiletime += time.perf_counter() - self.starttime
+        programcache.store(self.program, self.stages, self.defines)
+        self.program = shaders.ShaderProgram(self.program)
+        self.done = True
+        return True
+
+    def wait(self) -> None:
+        """Block until the build is finished"""
+        self.parallel = False  # Status queries block anyway
+        self.poll()
+
+    def fail(self, error: str) -> None:
+        self.error = error
+        self.done = True
+        self.cancel()
+
+    def cancel(self) -> None:
+        """Free everything this build created"""
+        for shader in self.newshaders:
+            gpuresources.delete("shader", shader)
+        self.newshaders = []
+        gpuresources.delete("program", self.program)
+        self.program = None
+
+
+class ShaderBatch():
+    """Context manager: HotloadingShaders created inside don't wait for their program, all builds are finished together
+    on exit. With parallel shader compile the driver works on all of them at once."""
+
+    active: "ShaderBatch" = None
+
+    def __init__(self):
+        self.shaders: List["HotloadingShader"] = []
+        self.previous: ShaderBatch = None
 
-        fl = inotify_simple.flags.CREATE | inotify_simple.flags.MODIFY | inotify_simple.flags.MOVED_TO
-        self.inotify = inotify_simple.INotify()
+    def __enter__(self) -> "ShaderBatch":
+        self.previous = ShaderBatch.active
+        ShaderBatch.active = self
+        return self
 
-        self.vertexPath = vertexpath
-        self.vertWatch = self.inotify.add_watch(self.vertexPath.parent, fl)
+    def __exit__(self, exctype, excvalue, tb) -> None:
+        ShaderBatch.active = self.previous
+        for shader in self.shaders:
+            if shader.pendingbuild is not None:
+                shader.pendingbuild.wait()
+                shader.pollbuild()
+        self.shaders = []
 
-        self.fragmentPath = fragmentpath
-        self.fragWatch = self.inotify.add_watch(self.fragmentPath.parent, fl)
 
+class HotloadingShader(Shader, GPUObject):
+    """Shader program built from files that is rebuilt when the files change
+
+    Sources are run through the ShaderPreprocessor, so a change to an included file rebuilds every program that
+    includes it. All file events of one frame are coalesced, only stages whose source content changed are recompiled,
+    and the new program is built in the background and swapped in once linking succeeded.
+
+    Variants built with different defines are kept around, so switching back to one with setdefines() is a lookup.
+    Replaced programs that aren't kept as variant are deleted, release() deletes all of them."""
+
+    def __init__(self, vertexpath: Path, fragmentpath: Path, geometrypath: Path = None, defines: Dict[str, Any] = None,
+                 includepaths: List[Path] = None):
+        super(HotloadingShader, self).__init__()
+
+        self.vertexPath = vertexpath
+        self.fragmentPath = fragmentpath
         self.geometryPath = geometrypath
-        if geometrypath is not None:
-            self.geomWatch = self.inotify.add_watch(self.geometryPath.parent, fl)
 
-        self.regenShader()
+        self.defines: Dict[str, Any] = defines if defines is not None else {}
+        self.preprocessor: ShaderPreprocessor = ShaderPreprocessor(includepaths)
 
-    def regenShader(self):
-        try:
-            if self.vertexPath.exists():
-                with self.vertexPath.open() as f:
-                    try:
-                        self.vertShader = shaders.compileShader(f.read(), GL_VERTEX_SHADER)
-                    except:
-                        print(f"ERROR COMPILING VERT SHADER: {self.vertexPath.absolute()}", file=sys.stderr)
-                        raise
-            else:
-                print("HOTLOADSHADER ERROR: vertex file doesn't exist")
-                return
-            if self.fragmentPath.exists():
-                with self.fragmentPath.open() as f:
-                    try:
-                        self.fragShader = shaders.compileShader(f.read(), GL_FRAGMENT_SHADER)
-                    except:
-                        print(f"ERROR COMPILING FRAG SHADER: {self.fragmentPath.absolute()}", file=sys.stderr)
-                        raise
-            else:
-                print("HOTLOADSHADER ERROR: fragment file doesn't exist")
-                return
+        self.stagehashes: Dict[int, bytes] = {}  # Source hashes of the current program
+        self.stageobjects: Dict[int, int] = {}  # Compiled shaders of the current program, reused on partial rebuilds
+        self.pendingbuild: ProgramBuild = None
+        self.pendinghashes: Dict[int, bytes] = None
+        self.pendingkey: Tuple = None
+
+        self.sourcehash: bytes = None  # Hash of all raw files the program was built from, independent of defines
+        self.variants: Dict[Tuple, Tuple[int, Dict[int, bytes]]] = {}  # (sourcehash, defines) -> (program, hashes)
+
+        self.filewatches: Dict[Path, Subscription] = {}  # Every file that went into the program, including includes
+        self.filechanged: bool = False
 
-            if self.geometryPath is not None:
-                if self.geometryPath.exists():
-                    with self.geometryPath.open() as f:
-                        try:
-                            self.vertShader = shaders.compileShader(f.read(), GL_FRAGMENT_SHADER)
-                        except:
-                            print(f"ERROR COMPILING GEOM SHADER: {self.geometryPath.absolute()}", file=sys.stderr)
-                            raise
-                else:
-                    print("HOTLOADSHADER ERROR: geometry file doesn't exist")
+        self.shaderprogram = DebugShader().getshaderprogram()  # Have default shader program
+        self.updatewatches(set(path.resolve() for path, stagetype, stagename in self.stagepaths()))
+
+        if ShaderBatch.active is not None:
+            ShaderBatch.active.shaders.append(self)
+            self.regenShader()
+        else:
+            self.regenShader(block=True)
+
+    def stagepaths(self) -> List[Tuple[Path, int, str]]:
+        stagepaths = [(self.vertexPath, GL_VERTEX_SHADER, "vertex"),
+                      (self.fragmentPath, GL_FRAGMENT_SHADER, "fragment")]
+        if self.geometryPath is not None:
+            stagepaths.append((self.geometryPath, GL_GEOMETRY_SHADER, "geometry"))
+        return stagepaths
+
+    def updatewatches(self, dependencies: Set[Path]) -> None:
+        for path in set(self.filewatches) - dependencies:
+            filewatchservice.unsubscribe(self.filewatches.pop(path))
+        for path in dependencies - set(self.filewatches):
+            self.filewatches[path] = filewatchservice.subscribe(path, self.onfileevent)
+
+    def onfileevent(self, event: inotify_simple.Event) -> None:
+        self.filechanged = True
+
+    @staticmethod
+    def variantkey(sourcehash: bytes, defines: Dict[str, Any]) -> Tuple:
+        return sourcehash, frozenset(defines.items())
+
+    def setdefines(self, defines: Dict[str, Any]) -> None:
+        """Switch to the variant built with defines, building it if it isn't cached yet"""
+        self.defines = dict(defines)
+        variant = self.variants.get(self.variantkey(self.sourcehash, self.defines))
+        if variant is not None:
+            self.swapprogram(variant[0], variant[1], {})
+        else:
+            self.regenShader()
+
+    def regenShader(self, block: bool = False):
+        """Start a rebuild of all stages whose source changed. Blocks until the program is swapped if block is set."""
+        try:
+            stages = []
+            hashes = {}
+            sourcehash = hashlib.sha1()
+            dependencies = set(path.resolve() for path, stagetype, stagename in self.stagepaths())
+            for path, stagetype, stagename in self.stagepaths():
+                if not path.exists():
+                    log.error("SHADER", "HOTLOADSHADER ERROR: %s file doesn't exist", stagename)
                     return
+                processed = self.preprocessor.process(path, self.defines)
+                stages.append((stagetype, processed.source))
+                hashes[stagetype] = hashlib.sha1(processed.source.encode("utf-8")).digest()
+                sourcehash.update(processed.contenthash)
+                dependencies.update(processed.files)
+
+            self.updatewatches(dependencies)
+
+            if sourcehash.digest() != self.sourcehash:
+                self.dropvariants()
+                self.sourcehash = sourcehash.digest()
+            key = self.variantkey(self.sourcehash, self.defines)
+
+            if self.pendingbuild is not None:
+                if hashes == self.pendinghashes:
+                    return  # Already building exactly this
+                self.pendingbuild.cancel()
+                self.pendingbuild = None
+            elif hashes == self.stagehashes:
+                return  # Event without content change, e.g. editor touching the file
+
+            cached = programcache.lookup(stages, self.defines)
+            if cached is not None:
+                self.variants[key] = (cached, hashes)
+                self.swapprogram(cached, hashes, {})
+                return
 
-            if self.shaderprogram is not None:
-                pass  # glDeleteProgram(self.program)
-            if self.geometryPath is None:
-                self.shaderprogram = shaders.compileProgram(self.vertShader, self.fragShader)
-            else:
-                self.shaderprogram = shaders.compileProgram(self.vertShader, self.fragShader, self.geomShader)
+            reuse = {stagetype: shader for stagetype, shader in self.stageobjects.items()
+                     if self.stagehashes.get(stagetype) == hashes[stagetype]}
+            self.pendingbuild = ProgramBuild(stages, reuse, self.defines)
+            self.pendinghashes = hashes
+            self.pendingkey = key
+            if block:
+                self.pendingbuild.wait()
+            self.pollbuild()
         except Exception as exc:
-            print(traceback.format_exc(), file=sys.stderr)
-            print(exc, file=sys.stderr)
+            log.exception("SHADER", "Failed to rebuild %s, %s", exc, self.vertexPath, self.fragmentPath)
+
+    def dropvariants(self) -> None:
+        """Sources changed, so all cached variants are stale"""
+        for program, hashes in self.variants.values():
+            if program != self.shaderprogram:
+                gpuresources.delete("program", program)
+        self.variants = {}
+
+    def pollbuild(self) -> None:
+        if not self.pendingbuild.poll():
+            return
+
+        build = self.pendingbuild
+        self.pendingbuild = None
+        if build.error is not None:
+            log.error("SHADER", "ERROR BUILDING SHADER: %s, %s\n%s",
+                      self.vertexPath.absolute(), self.fragmentPath.absolute(), build.error)
+            return
+
+        if self.pendingkey[0] == self.sourcehash:
+            self.variants[self.pendingkey] = (build.program, self.pendinghashes)
+        self.swapprogram(build.program, self.pendinghashes, build.shaderobjects)
+
+    def swapprogram(self, program: int, hashes: Dict[int, bytes], stageobjects: Dict[int, int]) -> None:
+        for shader in self.stageobjects.values():
+            if shader not in stageobjects.values():
+                gpuresources.delete("shader", shader)
+        self.stageobjects = stageobjects
+        self.stagehashes = hashes
+
+        if self.shaderprogram != program and self.ownsprogram(self.shaderprogram):
+            gpuresources.delete("program", self.shaderprogram)
+        self.shaderprogram = program
+
+    def ownsprogram(self, program: int) -> bool:
+        """Whether program may be deleted when it is replaced, i.e. it is neither the shared DebugShader program nor
+        kept as variant"""
+        return (program is not None and program != DebugShader.program and
+                not any(program == variant for variant, hashes in self.variants.values()))
 
     def tick(self):
-        events = self.inotify.read(0)
-        for event in events:
-            if event.name == self.vertexPath.name or event.name == self.fragmentPath.name or (
-                    self.geometryPath is not None and self.geometryPath.name == self.geometryPath.name):
-                self.regenShader()
-
-    def __del__(self):
-        if self.shaderprogram:
-            pass  # shaders.glDeleteShader(self.program)
+        if self.filechanged:  # All events since last tick result in at most one rebuild
+            self.filechanged = False
+            self.regenShader()
+        elif self.pendingbuild is not None:
+            self.pollbuild()
+
+    def release(self):
+        for subscription in self.filewatches.values():
+            filewatchservice.unsubscribe(subscription)
+        self.filewatches = {}
+        if self.pendingbuild is not None:
+            self.pendingbuild.cancel()
+            self.pendingbuild = None
+        for shader in self.stageobjects.values():
+            gpuresources.delete("shader", shader)
+        self.stageobjects = {}
+        self.dropvariants()
+        if self.ownsprogram(self.shaderprogram):
+            gpuresources.delete("program", self.shaderprogram)
+        self.shaderprogram = DebugShader.program
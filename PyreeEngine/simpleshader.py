@@ -11,20 +11,24 @@ from PyreeEngine.util import Resolution
 from PyreeEngine.shaders import HotloadingShader, DebugShader
 from PyreeEngine.basicObjects import FSQuad
 from PyreeEngine.camera import Camera
+from PyreeEngine.gpuresources import GPUObject
 
 from typing import List, Union
 
 
-class SimpleShader():
-    def __init__(self, context: LayerContext, quadz: float = 0):
+class SimpleShader(GPUObject):
+    def __init__(self, context: LayerContext, quadz: float = 0, name: str = "pass"):
+        self.framebuffer: RegularFramebuffer = None
+        self.fsquad: FSQuad = None
         self.context: LayerContext = context
+        self.name: str = name  # Name of GPU profiler scope
         self.context.addresolutioncallback(self.resolutionchangecallback)
 
         self.quadz: float = quadz
 
-        self.framebuffer: RegularFramebuffer = RegularFramebuffer(self.context.resolution)
+        self.framebuffer = RegularFramebuffer(self.context.resolution)
         self.shader: HotloadingShader = None
-        self.fsquad: FSQuad = FSQuad(z=quadz)
+        self.fsquad = FSQuad(z=quadz)
         self.camera: Camera = Camera()
 
         self.updateshader(self.shader)
@@ -38,23 +42,30 @@ class SimpleShader():
             self.fsquad.shader = DebugShader()
 
     def resolutionchangecallback(self, newres: Resolution):
+        self.framebuffer.release()
         self.framebuffer = RegularFramebuffer(self.context.resolution)  # Regenerate Framebuffer
 
-    def __del__(self):
+    def release(self):
+        """The resolution callback keeps this object alive, so __del__ only runs after release() was called"""
         self.context.removeresolutionscallback(self.resolutionchangecallback)
+        if self.framebuffer is not None:
+            self.framebuffer.release()
+        if self.fsquad is not None:
+            self.fsquad.release()
 
     def tick(self):
         if self.shader is not None:
             self.shader.tick()
 
-        self.framebuffer.bindFramebuffer()
-        glClear(GL_DEPTH_BUFFER_BIT)
+        with self.context.gpuprofiler.scope(self.name):
+            self.framebuffer.bindFramebuffer()
+            glClear(GL_DEPTH_BUFFER_BIT)
 
-        self.setuniform("time", self.context.time)
-        self.setuniform("dt", self.context.dt)
-        self.setuniform("frame", self.context.frame)
+            self.setuniform("time", self.context.time)
+            self.setuniform("dt", self.context.dt)
+            self.setuniform("frame", self.context.frame)
 
-        self.fsquad.render(self.camera.viewMatrix)
+            self.fsquad.render(self.camera.viewMatrix)
 
 
     def setuniform(self, name: str, value: Union[any, List[any]]):
@@ -0,0 +1,108 @@
+"""Static mesh batching
+
+Many ModelObjects that share a shader and never move can be merged into a StaticBatch. Their vertices are transformed
+by their model matrices once, with a single vectorized NumPy operation over all members, and concatenated into one
+vertex buffer that is drawn with one call. The batch is only rebuilt after members were added or removed, or after
+invalidate() was called because a member moved.
+
+Members are drawn with the batch's shader, textures and uniforms, their own are ignored. By default these are taken
+from the first member. Each member keeps its vertex range in the buffer; hiding members switches the batch to
+glMultiDrawArrays over the visible ranges, without rebuilding."""
+
+from typing import Dict, Iterable, List, Tuple
+
+from OpenGL.GL import *
+
+import numpy as np
+
+from PyreeEngine.basicObjects import ModelObject
+from PyreeEngine.shaders import Shader
+
+
+class StaticBatch(ModelObject):
+    def __init__(self, objects: Iterable[ModelObject] = (), shader: Shader = None):
+        super(StaticBatch, self).__init__()
+
+        self.members: List[ModelObject] = []
+        self.ranges: Dict[ModelObject, Tuple[int, int]] = {}  # Member -> (first vertex, vertex count)
+        self.hidden: set = set()
+        self.dirty: bool = False  # Members changed since the last rebuild
+        self.firsts: np.ndarray = None  # glMultiDrawArrays arguments for visible members
+        self.counts: np.ndarray = None
+        self.explicitshader: bool = shader is not None
+        if shader is not None:
+            self.shader = shader
+
+        for obj in objects:
+            self.add(obj)
+
+    def add(self, obj: ModelObject) -> None:
+        if obj.verts is None:
+            raise ValueError("%s has no static vertices to batch" % type(obj).__name__)
+        if not self.members and not self.explicitshader:
+            self.shader = obj.shader
+            self.textures = list(obj.textures)
+            self.uniforms = dict(obj.uniforms)
+        self.members.append(obj)
+        self.dirty = True
+
+    def remove(self, obj: ModelObject) -> None:
+        self.members.remove(obj)
+        self.hidden.discard(obj)
+        self.dirty = True
+
+    def invalidate(self) -> None:
+        """Rebuild before the next draw, call after moving members"""
+        self.dirty = True
+
+    def setvisible(self, obj: ModelObject, visible: bool) -> None:
+        """Skip or draw a member's range without rebuilding the buffer"""
+        if visible:
+            self.hidden.discard(obj)
+        else:
+            self.hidden.add(obj)
+        self.firsts = None
+
+    def rebuild(self) -> None:
+        self.dirty = False
+        self.firsts = None
+        self.ranges = {}
+        if not self.members:
+            self.tricount = 0
+            return
+
+        counts = np.array([len(obj.verts) for obj in self.members])
+        firsts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        for obj, first, count in zip(self.members, firsts, counts):
+            self.ranges[obj] = (int(first), int(count))
+
+        matrices = np.array([np.asarray(obj.getModelMatrix()) for obj in self.members], np.float32)
+        normalmatrices = np.linalg.inv(matrices[:, :3, :3]).transpose((0, 2, 1))
+        memberindex = np.repeat(np.arange(len(self.members)), counts)  # Member of each vertex
+
+        verts = np.concatenate([obj.verts for obj in self.members]).astype(np.float32)
+        verts[:, 0:3] = np.einsum("nij,nj->ni", matrices[memberindex, :3, :3], verts[:, 0:3]) + \
+            matrices[memberindex, :3, 3]
+        normals = np.einsum("nij,nj->ni", normalmatrices[memberindex], verts[:, 5:8])
+        lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+        verts[:, 5:8] = normals / np.where(lengths > 0, lengths, 1)
+
+        self.loadFromVerts(verts.reshape(-1))
+
+    def render(self, viewProjMatrix):
+        if self.dirty:
+            self.rebuild()
+        if self.tricount:
+            super(StaticBatch, self).render(viewProjMatrix)
+
+    def draw(self):
+        if not self.hidden:
+            glDrawArrays(GL_TRIANGLES, 0, self.tricount)
+            return
+
+        if self.firsts is None:
+            visible = [self.ranges[obj] for obj in self.members if obj not in self.hidden]
+            self.firsts = np.array([first for first, count in visible], np.int32)
+            self.counts = np.array([count for first, count in visible], np.int32)
+        if len(self.firsts):
+            glMultiDrawArrays(GL_TRIANGLES, self.firsts, self.counts, len(self.firsts))
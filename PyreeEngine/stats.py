@@ -0,0 +1,44 @@
+"""Rolling statistics over the last samples, shared by the profilers, frame pacing and OSC latency tracking"""
+
+from collections import deque
+
+
+class RollingStats():
+    """Last window samples (e.g. durations in ms) with mean, max and percentiles. All of them are 0 without samples."""
+
+    def __init__(self, window: int = 1000):
+        self.samples: deque = deque(maxlen=window)
+
+    def add(self, value: float) -> None:
+        self.samples.append(value)
+
+    @property
+    def last(self) -> float:
+        return self.samples[-1] if self.samples else 0.
+
+    @property
+    def avg(self) -> float:
+        return sum(self.samples) / len(self.samples) if self.samples else 0.
+
+    @property
+    def max(self) -> float:
+        return max(self.samples) if self.samples else 0.
+
+    def percentile(self, p: float) -> float:
+        """p-th percentile (0..100) of the samples, nearest rank"""
+        if not self.samples:
+            return 0.
+        ordered = sorted(self.samples)
+        return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)]
+
+    @property
+    def p50(self) -> float:
+        return self.percentile(50)
+
+    @property
+    def p95(self) -> float:
+        return self.percentile(95)
+
+    @property
+    def p99(self) -> float:
+        return self.percentile(99)
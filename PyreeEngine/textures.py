@@ -6,16 +6,22 @@ from OpenGL.GL import shaders
 
 import numpy as np
 from pathlib import Path
-from PIL import Image
-
-from imageio import imread
 
 from enum import Enum
 
-class Texture():
+from PyreeEngine.preload import assetcache, decodeimage
+from PyreeEngine.glstate import glstate
+from PyreeEngine.gpuresources import gpuresources, GPUObject, texturebytes
+
+class Texture(GPUObject):
     """Abstract Texture Container
     A texture container abstracts the handling of textures to be more pythonic.
+
+    Textures are only freed by release(). Their names are usually handed on with getTexture(), e.g.
+    obj.textures = [TextureFromImage(path).getTexture()], and must stay valid after the container is gone.
     """
+    releaseondel = False
+
     class Wrapping(Enum):
         repeat = GL_REPEAT
         mirror = GL_MIRRORED_REPEAT
@@ -34,13 +40,14 @@ class Texture():
         texture1D = GL_TEXTURE_1D
         texture2D = GL_TEXTURE_2D
         texture3D = GL_TEXTURE_3D
+        texture2DArray = GL_TEXTURE_2D_ARRAY
         # TODO: Add other texture types if required
 
     def __init__(self):
         self.height = None  # type: int
         self.width = None   # type: int
         self.depth = None   # type: int
-        self.textures = None    # type: Union[int, List[int]]
+        self.textures = None    # type: List[int]
         self.targetType = Texture.TexTarget.texture2D.value   # Default texture is regular 2D texture
 
     def getTexture(self) -> Union[int, List[int]]:
@@ -52,10 +59,16 @@ class Texture():
         for tex in self.textures:
             yield tex
 
+    def release(self):
+        if self.textures is not None:
+            for tex in self.textures:
+                gpuresources.delete("texture", tex)
+            self.textures = None
+
     def setMagFilter(self, filterMode: Filter=Filter.linearMipmapLinear):
         if filterMode.value in [x.value for x in Texture.Filter]:
             for tex in self.textureGen():
-                glBindTexture(self.targetType, tex)
+                glstate.bindtexture(self.targetType, tex)
                 glTexParameterf(self.targetType, GL_TEXTURE_MAG_FILTER, filterMode.value)
         else:
             raise ValueError("Invalid filterMode (filtermode=%s)" % filterMode)
@@ -63,7 +76,7 @@ class Texture():
     def setMinFilter(self, filterMode: int=GL_LINEAR_MIPMAP_LINEAR):
         if filterMode.value in [x.value for x in Texture.Filter]:
             for tex in self.textureGen():
-                glBindTexture(self.targetType, tex)
+                glstate.bindtexture(self.targetType, tex)
                 glTexParameterf(self.targetType, GL_TEXTURE_MIN_FILTER, filterMode.value)
         else:
             raise ValueError("Invalid filterMode (filtermode=%s)" % filterMode)
@@ -71,7 +84,7 @@ class Texture():
     def setSWrap(self, wrapMode=Wrapping.repeat):
         if wrapMode.value in [x.value for x in Texture.Wrapping]:
             for tex in self.textureGen():
-                glBindTexture(self.targetType, tex)
+                glstate.bindtexture(self.targetType, tex)
                 glTexParameteri(self.targetType, GL_TEXTURE_WRAP_S, wrapMode.value)
         else:
             raise ValueError("Invalid wrapMode (wrapMode=%s)" % wrapMode)
@@ -79,7 +92,7 @@ class Texture():
     def setTWrap(self, wrapMode=Wrapping.repeat):
         if wrapMode.value in [x.value for x in Texture.Wrapping]:
             for tex in self.textureGen():
-                glBindTexture(self.targetType, tex)
+                glstate.bindtexture(self.targetType, tex)
                 glTexParameterf(self.targetType, GL_TEXTURE_WRAP_T, wrapMode.value)
         else:
             raise ValueError("Invalid wrapMode (wrapMode=%s)" % wrapMode)
@@ -87,7 +100,7 @@ class Texture():
     def setRWrap(self, wrapMode=Wrapping.repeat):
         if wrapMode.value in [x.value for x in Texture.Wrapping]:
             for tex in self.textureGen():
-                glBindTexture(self.targetType, tex)
+                glstate.bindtexture(self.targetType, tex)
                 glTexParameterf(self.targetType, GL_TEXTURE_WRAP_R, wrapMode.value)
         else:
             raise ValueError("Invalid wrapMode (wrapMode=%s)" % wrapMode)
@@ -103,14 +116,16 @@ class TextureFromImage(Texture):
         self.size = [1, 1]
 
     def texFromImage(self, path: Path, mode: str="RGBA"):
-        imdata = np.flipud(imread(path))
+        imdata = assetcache.take(path)
+        if imdata is None:
+            imdata = decodeimage(path)
 
-        if self.textures is not None:
-            glDeleteTextures(self.textures)    # Clean up old texture
-        self.textures = [glGenTextures(1)]
+        self.release()    # Clean up old texture
+        self.textures = [gpuresources.gentexture(texturebytes(imdata.shape[0], imdata.shape[1], mipmaps=True),
+                                                 Path(path).name)]
 
         glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
-        glBindTexture(GL_TEXTURE_2D, self.textures[0])
+        glstate.bindtexture(GL_TEXTURE_2D, self.textures[0])
         glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
         glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
         glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
@@ -131,6 +146,79 @@ class HotloadingTextureFromImage(TextureFromImage):
     def __init__(self, path: Path):
         super(HotloadingTextureFromImage, self).__init__(path)
 
+def torgba(imdata: np.ndarray) -> np.ndarray:
+    """Expand grayscale and RGB image data to RGBA uint8"""
+    imdata = np.asarray(imdata)
+    if imdata.ndim == 2:
+        imdata = imdata[:, :, np.newaxis]
+    if imdata.shape[2] < 3:
+        imdata = np.concatenate([np.repeat(imdata[:, :, :1], 3, axis=2), imdata[:, :, 1:2]], axis=2)
+    if imdata.shape[2] == 3:
+        imdata = np.concatenate([imdata, np.full(imdata.shape[:2] + (1,), 255, imdata.dtype)], axis=2)
+    return np.ascontiguousarray(imdata, np.uint8)
+
+
+class TextureArray(Texture):
+    """Equally sized RGBA layers in one GL_TEXTURE_2D_ARRAY, so quads with different images share a single draw call"""
+
+    def __init__(self, width: int, height: int, layers: int, mipmaps: bool = True, maxlevels: int = None):
+        """maxlevels limits the mipmap chain, e.g. for atlases whose gutters only cover the first few levels"""
+        super(TextureArray, self).__init__()
+        self.targetType = Texture.TexTarget.texture2DArray.value
+        self.width = width
+        self.height = height
+        self.depth = layers
+        self.mipmaps: bool = mipmaps
+
+        levels = 1 + int(np.log2(max(width, height))) if mipmaps else 1
+        if maxlevels is not None:
+            levels = max(1, min(levels, maxlevels))
+        self.textures = [gpuresources.gentexture(texturebytes(width, height, layers=layers, mipmaps=mipmaps),
+                                                 "TextureArray")]
+        glstate.bindtexture(GL_TEXTURE_2D_ARRAY, self.textures[0])
+        glTexStorage3D(GL_TEXTURE_2D_ARRAY, levels, GL_RGBA8, width, height, layers)
+        glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR if mipmaps else GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+        glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+
+    @classmethod
+    def fromimages(cls, paths: List[Path], mipmaps: bool = True) -> "TextureArray":
+        """One layer per image, in order. All images must have the same size."""
+        images = []
+        for path in paths:
+            imdata = assetcache.take(path)
+            images.append(torgba(imdata if imdata is not None else decodeimage(path)))
+        height, width = images[0].shape[:2]
+        for path, imdata in zip(paths, images):
+            if imdata.shape[:2] != (height, width):
+                raise ValueError("Image %s is %ix%i, expected %ix%i" % (path, imdata.shape[1], imdata.shape[0],
+                                                                      width, height))
+        texarray = cls(width, height, len(images), mipmaps)
+        for layer, imdata in enumerate(images):
+            texarray.setlayer(layer, imdata, generatemipmaps=False)
+        texarray.generatemipmaps()
+        return texarray
+
+    def setlayer(self, layer: int, imdata: np.ndarray, generatemipmaps: bool = True) -> None:
+        """Upload (height, width, 4) uint8 image data to layer, rows bottom to top"""
+        imdata = torgba(imdata)
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+        glstate.bindtexture(GL_TEXTURE_2D_ARRAY, self.textures[0])
+        glTexSubImage3D(GL_TEXTURE_2D_ARRAY, 0, 0, 0, layer, imdata.shape[1], imdata.shape[0], 1,
+                        GL_RGBA, GL_UNSIGNED_BYTE, imdata)
+        if generatemipmaps:
+            self.generatemipmaps()
+
+    def generatemipmaps(self) -> None:
+        if self.mipmaps:
+            glstate.bindtexture(GL_TEXTURE_2D_ARRAY, self.textures[0])
+            glGenerateMipmap(GL_TEXTURE_2D_ARRAY)
+
+    def getTexture(self) -> int:
+        return self.textures[0]
+
+
 class RandomRGBATexture(Texture):
     def __init__(self, size):
         super(RandomRGBATexture, self).__init__()
@@ -141,12 +229,12 @@ class RandomRGBATexture(Texture):
     def genRandom(self):
         imdata = np.random.random_sample(self.shape)
 
-        if self.textures is not None:
-            glDeleteTextures(self.textures)    # Clean up old texture
-        self.textures = glGenTextures(1)
+        self.release()    # Clean up old texture
+        self.textures = [gpuresources.gentexture(texturebytes(self.shape[0], self.shape[1], 16, mipmaps=True),
+                                                 "RandomRGBATexture")]
 
         glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
-        glBindTexture(GL_TEXTURE_2D, self.textures)
+        glstate.bindtexture(GL_TEXTURE_2D, self.textures[0])
         glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
         glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
         glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
@@ -155,4 +243,4 @@ class RandomRGBATexture(Texture):
         glGenerateMipmap(GL_TEXTURE_2D)
 
     def getTexture(self):
-        return self.textures
\ No newline at end of file
+        return self.textures[0]
\ No newline at end of file
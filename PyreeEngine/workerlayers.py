@@ -0,0 +1,378 @@
+"""Layers that run in a worker process
+
+Pure NumPy layers (simulations, audio analysis, point cloud processing) don't need the GL context, so they can run in
+their own process instead of blocking the render loop. A worker layer is declared with "worker": true in its layer
+definition, and its entry class derives from WorkerEntry instead of BaseEntry.
+
+Results are exchanged through shared memory. Every output array exists three times: one copy is being written by the
+worker, one holds the latest completed result and one is being read by the render side. Publishing a result and
+picking up the latest one only swap indices, so neither side ever waits for the other.
+
+The render side accesses a worker layer through context.data[layername], e.g.
+
+    worker = self.context.data["particles"]
+    worker.send(gravity=-9.81)     # Becomes context.inputs["gravity"] in the worker
+    positions = worker.outputs["positions"]     # Latest completed result, valid until the next frame
+"""
+
+from typing import Dict, Tuple, List, Any
+
+from multiprocessing import shared_memory
+import multiprocessing
+import queue
+
+import importlib
+import traceback
+import sys
+import time
+import types
+
+import numpy as np
+
+from PyreeEngine import log
+from PyreeEngine.layers import Layer, LayerConfig, LayerContext
+
+OutputSpec = Dict[str, Tuple[Tuple[int, ...], str]]  # Output name -> (shape, dtype)
+
+# Indices into shared state array
+LATEST = 0  # Slot holding latest completed result, -1 if none
+LATESTGEN = 1  # Layout generation of latest result
+READING = 2  # Slot currently read by render side, -1 if none
+SEQUENCE = 3  # Number of published results
+
+
+class WorkerContext():
+    """Context available to WorkerEntry instances in the worker process"""
+
+    def __init__(self, name: str):
+        self.name: str = name
+        self.time: float = 0.
+        self.dt: float = 0.
+        self.frame: int = 0
+
+        self.inputs: Dict[str, Any] = {}  # Values sent from the render side with WorkerLayer.send()
+        self.outputs: Dict[str, np.ndarray] = {}  # Arrays to write results to during tick()
+
+
+class WorkerEntry():
+    """Entry class of worker layers
+
+    Declare result arrays in outputs, and write them to self.context.outputs in every tick. All outputs have to be
+    written completely in each tick, as consecutive ticks write to different copies."""
+
+    outputs: OutputSpec = {}
+
+    def __init__(self, context: WorkerContext):
+        self.context: WorkerContext = context
+
+    def __serialize__(self) -> dict:
+        return {}
+
+    def __deserialize__(self, data: dict) -> None:
+        pass
+
+    def init(self):
+        pass
+
+    def tick(self):
+        pass
+
+
+def layoutoutputs(spec: OutputSpec) -> Tuple[Dict[str, Tuple[int, Tuple[int, ...], str]], int]:
+    """Assign 64 byte aligned offsets to all outputs, returns layout and total size"""
+    layout = {}
+    offset = 0
+    for name, (shape, dtype) in sorted(spec.items()):
+        layout[name] = (offset, tuple(shape), np.dtype(dtype).str)
+        offset += (int(np.prod(shape)) * np.dtype(dtype).itemsize + 63) // 64 * 64
+    return layout, max(offset, 64)
+
+
+def mapoutputs(block: shared_memory.SharedMemory, layout: dict) -> Dict[str, np.ndarray]:
+    return {name: np.ndarray(shape, dtype, buffer=block.buf, offset=offset)
+            for name, (offset, shape, dtype) in layout.items()}
+
+
+def closeblock(block: shared_memory.SharedMemory) -> None:
+    try:
+        block.close()
+    except BufferError:
+        pass  # Someone still holds an array of this block, mapping is released once it's garbage collected
+
+
+class WorkerProcess():
+    """Runs in the worker process: loads the entry class and ticks it, publishing results to shared memory"""
+
+    def __init__(self, config: LayerConfig, commands: multiprocessing.Queue, status: multiprocessing.Queue,
+                 state, interval: float):
+        self.config: LayerConfig = config
+        self.commands = commands
+        self.status = status
+        self.state = state
+        self.interval: float = interval
+
+        self.context: WorkerContext = WorkerContext(config.name)
+        self.module: types.ModuleType = None
+        self.entryinstance: WorkerEntry = None
+
+        self.spec: OutputSpec = None
+        self.generation: int = 0
+        self.blocks: List[shared_memory.SharedMemory] = []
+        self.slots: List[Dict[str, np.ndarray]] = []
+        self.retired: List[Tuple[int, List[shared_memory.SharedMemory]]] = []  # Replaced, render side may not have
+        # attached them yet. Unlinked once it acknowledged a generation at least as new.
+
+    def run(self) -> None:
+        self.loadmodule()
+        lasttime = time.perf_counter()
+        running = True
+        while running:
+            running = self.handlecommands()
+
+            now = time.perf_counter()
+            self.context.dt = now - lasttime
+            self.context.time += self.context.dt
+            lasttime = now
+
+            if self.entryinstance is not None:
+                self.tick()
+
+            remaining = self.interval - (time.perf_counter() - now)
+            if remaining > 0:
+                time.sleep(remaining)
+
+        self.retireblocks()
+        self.unlinkretired(self.generation)  # Render side won't attach anymore
+
+    def handlecommands(self) -> bool:
+        while True:
+            try:
+                command, payload = self.commands.get_nowait()
+            except queue.Empty:
+                return True
+            if command == "stop":
+                return False
+            elif command == "reload":
+                self.loadmodule(payload)
+            elif command == "inputs":
+                self.context.inputs.update(payload)
+            elif command == "attached":
+                self.unlinkretired(payload)
+
+    def tick(self) -> None:
+        with self.state.get_lock():
+            slot = [i for i in range(3) if i != self.state[LATEST] and i != self.state[READING]][0]
+        self.context.outputs = self.slots[slot]
+        try:
+            self.entryinstance.tick()
+        except Exception as exc:
+            self.status.put(("error", "TICK EXCEPTION in module %s on layer %s\n%s" % (
+                self.config.module, self.config.name, traceback.format_exc())))
+            self.entryinstance = None
+            return
+        with self.state.get_lock():
+            self.state[LATEST] = slot
+            self.state[LATESTGEN] = self.generation
+            self.state[SEQUENCE] += 1
+        self.context.frame += 1
+
+    def loadmodule(self, helpers: List[str] = None) -> None:
+        """Same semantics as Layer.loadmodule: on import errors the old instance persists
+
+        helpers are reloaded first, in the given order, if this process imported them"""
+        importlib.invalidate_caches()
+        try:
+            for name in helpers or []:
+                if name in sys.modules:
+                    importlib.reload(sys.modules[name])
+            if self.module is None:
+                self.module = importlib.import_module(self.config.module)
+            else:
+                importlib.reload(self.module)
+        except Exception:
+            self.status.put(("old", "Module %s load exception, old instance persists on Layer %s\n%s" % (
+                self.config.module, self.config.name, traceback.format_exc())))
+            return
+
+        if not hasattr(self.module, self.config.entryclass):
+            self.status.put(("error", "Module %s has no class %s" % (self.config.module, self.config.entryclass)))
+            return
+
+        try:
+            newinstance = getattr(self.module, self.config.entryclass)(self.context)
+            self.allocateoutputs(newinstance.outputs)
+            if self.entryinstance is not None:
+                newinstance.__deserialize__(self.entryinstance.__serialize__())
+            self.entryinstance = newinstance
+            self.entryinstance.init()
+        except Exception:
+            self.status.put(("error", "Failed to replace old instance with new instance on Layer %s\n%s" % (
+                self.config.name, traceback.format_exc())))
+            self.entryinstance = None
+            return
+
+        self.status.put(("loaded", None))
+
+    def allocateoutputs(self, spec: OutputSpec) -> None:
+        """(Re)create shared memory if the declared outputs changed"""
+        if spec == self.spec:
+            return
+
+        layout, size = layoutoutputs(spec)
+        blocks = [shared_memory.SharedMemory(create=True, size=size) for i in range(3)]
+
+        self.retireblocks()
+        with self.state.get_lock():
+            self.generation += 1
+            self.state[LATEST] = -1
+
+        self.spec = dict(spec)
+        self.blocks = blocks
+        self.slots = [mapoutputs(block, layout) for block in blocks]
+        self.status.put(("layout", (self.generation, [block.name for block in blocks], layout)))
+
+    def retireblocks(self) -> None:
+        """Stop using the current blocks, the render side may still attach to them by name"""
+        self.slots = []
+        self.context.outputs = {}
+        for block in self.blocks:
+            closeblock(block)
+        if self.blocks:
+            self.retired.append((self.generation, self.blocks))
+        self.blocks = []
+
+    def unlinkretired(self, generation: int) -> None:
+        """Render side attached generation, so it won't open any older blocks by name anymore"""
+        remaining = []
+        for blockgeneration, blocks in self.retired:
+            if blockgeneration <= generation:
+                for block in blocks:
+                    try:
+                        block.unlink()
+                    except FileNotFoundError:
+                        pass
+            else:
+                remaining.append((blockgeneration, blocks))
+        self.retired = remaining
+
+
+def workermain(config: LayerConfig, commands, status, state, interval: float) -> None:
+    """Entry point of worker processes"""
+    WorkerProcess(config, commands, status, state, interval).run()
+
+
+class WorkerLayer(Layer):
+    """Render side of a layer whose entry class runs in a worker process"""
+
+    def __init__(self, config: LayerConfig, context: LayerContext):
+        self.process: multiprocessing.Process = None
+        self.outputs: Dict[str, np.ndarray] = {}  # Latest completed result
+        self.sequence: int = 0  # Number of results the worker published so far
+
+        self.generation: int = 0
+        self.blocks: List[shared_memory.SharedMemory] = []
+        self.slots: List[Dict[str, np.ndarray]] = []
+
+        mpcontext = multiprocessing.get_context("spawn")  # Never fork a process holding a GL context
+        self.commands = mpcontext.Queue()
+        self.status = mpcontext.Queue()
+        self.state = mpcontext.Array("q", [-1, 0, -1, 0])
+        self.mpcontext = mpcontext
+
+        super(WorkerLayer, self).__init__(config, context)
+        context.data[config.name] = self
+
+    def loadmodule(self) -> bool:
+        if self.process is None or not self.process.is_alive():
+            log.info("LAYER", "Starting worker for module %s" % self.config.module)
+            self.process = self.mpcontext.Process(target=workermain, name="pyree-%s" % self.config.name, daemon=True,
+                                                  args=(self.config, self.commands, self.status, self.state,
+                                                        self.config.workerinterval))
+            self.process.start()
+        else:
+            log.info("LAYER", "Reloading worker module %s" % self.config.module)
+            self.commands.put(("reload", None))
+        return True
+
+    def reloaddependencies(self, helpers: List[str]) -> None:
+        """Helpers live in the worker process, so have the worker reload them before the layer module"""
+        log.info("LAYER", "Reloading worker module %s after change in %s" % (self.config.module, ", ".join(helpers)))
+        if self.process is None or not self.process.is_alive():
+            self.loadmodule()  # A fresh worker imports the current helpers anyway
+        else:
+            self.commands.put(("reload", helpers))
+
+    def tick(self):
+        if self.checkfilewatch():
+            with self.context.profiler.scope(self.loadscopename):
+                self.loadmodule()
+
+        with self.context.profiler.scope(self.tickscopename):
+            self.handlestatus()
+            self.acquire()
+
+    def handlestatus(self) -> None:
+        while True:
+            try:
+                message, payload = self.status.get_nowait()
+            except queue.Empty:
+                return
+            if message == "error":
+                log.error("LAYER", "Worker of layer %s failed: %s", self.config.name, payload)
+                self.valid = False
+            elif message == "old":
+                log.error("LAYER", "Worker of layer %s: %s", self.config.name, payload)
+                self.old = True
+            elif message == "loaded":
+                self.valid = True
+                self.old = False
+            elif message == "layout":
+                self.attach(*payload)
+
+    def attach(self, generation: int, blocknames: List[str], layout: dict) -> None:
+        self.detach()
+        try:
+            blocks = [shared_memory.SharedMemory(name=name) for name in blocknames]
+        except FileNotFoundError:
+            # Only happens if the worker exited in between, e.g. on a crash. Results stay empty until it's restarted.
+            log.warning("LAYER", "Shared memory of worker layer %s generation %i is gone" % (
+                self.config.name, generation))
+            return
+        self.generation = generation
+        self.blocks = blocks
+        self.slots = [mapoutputs(block, layout) for block in self.blocks]
+        self.commands.put(("attached", generation))  # Worker may unlink this and older generations now
+
+    def detach(self) -> None:
+        with self.state.get_lock():
+            self.state[READING] = -1
+        self.outputs = {}
+        self.slots = []
+        for block in self.blocks:
+            closeblock(block)
+        self.blocks = []
+
+    def acquire(self) -> None:
+        """Switch to the latest completed result, if there is a newer one"""
+        with self.state.get_lock():
+            latest = self.state[LATEST]
+            if latest == -1 or self.state[LATESTGEN] != self.generation or latest == self.state[READING]:
+                return
+            self.state[READING] = latest
+            self.sequence = self.state[SEQUENCE]
+        self.outputs = self.slots[latest]
+
+    def send(self, **inputs) -> None:
+        """Update values of context.inputs in the worker"""
+        self.commands.put(("inputs", inputs))
+
+    def stop(self) -> None:
+        if self.process is not None and self.process.is_alive():
+            self.commands.put(("stop", None))
+            self.process.join(timeout=1)
+            if self.process.is_alive():
+                self.process.terminate()
+        self.detach()
+
+    def __del__(self):
+        self.stop()
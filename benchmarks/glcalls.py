@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Counts GL calls per frame with and without the GL state cache (PyreeEngine.glstate)
+
+Renders objects sharing a shader and texture into a framebuffer and that onto the screen, on a headless context.
+Every gl* function used by the engine's modules is wrapped with a counter. Run with PYREE_GLMODE=performance to also
+see the effect of disabling PyOpenGL's error checking on the frame time.
+
+Usage: python benchmarks/glcalls.py [objects] [frames]"""
+
+from PyreeEngine.headless import HeadlessEngine  # Must come first, selects the PyOpenGL platform
+
+import collections
+import sys
+import time
+
+import numpy as np
+
+import PyreeEngine
+from PyreeEngine.basicObjects import FSQuad
+from PyreeEngine.framebuffers import RegularFramebuffer
+from PyreeEngine.layers import ProgramConfig
+from PyreeEngine.textures import RandomRGBATexture
+from PyreeEngine.glstate import glstate
+from PyreeEngine.util import Vec3
+
+
+def countcalls(counter: collections.Counter) -> None:
+    """Replace gl* functions in all loaded engine modules with counting wrappers"""
+    def counted(name, function):
+        def wrapper(*args, **kwargs):
+            counter[name] += 1
+            return function(*args, **kwargs)
+        return wrapper
+
+    for modulename, module in list(sys.modules.items()):
+        if modulename.startswith("PyreeEngine") and module is not None:
+            for name, value in list(vars(module).items()):
+                if name.startswith("gl") and name[2:3].isupper() and callable(value):
+                    setattr(module, name, counted(name, value))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    engine = HeadlessEngine((256, 256), programconfig=ProgramConfig(layerdefs=[]))
+    texture = RandomRGBATexture((16, 16))
+    framebuffer = RegularFramebuffer(engine.layercontext.resolution)
+    objects = []
+    for i in range(count):
+        obj = FSQuad()
+        obj.scale = Vec3(0.05, 0.05, 1)
+        obj.pos = Vec3(np.cos(i) * 0.8, np.sin(i) * 0.8, 0)
+        obj.textures = [texture.getTexture()]
+        obj.uniforms["tint"] = (1., 0.5, 0.25)
+        objects.append(obj)
+    viewproj = np.matrix(np.identity(4))
+
+    counter = collections.Counter()
+    countcalls(counter)
+
+    def frame():
+        glstate.reset()
+        framebuffer.bindFramebuffer()
+        for obj in objects:
+            obj.render(viewproj)
+        framebuffer.rendertoscreen()
+
+    print("PYREE_GLMODE=%s, %i objects, %i frames" % (PyreeEngine.glmode, count, frames))
+    results = {}
+    for enabled in (False, True):
+        glstate.enabled = enabled
+        frame()  # Warm up caches
+        engine.readpixels()
+        counter.clear()
+        start = time.perf_counter()
+        for i in range(frames):
+            frame()
+        results[enabled] = dict(counter)
+        engine.readpixels()  # Wait for the GPU
+        elapsed = (time.perf_counter() - start) / frames
+        print("state cache %-8s %7.1f GL calls per frame, %6.2f ms per frame" %
+              ("enabled" if enabled else "disabled", sum(results[enabled].values()) / frames, elapsed * 1000))
+
+    print("\n%-24s %10s %10s" % ("calls per frame", "disabled", "enabled"))
+    for name in sorted(set(results[False]) | set(results[True]), key=lambda name: -results[False].get(name, 0)):
+        print("%-24s %10.1f %10.1f" % (name, results[False].get(name, 0) / frames, results[True].get(name, 0) / frames))
+
+    engine.close()
+
+
+if __name__ == "__main__":
+    main()
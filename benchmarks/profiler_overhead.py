@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""Measures the per-scope overhead of PyreeEngine.profiler.Profiler
+
+Usage: python benchmarks/profiler_overhead.py [iterations]"""
+
+import sys
+import timeit
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))  # Run from anywhere without installing
+
+from PyreeEngine.profiler import Profiler
+
+
+def work():
+    pass
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+    profiler = Profiler()
+
+    def bare():
+        work()
+
+    def scoped():
+        with profiler.scope("bench"):
+            work()
+
+    baseline = min(timeit.repeat(bare, number=iterations, repeat=5)) / iterations * 1e9
+
+    profiler.enabled = False
+    disabled = min(timeit.repeat(scoped, number=iterations, repeat=5)) / iterations * 1e9
+
+    profiler.enabled = True
+    enabled = min(timeit.repeat(scoped, number=iterations, repeat=5)) / iterations * 1e9
+
+    print("bare call:          %7.1f ns" % baseline)
+    print("disabled profiler:  %7.1f ns (+%.1f ns per scope)" % (disabled, disabled - baseline))
+    print("enabled profiler:   %7.1f ns (+%.1f ns per scope)" % (enabled, enabled - baseline))
+    print("disabled, 100 scopes per frame: %.4f %% of a 60 fps frame" % ((disabled - baseline) * 100 / 16.67e6 * 100))
+
+
+if __name__ == "__main__":
+    main()
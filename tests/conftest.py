@@ -0,0 +1,26 @@
+"""Tests run against one HeadlessEngine per session, PyOpenGL can't switch contexts or platforms within a process.
+PyreeEngine.headless is imported first so PyOpenGL picks EGL."""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import PyreeEngine.headless
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def engine(tmp_path_factory):
+    from PyreeEngine.headless import HeadlessEngine
+    from PyreeEngine.layers import ProgramConfig
+    from PyreeEngine.shadercache import programcache
+
+    programcache.cachedir = tmp_path_factory.mktemp("pyreecache")  # Keep the repo free of cached binaries
+    try:
+        engine = HeadlessEngine((64, 64), programconfig=ProgramConfig(layerdefs=[]))
+    except Exception as exc:
+        pytest.skip("No headless GL context: %s" % exc)
+    yield engine
+    engine.close()
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from OpenGL.GL import *
+
+from PyreeEngine.atlas import packimages, packrects, miplevels, TextureAtlas
+
+
+def randomimage(rng, width, height):
+    return rng.integers(0, 256, (height, width, 4), dtype=np.uint8)
+
+
+def test_packrects_no_overlap():
+    rng = np.random.default_rng(1)
+    sizes = [tuple(int(v) for v in rng.integers(4, 60, 2)) for i in range(200)]
+    placements = packrects(sizes, 128)
+
+    occupied = {}
+    for (width, height), (layer, x, y) in zip(sizes, placements):
+        assert 0 <= x and x + width <= 128 and 0 <= y and y + height <= 128
+        page = occupied.setdefault(layer, np.zeros((128, 128), bool))
+        assert not page[y:y + height, x:x + width].any()
+        page[y:y + height, x:x + width] = True
+
+
+def test_packrects_too_large():
+    with pytest.raises(ValueError):
+        packrects([(10, 10), (129, 4)], 128)
+
+
+def test_packimages_content_and_gutter():
+    rng = np.random.default_rng(2)
+    images = {"image%i" % i: randomimage(rng, int(rng.integers(3, 30)), int(rng.integers(3, 30))) for i in range(40)}
+    pages, entries = packimages(images, 64, gutter=2)
+
+    assert pages.shape[1:] == (64, 64, 4)
+    for name, imdata in images.items():
+        entry = entries[name]
+        x, y, width, height = entry.rect
+        assert (width, height) == (imdata.shape[1], imdata.shape[0])
+        assert np.array_equal(pages[entry.layer, y:y + height, x:x + width], imdata)
+        assert entry.uvrect == (x / 64, y / 64, (x + width) / 64, (y + height) / 64)
+        # Gutter repeats the edge pixels
+        assert np.array_equal(pages[entry.layer, y - 2:y, x:x + width], np.repeat(imdata[:1], 2, axis=0))
+        assert np.array_equal(pages[entry.layer, y:y + height, x + width:x + width + 2],
+                              np.repeat(imdata[:, -1:], 2, axis=1))
+
+
+def test_packimages_empty():
+    with pytest.raises(ValueError):
+        packimages({})
+
+
+def test_miplevels():
+    assert miplevels(0) == 1
+    assert miplevels(1) == 1
+    assert miplevels(4) == 3
+    assert miplevels(6) == 3
+    assert miplevels(8) == 4
+
+
+def test_atlas_texture_levels(engine):
+    rng = np.random.default_rng(3)
+    pages, entries = packimages({"a": randomimage(rng, 10, 12), "b": randomimage(rng, 7, 5)}, 64, gutter=4)
+    atlas = TextureAtlas(pages, entries, mipmaps=True, gutter=4)
+    with atlas.texture:
+        glBindTexture(GL_TEXTURE_2D_ARRAY, atlas.texture.getTexture())
+        assert glGetTexParameteriv(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_IMMUTABLE_LEVELS) == 3  # Gutter of 4 covers 2 mips
+        assert atlas["a"] == entries["a"]
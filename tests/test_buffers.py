@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from OpenGL.GL import *
+
+from PyreeEngine.buffers import StreamingBuffer
+from PyreeEngine.basicObjects import DynamicModelObject
+from PyreeEngine.glstate import glstate
+
+
+def test_segments_rotate(engine):
+    with StreamingBuffer(64, segments=3) as stream:
+        offsets = []
+        for i in range(4):
+            stream.acquire()
+            offsets.append(stream.offset)
+        assert offsets == [0, 64, 128, 0]
+
+
+def test_writes_reach_the_buffer(engine):
+    with StreamingBuffer(16, segments=2) as stream:
+        for value in (1., 2.):
+            stream.acquire(np.float32)[:] = value
+        glFinish()  # Coherent mapping, visible once the GPU is synchronized
+        glstate.bindbuffer(GL_ARRAY_BUFFER, stream.buffer)
+        data = np.frombuffer(glGetBufferSubData(GL_ARRAY_BUFFER, 0, 32), np.float32)
+        assert list(data) == [1.] * 4 + [2.] * 4
+
+
+def test_fences(engine):
+    with StreamingBuffer(16, segments=2) as stream:
+        stream.acquire()
+        stream.fence()
+        assert stream.fences[0] is not None and stream.fences[1] is None
+        stream.fence(1)
+        stream.acquire()  # Segment 1, waits for and deletes its fence
+        assert stream.fences[1] is None
+        stream.acquire()
+        assert stream.fences == [None, None]
+
+
+def triangle(x0, x1):
+    """Triangle covering most of x0..x1 in NDC as (3, 8) vertices"""
+    return np.array([[x0, -1, 0, 1, 1, 0, 0, 1], [x1, -1, 0, 1, 1, 0, 0, 1], [x0, 1, 0, 1, 1, 0, 0, 1]], np.float32)
+
+
+def renderalpha(engine, obj):
+    engine.target.bindFramebuffer()
+    glViewport(0, 0, 64, 64)
+    glClearColor(0, 0, 0, 0)
+    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+    obj.render(np.matrix(np.identity(4)))
+    return engine.readpixels()[:, :, 3]
+
+
+def test_dynamicmodelobject(engine):
+    with DynamicModelObject(16) as obj:
+        assert not renderalpha(engine, obj).any()  # Nothing committed yet
+
+        obj.loadFromVerts(triangle(-1, 0))
+        alpha = renderalpha(engine, obj)
+        assert alpha[:, :32].any() and not alpha[:, 32:].any()
+
+        verts = obj.mapVerts()
+        verts[:3] = triangle(0, 1)
+        # Not committed yet, the previous segment is still drawn and fenced
+        drawsegment = obj.drawsegment
+        alpha = renderalpha(engine, obj)
+        assert alpha[:, :32].any() and not alpha[:, 32:].any()
+        assert obj.stream.fences[drawsegment] is not None and obj.stream.fences[obj.stream.current] is None
+
+        obj.commitVerts(3)
+        alpha = renderalpha(engine, obj)
+        assert not alpha[:, :32].any() and alpha[:, 32:].any()
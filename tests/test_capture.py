@@ -0,0 +1,88 @@
+import threading
+
+import imageio
+import numpy as np
+import pytest
+from OpenGL.GL import *
+
+from PyreeEngine.capture import FrameCapture, CaptureSink, ImageSequenceSink
+
+
+class RecordingSink(CaptureSink):
+    def __init__(self, delay: threading.Event = None):
+        self.frames = []
+        self.delay = delay  # Writer blocks until set
+        self.closed = False
+
+    def write(self, frame, pixels):
+        if self.delay is not None:
+            self.delay.wait()
+        self.frames.append((frame, pixels[0, 0].copy()))  # Only valid during write()
+
+    def close(self):
+        self.closed = True
+
+
+def clear(engine, value):
+    engine.target.bindFramebuffer()
+    glClearColor(value / 255, 0, 0, 1)
+    glClear(GL_COLOR_BUFFER_BIT)
+
+
+def test_frames_arrive_in_order(engine):
+    sink = RecordingSink()
+    capture = FrameCapture(engine.layercontext.resolution, sink, ringsize=3, dropframes=False)
+    for frame in range(10):
+        clear(engine, frame * 10)
+        capture.capture(engine.target.fbo, frame)
+    capture.stop()
+    assert sink.closed and (capture.captured, capture.dropped) == (10, 0)
+    assert [(frame, list(pixel)) for frame, pixel in sink.frames] == [(i, [i * 10, 0, 0, 255]) for i in range(10)]
+
+
+@pytest.mark.parametrize("dropframes", [True, False])
+def test_slow_writer(engine, dropframes):
+    writable = threading.Event()
+    sink = RecordingSink(writable)
+    capture = FrameCapture(engine.layercontext.resolution, sink, ringsize=2, maxqueue=1, dropframes=dropframes)
+    if not dropframes:
+        threading.Timer(0.2, writable.set).start()  # Render loop waits for the writer meanwhile
+    for frame in range(6):
+        clear(engine, frame)
+        capture.capture(engine.target.fbo, frame)
+        glFinish()
+    writable.set()
+    capture.stop()
+    assert capture.captured + capture.dropped == 6
+    if dropframes:
+        assert capture.dropped > 0  # Skipped instead of stalling
+    else:
+        assert capture.dropped == 0 and [frame for frame, pixel in sink.frames] == list(range(6))
+
+
+def test_image_sequence(engine, tmp_path):
+    capture = FrameCapture(engine.layercontext.resolution, ImageSequenceSink(tmp_path / "frames"), dropframes=False)
+    for frame in range(3):
+        engine.target.bindFramebuffer()
+        glClearColor(0, 0, 0, 1)
+        glClear(GL_COLOR_BUFFER_BIT)
+        glEnable(GL_SCISSOR_TEST)
+        glScissor(0, 0, 64, 16)  # Bottom rows
+        glClearColor(1, 1, 1, 1)
+        glClear(GL_COLOR_BUFFER_BIT)
+        glDisable(GL_SCISSOR_TEST)
+        capture.capture(engine.target.fbo, frame + 100)
+    capture.stop()
+
+    assert sorted(path.name for path in (tmp_path / "frames").iterdir()) == \
+           ["frame000100.png", "frame000101.png", "frame000102.png"]
+    image = np.asarray(imageio.imread(tmp_path / "frames" / "frame000100.png"))
+    assert image.shape == (64, 64, 4)
+    assert (image[-1] == 255).all() and (image[0, :, :3] == 0).all()  # Flipped to top row first
+
+
+def test_engine_recording(engine, tmp_path):
+    engine.startrecording(tmp_path / "recording")
+    engine.step(4)
+    engine.stoprecording()
+    assert len(list((tmp_path / "recording").iterdir())) == 4
@@ -0,0 +1,113 @@
+import asyncio
+import gc
+import time
+
+import pytest
+from inotify_simple import flags
+
+from PyreeEngine.filewatch import FileWatchService
+
+
+@pytest.fixture
+def service():
+    service = FileWatchService(debounce=0.05)
+    yield service
+    service.detach()
+    if service.inotify is not None:
+        service.inotify.close()
+
+
+class Recorder():
+    def __init__(self):
+        self.events = []
+
+    def onevent(self, event):
+        self.events.append(event)
+
+
+def polluntil(service, condition, timeout=5.):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "No file event arrived in time"
+        service.poll()
+        time.sleep(0.005)
+
+
+def test_burst_is_debounced(service, tmp_path):
+    path = tmp_path / "layer.py"
+    recorder = Recorder()
+    service.subscribe(path, recorder.onevent)
+
+    path.write_text("a")
+    path.write_text("b")
+    service.poll()
+    assert recorder.events == []  # Still within the debounce period
+    polluntil(service, lambda: recorder.events)
+    time.sleep(0.06)
+    service.poll()
+    assert len(recorder.events) == 1  # Once for the whole burst, with the combined mask
+    assert recorder.events[0].name == "layer.py" and recorder.events[0].mask & (flags.CREATE | flags.MODIFY)
+
+
+def test_dispatch_by_path(service, tmp_path):
+    first, second = Recorder(), Recorder()
+    service.subscribe(tmp_path / "first.py", first.onevent)
+    service.subscribe(tmp_path / "second.py", second.onevent)
+    assert len(service.directories) == 1  # One watch per directory
+
+    (tmp_path / "second.py").write_text("")
+    (tmp_path / "unrelated.py").write_text("")
+    polluntil(service, lambda: second.events)
+    assert first.events == []
+
+
+def test_symlinked_directory(service, tmp_path):
+    (tmp_path / "real").mkdir()
+    (tmp_path / "link").symlink_to(tmp_path / "real")
+    recorder = Recorder()
+    service.subscribe(tmp_path / "link" / "shader.frag", recorder.onevent)
+    service.subscribe(tmp_path / "real" / "shader.frag", recorder.onevent)
+    assert len(service.directories) == 1
+    (tmp_path / "real" / "shader.frag").write_text("")
+    polluntil(service, lambda: len(recorder.events) == 2)
+
+
+def test_unsubscribe_and_garbage_collected(service, tmp_path):
+    path = tmp_path / "layer.py"
+    kept, dropped = Recorder(), Recorder()
+    subscription = service.subscribe(path, kept.onevent)
+    service.subscribe(path, dropped.onevent)
+    del dropped
+    gc.collect()
+
+    path.write_text("")
+    polluntil(service, lambda: kept.events)
+    assert len(service.subscriptions[path.resolve()]) == 1  # The collected subscriber is gone
+
+    service.unsubscribe(subscription)
+    assert service.subscriptions == {}
+
+
+def test_failing_callback(service, tmp_path):
+    recorder = Recorder()
+    service.subscribe(tmp_path / "layer.py", lambda event: 1 / 0)
+    service.subscribe(tmp_path / "layer.py", recorder.onevent)
+    (tmp_path / "layer.py").write_text("")
+    polluntil(service, lambda: recorder.events)  # Logged, the other subscribers still run
+
+
+def test_attached_to_loop(service, tmp_path):
+    path = tmp_path / "layer.py"
+    recorder = Recorder()
+
+    async def main():
+        service.attach(asyncio.get_running_loop())
+        service.subscribe(path, recorder.onevent)  # The reader is registered once inotify exists
+        path.write_text("")
+        deadline = time.monotonic() + 5.
+        while not recorder.events and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        service.detach()
+
+    asyncio.run(main())
+    assert len(recorder.events) == 1 and not service.attached
@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+import pytest
+
+from PyreeEngine.framepacing import FrameStats, FrameScheduler
+
+
+def test_framestats():
+    stats = FrameStats(window=100, binwidth=1., bins=50)
+    for ms in range(1, 101):
+        stats.add(ms / 1000, refreshinterval=1 / 60)
+    assert stats.frames == 100
+    assert stats.p50 == pytest.approx(51.) and stats.p99 == pytest.approx(100.)
+    assert stats.missedvsync == 75  # Everything above 25 ms
+    assert sum(stats.histogram) == 100
+    assert stats.histogram[-1] == 51  # 50 ms and above land in the overflow bin
+    assert stats.summary()["frames"] == 100
+
+
+def test_invalid_mode():
+    with pytest.raises(ValueError):
+        FrameScheduler("fast")
+
+
+def test_swapinterval():
+    assert FrameScheduler("vsync").swapinterval == 1
+    assert FrameScheduler("uncapped").swapinterval == 0
+    assert FrameScheduler("fixed").swapinterval == 0
+
+
+def test_fixedsteps():
+    scheduler = FrameScheduler("uncapped", fixedtimestep=0.01)
+    assert scheduler.fixedsteps(0.025) == 2
+    assert scheduler.alpha == pytest.approx(0.5)
+    assert scheduler.fixedsteps(0.006) == 1  # Remainder carries over
+    assert scheduler.alpha == pytest.approx(0.1)
+
+    assert FrameScheduler("uncapped").fixedsteps(1.) == 0
+
+
+def test_fixedsteps_limit():
+    scheduler = FrameScheduler("uncapped", fixedtimestep=0.01, maxfixedsteps=5)
+    assert scheduler.fixedsteps(1.) == 5  # Rest is dropped instead of piling up
+    assert scheduler.accumulator == 0.
+    assert scheduler.fixedsteps(0.01) == 1
+
+
+def test_fixed_mode_paces_frames():
+    scheduler = FrameScheduler("fixed", targetfps=100.)
+
+    async def frames(count):
+        for i in range(count):
+            scheduler.beginframe()
+            await scheduler.wait()
+
+    start = time.perf_counter()
+    asyncio.run(frames(21))
+    elapsed = time.perf_counter() - start
+    assert 0.19 <= elapsed < 0.4
+    assert scheduler.stats.p50 == pytest.approx(10., abs=2.)
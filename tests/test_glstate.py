@@ -0,0 +1,116 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from OpenGL.GL import *
+
+from PyreeEngine.glstate import glstate
+from PyreeEngine.gpuresources import gpuresources
+
+
+@pytest.fixture
+def state(engine, monkeypatch):
+    monkeypatch.setattr(glstate, "verify", False)
+    glstate.reset()
+    buffers = [gpuresources.genbuffer(), gpuresources.genbuffer()]
+    yield buffers
+    for buffer in buffers:
+        gpuresources.delete("buffer", buffer)
+    glstate.reset()
+
+
+def test_redundant_binds_are_skipped(state):
+    issued, skipped = glstate.issued, glstate.skipped
+    for i in range(3):
+        glstate.bindbuffer(GL_ARRAY_BUFFER, state[0])
+    glstate.bindbuffer(GL_ARRAY_BUFFER, state[1])
+    assert (glstate.issued - issued, glstate.skipped - skipped) == (2, 2)
+    assert glGetIntegerv(GL_ARRAY_BUFFER_BINDING) == state[1]
+
+    glstate.reset()
+    glstate.bindbuffer(GL_ARRAY_BUFFER, state[1])
+    assert glstate.issued - issued == 3  # Nothing is known after a reset
+
+
+def test_disabled_passes_through(state, monkeypatch):
+    monkeypatch.setattr(glstate, "enabled", False)
+    issued = glstate.issued
+    glstate.bindbuffer(GL_ARRAY_BUFFER, state[0])
+    glstate.bindbuffer(GL_ARRAY_BUFFER, state[0])
+    assert glstate.issued - issued == 2
+
+
+def test_deleted_names_are_forgotten(state):
+    glstate.bindbuffer(GL_ARRAY_BUFFER, state[0])
+    gpuresources.delete("buffer", state[0])  # GL may hand out the same name again
+    assert GL_ARRAY_BUFFER not in glstate.buffers
+
+
+def test_verify_catches_direct_binds(state, monkeypatch):
+    monkeypatch.setattr(glstate, "verify", True)
+    glstate.bindbuffer(GL_ARRAY_BUFFER, state[0])
+    glBindBuffer(GL_ARRAY_BUFFER, state[1])  # Bypasses the cache
+    glstate.bindbuffer(GL_ARRAY_BUFFER, state[0])  # Logged and bound anyway
+    assert glGetIntegerv(GL_ARRAY_BUFFER_BINDING) == state[0]
+
+
+def test_vertexarray_owns_element_buffer(state):
+    vertexarray = gpuresources.genvertexarray()
+    glstate.bindvertexarray(vertexarray)
+    glstate.bindbuffer(GL_ELEMENT_ARRAY_BUFFER, state[0])
+    glstate.bindvertexarray(0)
+    assert GL_ELEMENT_ARRAY_BUFFER not in glstate.buffers
+    gpuresources.delete("vertexarray", vertexarray)
+
+
+def test_bindbufferbase_updates_generic_binding(state):
+    glstate.bindbuffer(GL_UNIFORM_BUFFER, state[0])
+    glstate.bindbufferbase(GL_UNIFORM_BUFFER, 0, state[1])
+    issued = glstate.issued
+    glstate.bindbuffer(GL_UNIFORM_BUFFER, state[1])
+    assert glstate.issued == issued and glGetIntegerv(GL_UNIFORM_BUFFER_BINDING) == state[1]
+
+
+def test_framebuffer_targets(engine, state):
+    fbo = engine.target.fbo
+    glstate.bindframebuffer(fbo)
+    assert glstate.framebuffers == {GL_DRAW_FRAMEBUFFER: fbo, GL_READ_FRAMEBUFFER: fbo}
+    glstate.bindframebuffer(0, GL_READ_FRAMEBUFFER)
+    issued = glstate.issued
+    glstate.bindframebuffer(fbo)  # Read binding differs, so it's not skipped
+    assert glstate.issued == issued + 1 and glGetIntegerv(GL_READ_FRAMEBUFFER_BINDING) == fbo
+
+
+GLModeScript = """
+import PyreeEngine.headless
+import OpenGL
+from OpenGL.GL import *
+from PyreeEngine.headless import HeadlessEngine
+from PyreeEngine.layers import ProgramConfig
+from PyreeEngine.shadercache import programcache
+from PyreeEngine.glstate import glstate
+
+programcache.enabled = False
+engine = HeadlessEngine((16, 16), programconfig=ProgramConfig(layerdefs=[]))
+try:
+    glBindBuffer(GL_ARRAY_BUFFER, 123456)  # Never generated, GL_INVALID_OPERATION
+    print("unchecked", OpenGL.ERROR_CHECKING)
+except OpenGL.error.GLError:
+    print("raised", OpenGL.ERROR_CHECKING)
+print("verify", glstate.verify)
+engine.close()
+"""
+
+
+@pytest.mark.parametrize("mode, expected", [("default", ["raised True", "verify False"]),
+                                            ("debug", ["raised True", "verify True"]),
+                                            ("performance", ["unchecked False", "verify False"])])
+def test_glmode(engine, mode, expected):
+    """PyOpenGL reads its flags on import, so every mode needs a fresh process"""
+    environment = dict(os.environ, PYREE_GLMODE=mode)
+    result = subprocess.run([sys.executable, "-c", GLModeScript], cwd=Path(__file__).resolve().parent.parent,
+                            env=environment, capture_output=True, text=True, timeout=60)
+    lines = result.stdout.splitlines()
+    assert all(line in lines for line in expected), result.stderr
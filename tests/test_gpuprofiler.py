@@ -0,0 +1,77 @@
+import pytest
+from OpenGL.GL import *
+
+from PyreeEngine.gpuprofiler import GPUProfiler
+from PyreeEngine.stats import RollingStats
+
+
+def test_rollingstats():
+    stats = RollingStats(window=100)
+    assert (stats.last, stats.avg, stats.max, stats.p50) == (0., 0., 0., 0.)
+
+    for value in range(200):  # Only the last 100 are kept
+        stats.add(float(value))
+    assert len(stats.samples) == 100
+    assert stats.last == 199.
+    assert stats.avg == pytest.approx(149.5)
+    assert stats.max == 199.
+    assert (stats.p50, stats.p95, stats.p99) == (150., 195., 199.)
+    assert stats.percentile(0) == 100. and stats.percentile(100) == 199.
+
+
+def drawframe(profiler, scopes):
+    """One frame with a clear per scope, scopes is a list of names or (name, children) tuples"""
+    profiler.beginframe()
+    for scope in scopes:
+        name, children = scope if isinstance(scope, tuple) else (scope, [])
+        with profiler.scope(name):
+            glClear(GL_COLOR_BUFFER_BIT)
+            for child in children:
+                with profiler.scope(child):
+                    glClear(GL_COLOR_BUFFER_BIT)
+    profiler.endframe()
+
+
+@pytest.fixture
+def profiler(engine):
+    engine.target.bindFramebuffer()
+    profiler = GPUProfiler(framelatency=3, window=10)
+    profiler.enabled = True
+    return profiler
+
+
+def test_results_after_latency(profiler):
+    drawframe(profiler, ["layer"])
+    drawframe(profiler, ["layer"])
+    assert profiler.stats == {}  # Not read back before the ring buffer wraps around
+    glFinish()
+    for i in range(3):
+        drawframe(profiler, ["layer"])
+    assert len(profiler.stats["layer"].samples) >= 1
+    assert 0. <= profiler.stats["layer"].last < 1000.  # A clear of a 64x64 target, in ms
+
+
+def test_nested_and_repeated_scopes(profiler):
+    for i in range(6):
+        drawframe(profiler, [("layer", ["pass", "pass"]), "other"])
+        glFinish()
+    assert set(profiler.stats) == {"layer", "layer/pass", "other"}
+    # Both passes are summed into one sample per frame
+    assert len(profiler.stats["layer/pass"].samples) == len(profiler.stats["layer"].samples)
+
+
+def test_unclosed_scopes_are_dropped(profiler):
+    profiler.beginframe()
+    profiler.begin("broken")  # E.g. an exception before end()
+    profiler.endframe()
+    assert profiler.frames[profiler.frameindex] == []
+    for i in range(4):
+        drawframe(profiler, [])
+    assert "broken" not in profiler.stats
+
+
+def test_disabled(profiler):
+    profiler.enabled = False
+    for i in range(5):
+        drawframe(profiler, ["layer"])
+    assert profiler.stats == {} and profiler.freequeries == []
@@ -0,0 +1,93 @@
+import gc
+
+import pytest
+
+from PyreeEngine.gpuresources import gpuresources, GPUObject
+from PyreeEngine.buffers import StreamingBuffer
+from PyreeEngine.textures import TextureArray
+
+
+class Cycle(GPUObject):
+    """Only freed by the garbage collector"""
+
+    def __init__(self):
+        self.buffer = gpuresources.genbuffer(64, "Cycle")
+        self.me = self
+
+    def release(self):
+        gpuresources.delete("buffer", self.buffer)
+        self.buffer = None
+
+
+@pytest.fixture
+def owner(engine, request):
+    name = "test %s" % request.node.name
+    gpuresources.newgeneration(name)
+    yield name
+    for resource in gpuresources.live(name):
+        gpuresources.delete(resource.kind, resource.name)
+
+
+def test_leaks_of_older_generations(owner):
+    with gpuresources.ownedby(owner):
+        freed = gpuresources.genbuffer(100, "freed")
+        adopted = gpuresources.genbuffer(200, "adopted")
+        leaked = gpuresources.gentexture(300, "leaked")
+    assert gpuresources.totals(owner) == {"buffer": (2, 300), "texture": (1, 300)}
+    assert gpuresources.reportleaks(owner) == []  # Nothing reloaded yet
+
+    gpuresources.newgeneration(owner)
+    gpuresources.delete("buffer", freed)
+    gpuresources.adopt([("buffer", adopted)])
+    assert [(resource.kind, resource.name, resource.label) for resource in gpuresources.reportleaks(owner)] == \
+           [("texture", leaked, "leaked")]
+
+
+def test_collect(owner):
+    with gpuresources.ownedby(owner), gpuresources.collect() as created:
+        buffer = gpuresources.genbuffer()
+        vertexarray = gpuresources.genvertexarray()
+    gpuresources.genbuffer()  # Outside the block, not collected
+    assert created == [("buffer", buffer), ("vertexarray", vertexarray)]
+
+
+def test_delete_twice(owner):
+    with gpuresources.ownedby(owner):
+        buffer = gpuresources.genbuffer()
+    assert gpuresources.delete("buffer", buffer)
+    assert not gpuresources.delete("buffer", buffer)
+    assert not gpuresources.delete("buffer", None)
+    assert not gpuresources.islive("buffer", buffer)
+
+
+def test_reference_cycles_are_collected_before_reporting(owner):
+    with gpuresources.ownedby(owner):
+        Cycle()
+        with StreamingBuffer(256) as stream:
+            streambuffer = stream.buffer
+    gpuresources.newgeneration(owner)
+    assert not gpuresources.islive("buffer", streambuffer)
+    assert gpuresources.reportleaks(owner) == []
+
+
+def test_dropped_textures_are_reported(owner):
+    """Textures aren't freed by the garbage collector, their names are often used after the container is gone"""
+    with gpuresources.ownedby(owner):
+        texture = TextureArray(4, 4, 2).getTexture()
+    gc.collect()
+    assert gpuresources.islive("texture", texture)
+    gpuresources.newgeneration(owner)
+    assert [resource.name for resource in gpuresources.reportleaks(owner)] == [texture]
+
+
+def test_half_built_objects(owner):
+    """release() runs from __del__ even if __init__ failed halfway"""
+    class Failing(StreamingBuffer):
+        def __init__(self):
+            super(Failing, self).__init__(-1)  # Negative size, GL raises
+
+    with gpuresources.ownedby(owner):
+        with pytest.raises(Exception):
+            Failing()
+    gc.collect()
+    assert gpuresources.live(owner) == []
@@ -0,0 +1,63 @@
+import asyncio
+import itertools
+
+import numpy as np
+import pytest
+
+from PyreeEngine.filewatch import filewatchservice
+from PyreeEngine.headless import HeadlessEngine
+from PyreeEngine.layers import Layer, LayerConfig
+
+ModuleCode = """from PyreeEngine.layers import BaseEntry
+
+class LayerEntry(BaseEntry):
+    def tick(self):
+        self.context.data.setdefault("ticks", []).append((self.context.frame, self.context.time, self.context.dt))
+"""
+
+modulenames = ("headlessmodule%i" % i for i in itertools.count())
+
+
+@pytest.fixture
+def recorder(engine, tmp_path, monkeypatch):
+    """Layer appending (frame, time, dt) of every tick to context.data["ticks"]"""
+    monkeypatch.syspath_prepend(str(tmp_path))
+    name = next(modulenames)
+    path = tmp_path / (name + ".py")
+    path.write_text(ModuleCode)
+    layer = Layer(LayerConfig(name=name, module=name, filepath=path), engine.layercontext)
+    filewatchservice.unsubscribe(layer.filewatch)
+    monkeypatch.setattr(engine.layermanager, "layers", [layer])
+    engine.layercontext.data["ticks"] = []
+    return engine.layercontext.data["ticks"]
+
+
+def test_step_advances_by_dt(engine, recorder):
+    frame, time = engine.layercontext.frame, engine.layercontext.time
+    engine.step(3)
+    assert [tick[0] for tick in recorder] == [frame, frame + 1, frame + 2]
+    expected = []
+    for i in range(3):  # Same accumulation as the engine, so the comparison is exact
+        time += engine.dt
+        expected.append(time)
+    assert [tick[1] for tick in recorder] == expected
+    assert all(tick[2] == engine.dt for tick in recorder)  # No wall clock involved
+    assert engine.layercontext.frame == frame + 3
+
+
+def test_renders_into_target(engine):
+    engine.step()
+    pixels = engine.readpixels()
+    assert pixels.shape == (64, 64, 4)
+    assert np.allclose(pixels, [0.2, 0.2, 0.3, 1.])  # Clear color of renderframe
+
+
+def test_no_mainloop(engine):
+    with pytest.raises(RuntimeError):
+        asyncio.run(engine.startmainloop())
+
+
+def test_wrong_platform(monkeypatch):
+    monkeypatch.setenv("PYOPENGL_PLATFORM", "glx")
+    with pytest.raises(RuntimeError, match="egl or osmesa"):
+        HeadlessEngine()
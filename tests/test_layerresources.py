@@ -0,0 +1,102 @@
+import itertools
+
+import pytest
+
+from PyreeEngine.filewatch import filewatchservice
+from PyreeEngine.gpuresources import gpuresources
+from PyreeEngine.layerresources import LayerResources
+from PyreeEngine.layers import Layer, LayerConfig, LayerContext
+
+ModuleCode = """from PyreeEngine.gpuresources import gpuresources
+from PyreeEngine.layers import BaseEntry
+
+class LayerEntry(BaseEntry):
+    def __init__(self, context):
+        super(LayerEntry, self).__init__(context)
+        self.buffers = [self.resources.claim(key, lambda: gpuresources.genbuffer(64, key),
+                                             lambda buffer: gpuresources.delete("buffer", buffer))
+                        for key in %r]
+%s
+"""
+
+modulenames = ("resourcemodule%i" % i for i in itertools.count())
+
+
+class Resource():
+    def __init__(self):
+        self.released = False
+
+    def release(self):
+        self.released = True
+
+
+def test_claim_and_handoff():
+    resources = LayerResources("test")
+    first = resources.claim("a", Resource, Resource.release)
+    assert resources.claim("a", Resource, Resource.release) is first
+    assert "a" in resources and len(resources) == 1 and resources.get("b", 1) == 1
+
+    resources.beginreload()
+    assert resources.claim("a", Resource, Resource.release) is first
+    resources.claim("b", Resource, Resource.release)
+    resources.commitreload()
+    assert (resources.reused, resources.created) == (1, 1)
+
+    resources.beginreload()
+    second = resources.claim("b", Resource, Resource.release, signature=(800, 600))  # Signature changed
+    resources.commitreload()
+    assert first.released and second is not resources.get("a") and "a" not in resources
+
+
+def test_aborted_reload_keeps_everything():
+    resources = LayerResources("test")
+    kept = resources.claim("a", Resource, Resource.release)
+    resources.beginreload()
+    resources.abortreload()
+    assert not kept.released and resources.get("a") is kept
+
+    resources.beginreload()
+    resources.commitreload()  # Next successful reload claims nothing
+    assert kept.released and len(resources) == 0
+
+
+@pytest.fixture
+def layerfile(engine, tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(tmp_path))
+    name = next(modulenames)
+    return name, tmp_path / (name + ".py")
+
+
+def loadlayer(layerfile, keys, extra=""):
+    name, path = layerfile
+    path.write_text(ModuleCode % (keys, extra))
+    layer = Layer(LayerConfig(name=name, module=name, filepath=path), LayerContext())
+    filewatchservice.unsubscribe(layer.filewatch)
+    return layer
+
+
+def test_layer_reload_hands_over_buffers(layerfile):
+    name, path = layerfile
+    layer = loadlayer(layerfile, ["vbo", "ibo"])
+    vbo, ibo = layer.entryinstance.buffers
+
+    path.write_text(ModuleCode % (["vbo"], ""))
+    layer.reload()
+    assert layer.valid and layer.entryinstance.buffers == [vbo]
+    assert gpuresources.islive("buffer", vbo) and not gpuresources.islive("buffer", ibo)
+    assert layer.resources.leaked == 0
+    assert [resource.generation for resource in gpuresources.live(name)] == [2]
+    layer.resources.releaseall()
+
+
+def test_failed_reload_keeps_resources(layerfile):
+    name, path = layerfile
+    layer = loadlayer(layerfile, ["vbo", "ibo"])
+    buffers = layer.entryinstance.buffers
+
+    path.write_text(ModuleCode % (["vbo"], "        raise ValueError()"))
+    layer.reload()
+    assert not layer.valid
+    assert all(gpuresources.islive("buffer", buffer) for buffer in buffers)
+    layer.resources.releaseall()
+    assert gpuresources.live(name) == []
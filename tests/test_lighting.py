@@ -0,0 +1,119 @@
+import math
+
+import numpy as np
+import pytest
+import quaternion
+from OpenGL.GL import *
+
+from PyreeEngine.engine import PyreeObject, LightObject
+from PyreeEngine.lighting import ClusteredLighting
+from PyreeEngine.camera import PerspectiveCamera, OrthoCamera
+from PyreeEngine.glstate import glstate
+from PyreeEngine.util import Resolution, Vec3
+
+Grid = (8, 4, 12)
+Near, Far = 0.1, 20.
+
+
+def samplepoints(rng, projection, count):
+    """Random view space points inside the frustum and the cluster each falls into, computed like clusterindex() in
+    the GLSL"""
+    gx, gy, gz = Grid
+    ndc = rng.uniform(-1, 1, (count, 2))
+    depth = Near * (Far / Near) ** rng.uniform(0, 1, count)
+    if projection[3, 3] == 1:
+        xy = (ndc - projection[(0, 1), 3]) / np.diag(projection)[:2]
+    else:
+        xy = ndc * depth[:, None] / np.diag(projection)[:2]
+    points = np.column_stack([xy, -depth])
+
+    cell = np.clip(np.floor((ndc * 0.5 + 0.5) * (gx, gy)), 0, np.array((gx, gy)) - 1).astype(int)
+    zslice = np.clip(np.floor(np.log(depth / Near) / np.log(Far / Near) * gz), 0, gz - 1).astype(int)
+    return points, (zslice * gy + cell[:, 1]) * gx + cell[:, 0]
+
+
+def bruteforce(points, clusters, positions, radii):
+    """(light, cluster) pairs of every light reaching a sample point"""
+    distances = np.linalg.norm(points[:, None, :] - positions[None, :, :], axis=2)
+    pointindex, lightindex = np.nonzero(distances < radii[None, :])
+    return set(zip(lightindex.tolist(), clusters[pointindex].tolist()))
+
+
+def uploadedpairs(lighting):
+    """(light, cluster) pairs as read back from the buffers update() filled"""
+    glstate.bindbuffer(GL_SHADER_STORAGE_BUFFER, lighting.clusterbuffer)
+    ranges = np.frombuffer(glGetBufferSubData(GL_SHADER_STORAGE_BUFFER, 0, np.prod(Grid) * 8), np.uint32)
+    glstate.bindbuffer(GL_SHADER_STORAGE_BUFFER, lighting.indexbuffer)
+    indices = np.frombuffer(glGetBufferSubData(GL_SHADER_STORAGE_BUFFER, 0, max(lighting.assignments, 1) * 4),
+                            np.uint32)
+    pairs = set()
+    for cluster, (offset, count) in enumerate(ranges.reshape(-1, 2)):
+        pairs.update((int(light), cluster) for light in indices[offset:offset + count])
+    return pairs
+
+
+@pytest.fixture
+def lighting(engine):
+    lighting = ClusteredLighting(Grid, Near, Far)
+    yield lighting
+    lighting.release()
+
+
+@pytest.mark.parametrize("cameratype", [PerspectiveCamera, OrthoCamera])
+def test_clusters_contain_every_light_reaching_them(lighting, cameratype):
+    rng = np.random.default_rng(4)
+    camera = cameratype()
+    if cameratype is PerspectiveCamera:
+        camera.setPerspective(60, 2, Near, Far)
+    else:
+        camera.setOrtho(8, 2, Near, Far)
+    projection = np.asarray(camera.projectionMatrix, np.float32)
+
+    lightcount = 300
+    positions = np.column_stack([rng.uniform(-10, 10, (lightcount, 2)), -rng.uniform(-1, Far + 1, lightcount)])
+    radii = rng.uniform(0.2, 3., lightcount).astype(np.float32)
+    lighting.setarrays(positions, np.ones((lightcount, 3)), radii)
+
+    points, clusters = samplepoints(rng, projection, 20000)
+    expected = bruteforce(points, clusters, positions, radii)  # Camera at the origin, view space is world space
+    assert len(expected) > 100
+
+    lights, assigned = lighting.assign(positions.astype(np.float32), radii, projection)
+    assert expected <= set(zip(lights.tolist(), assigned.tolist()))
+
+    lighting.update(camera, Resolution(width=128, height=64))
+    uploaded = uploadedpairs(lighting)
+    assert expected <= uploaded
+    assert len(uploaded) == lighting.assignments
+
+
+def test_lights_outside_frustum(lighting):
+    camera = PerspectiveCamera()
+    camera.setPerspective(60, 1, Near, Far)
+    positions = np.array([[0, 0, 5], [0, 0, -30], [50, 0, -5], [0, 0, -5]], np.float32)  # Behind, far, side, visible
+    radii = np.ones(4, np.float32)
+
+    lights, clusters = lighting.assign(positions, radii, np.asarray(camera.projectionMatrix, np.float32))
+    assert set(lights.tolist()) == {3}
+    assert lighting.visible == 1
+
+
+def test_worldpos_follows_parent_chain():
+    root = PyreeObject()
+    root.pos = Vec3(10, 0, 0)
+    root.rot = quaternion.from_rotation_vector([0, 0, math.pi / 2])  # 90 degrees around z
+    arm = PyreeObject()
+    arm.parent = root
+    arm.pos = Vec3(1, 0, 0)
+    arm.scale = Vec3(2, 2, 2)
+    light = LightObject()
+    light.parent = arm
+    light.pos = Vec3(1, 0, 0)
+
+    # Arm at (10, 1, 0), light offset scaled by 2 and rotated onto the y axis
+    assert np.allclose(light.worldpos(), [10, 3, 0], atol=1e-6)
+    assert np.allclose(light.worldpos(), light.worldpos())  # No parent state is modified
+    assert np.allclose(root.pos, [10, 0, 0]) and np.allclose(arm.scale, [2, 2, 2])
+
+    light.parent = None
+    assert np.allclose(light.worldpos(), [1, 0, 0])
@@ -0,0 +1,58 @@
+import json
+import queue
+
+import pytest
+
+from PyreeEngine import log
+
+
+@pytest.fixture
+def messages(tmp_path, monkeypatch):
+    """Returns a function that flushes the log and lists messages of module TESTLOG from the JSON sink"""
+    path = tmp_path / "log.jsonl"
+    log.setjsonsink(str(path))
+    monkeypatch.setattr(log, "_level", log.INFO)
+
+    def read():
+        log.flush()
+        return [entry for entry in map(json.loads, path.read_text().splitlines()) if entry["module"] == "TESTLOG"]
+
+    yield read
+    log.setjsonsink(None)
+
+
+def test_levels_and_formatting(messages):
+    log.debug("TESTLOG", "hidden")
+    log.info("TESTLOG", "%i layers", 3)
+    log.error("TESTLOG", "%i layers", "three")  # Broken arguments don't raise
+    log.setlevel(log.ERROR)
+    log.warning("TESTLOG", "hidden")
+    assert [(entry["level"], entry["text"]) for entry in messages()] == [("info", "3 layers"),
+                                                                         ("error", "%i layers ('three',)")]
+
+
+def test_exception(messages):
+    try:
+        1 / 0
+    except ZeroDivisionError as exc:
+        log.exception("TESTLOG", "Tick of %s failed", exc, "layer")
+    text = messages()[0]["text"]
+    assert text.startswith("Tick of layer failed\nTraceback") and "ZeroDivisionError" in text
+
+
+def test_repeats_are_collapsed(messages):
+    for i in range(5):
+        log.warning("TESTLOG", "Unmapped OSC message")
+    log.warning("TESTLOG", "Other")
+    entries = messages()
+    assert [entry["text"] for entry in entries] == ["Unmapped OSC message", "(last message repeated 4 times)", "Other"]
+    assert entries[1]["repeated"] == 4
+
+
+def test_full_queue_drops(monkeypatch):
+    full = queue.Queue(maxsize=1)
+    full.put(None)
+    monkeypatch.setattr(log, "_queue", full)
+    monkeypatch.setattr(log, "_dropped", 0)
+    log.info("TESTLOG", "dropped")  # Never blocks the caller
+    assert log._dropped == 1
@@ -0,0 +1,73 @@
+import itertools
+
+import pytest
+
+from PyreeEngine.moduledeps import ModuleGraph
+
+packagenames = ("graphpackage%i" % i for i in itertools.count())  # find_spec imports parent packages, keep them fresh
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    """Package with layer -> helper -> base, layer -> util -> base and a cycle between a and b"""
+    monkeypatch.syspath_prepend(str(tmp_path))
+    name = next(packagenames)
+    package = tmp_path / name
+    package.mkdir()
+    files = {"__init__": "",
+             "layer": "import numpy\nimport PyreeEngine.log\nfrom . import helper\nfrom .util import value\n",
+             "helper": "from %s import base\n" % name,
+             "util": "import %s.base\nvalue = 1\n" % name,
+             "base": "",
+             "a": "from . import b\n",
+             "b": "from . import a\n"}
+    for module, code in files.items():
+        (package / (module + ".py")).write_text(code)
+    return name, package
+
+
+def test_dependencies(project):
+    name, package = project
+    graph = ModuleGraph(package.parent)
+    dependencies = graph.scan(name + ".layer")
+    # Only project modules, neither installed packages nor PyreeEngine
+    assert {"%s.%s" % (name, module) for module in ("helper", "util", "base")} <= dependencies
+    assert not any(dependency.startswith(("numpy", "PyreeEngine")) for dependency in dependencies)
+    assert graph.paths[name + ".helper"] == (package / "helper.py").resolve()
+
+
+def test_reloadorder(project):
+    name, package = project
+    graph = ModuleGraph(package.parent)
+    graph.scan(name + ".layer")
+    modules = ["%s.%s" % (name, module) for module in ("layer", "helper", "util", "base")]
+    affected = graph.dependents({name + ".base"})
+    assert set(modules) <= affected
+
+    order = graph.reloadorder(set(modules))
+    assert order[0] == name + ".base" and order[-1] == name + ".layer"
+    assert graph.dependents({name + ".helper"}) == {name + ".helper", name + ".layer"}
+
+
+def test_cycle(project):
+    name, package = project
+    graph = ModuleGraph(package.parent)
+    assert graph.scan(name + ".a") == {name, name + ".a", name + ".b"}  # The package itself too, it is local
+    assert sorted(graph.reloadorder({name + ".a", name + ".b"})) == [name + ".a", name + ".b"]
+
+
+def test_rescan(project):
+    name, package = project
+    graph = ModuleGraph(package.parent)
+    graph.scan(name + ".layer")
+    (package / "helper.py").write_text("")  # Helper no longer imports base
+    (package / "util.py").write_text("")
+    assert name + ".base" not in graph.scan(name + ".layer")
+
+
+def test_unparsable_module(project):
+    name, package = project
+    (package / "helper.py").write_text("def broken(:\n")
+    graph = ModuleGraph(package.parent)
+    assert name + ".helper" in graph.scan(name + ".layer")
+    assert graph.imports[name + ".helper"] == set()
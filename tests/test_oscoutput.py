@@ -0,0 +1,82 @@
+import socket
+import time
+
+import pytest
+from pythonosc.osc_packet import OscPacket
+
+from PyreeEngine.oscoutput import OSCOutputQueue
+
+
+@pytest.fixture
+def server():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(5.)
+    yield sock
+    sock.close()
+
+
+@pytest.fixture
+def output(server):
+    output = OSCOutputQueue(*server.getsockname(), mtu=200)
+    yield output
+    output.stop()
+
+
+def receive(server, count):
+    """count datagrams as (size, [(address, params)])"""
+    datagrams = []
+    for i in range(count):
+        data = server.recv(65536)
+        datagrams.append((len(data), [(timed.message.address, timed.message.params)
+                                      for timed in OscPacket(data).messages]))
+    return datagrams
+
+
+def test_collapse_to_last_value(server, output):
+    output.send_message("/a", 1)
+    output.send_message("/b", 2)
+    output.send_message("/a", 3)  # Replaces the first one and moves behind /b
+    output.send_message("/c", 4, dedup=False)
+    output.send_message("/c", 5, dedup=False)
+    output.flush()
+    assert receive(server, 1)[0][1] == [("/b", [2]), ("/a", [3]), ("/c", [4]), ("/c", [5])]
+    assert output.pending == {}
+
+
+def test_single_message_is_not_bundled(server, output):
+    output.send_message("/a", [1, 2.5])
+    output.flush()
+    data = server.recv(65536)
+    assert not data.startswith(b"#bundle")
+    assert OscPacket(data).messages[0].message.params == [1, 2.5]
+
+
+def test_bundles_fit_mtu(server, output):
+    for i in range(40):
+        output.send_message("/value/%i" % i, i)
+    output.flush()
+    packets = []
+    while sum(len(messages) for size, messages in packets) < 40:
+        packets += receive(server, 1)
+    assert len(packets) > 1 and all(size <= output.mtu for size, messages in packets)
+    assert [params[0] for size, messages in packets for address, params in messages] == list(range(40))
+
+
+def test_ratelimit(server, output):
+    output.setratelimit("/limited", 10.)
+    output.send_message("/limited", 1)
+    output.flush()
+    output.send_message("/limited", 2)
+    output.send_message("/limited", 3)
+    output.send_message("/free", 4)
+    output.flush()  # Too early for /limited, the latest value waits
+    assert list(output.pending.values()) == [("/limited", 3)]
+
+    time.sleep(0.11)
+    output.flush()
+    assert [messages for size, messages in receive(server, 3)] == [[("/limited", [1])], [("/free", [4])],
+                                                                   [("/limited", [3])]]
+
+    output.setratelimit("/limited", None)
+    assert output.ratelimits == {}
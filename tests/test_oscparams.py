@@ -0,0 +1,76 @@
+import math
+
+import numpy as np
+import pytest
+
+from PyreeEngine.oscparams import ParameterStore, Parameter, UnmappedLogger
+
+
+@pytest.fixture
+def params():
+    return ParameterStore()
+
+
+def test_types(params):
+    params.register("/f", "float", default=0.5)
+    params.register("/i", "int")
+    params.register("/b", "bool")
+    params.register("/v", "vec", default=[0., 0., 0.])
+    assert params["/f"] == 0.5 and params.get("/missing", 1) == 1
+
+    params.set("/f", [2])
+    params.set("/i", [3.7])
+    params.set("/b", [0])
+    params.set("/v", [1., 2., 3., 4.])  # Extra arguments are cut off
+    params.update(0.)
+    assert params["/f"] == 2. and params["/i"] == 3 and params["/b"] is False
+    assert list(params["/v"]) == [1., 2., 3.] and params["/v"].dtype == np.float32
+
+    with pytest.raises(ValueError):
+        Parameter("/x", "string")
+
+
+def test_snapshot(params):
+    params.register("/f")
+    params.set("/f", [1.])
+    assert params["/f"] == 0.  # Latest value only shows up with the next frame
+    params.update(0.)
+    assert params["/f"] == 1.
+
+
+def test_invalid_value_keeps_previous(params):
+    params.register("/f", default=0.5)
+    params.set("/f", ["fader"])
+    params.update(0.)
+    assert params["/f"] == 0.5
+
+
+def test_smoothing(params):
+    params.register("/f", smoothing=0.1)
+    params.set("/f", [1.])
+    params.update(0.1)
+    assert params["/f"] == pytest.approx(1 - math.exp(-1))
+    for i in range(100):
+        params.update(0.1)
+    assert params["/f"] == pytest.approx(1.)
+
+
+def test_reregister(params):
+    first = params.register("/f", default=0.5)
+    assert params.register("/f", default=0.9) is first
+    replaced = params.register("/f", "vec", default=[0., 0.])
+    assert replaced is not first and list(params["/f"]) == [0., 0.]
+
+    params.unregister("/f")
+    assert "/f" not in params and params.get("/f") is None
+
+
+def test_unmappedlogger(monkeypatch):
+    logged = []
+    monkeypatch.setattr("PyreeEngine.oscparams.log.warning", lambda module, message: logged.append(message))
+    unmapped = UnmappedLogger(interval=0.)
+    unmapped("/a", 1)
+    unmapped("/a", 2)
+    unmapped("/a", 3)
+    assert logged[0].startswith("Unmapped OSC message: /a")
+    assert logged[-1] == "1 more unmapped messages to /a"
@@ -0,0 +1,82 @@
+import time
+
+import pytest
+from pythonosc.dispatcher import Dispatcher
+from pythonosc.udp_client import SimpleUDPClient
+
+from PyreeEngine.oscparams import ParameterStore
+from PyreeEngine.oscthread import OSCReceiveThread
+
+
+@pytest.fixture
+def receiver():
+    receiver = OSCReceiveThread("127.0.0.1", 0, ParameterStore(), maxqueue=16)
+    receiver.start()
+    yield receiver
+    receiver.stop()
+
+
+@pytest.fixture
+def client(receiver):
+    return SimpleUDPClient(*receiver.sock.getsockname())
+
+
+def waitfor(condition, timeout=5.):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Messages did not arrive in time"
+        time.sleep(0.001)
+
+
+def test_drain(receiver, client):
+    received = []
+    dispatcher = Dispatcher()
+    dispatcher.map("/value", lambda address, *args: received.append(args))
+
+    for i in range(3):
+        client.send_message("/value", i)
+    waitfor(lambda: receiver.received == 3)
+    assert received == []  # Nothing is applied before the render thread drains the queue
+
+    assert receiver.drain(dispatcher, 1.) == 3
+    assert received == [(0,), (1,), (2,)]
+    assert len(receiver.latency.samples) == 3 and receiver.latency.max > 0.
+
+
+def test_budget_leaves_rest_queued(receiver, client):
+    dispatcher = Dispatcher()
+    dispatcher.map("/slow", lambda address, *args: time.sleep(0.002))
+    for i in range(4):
+        client.send_message("/slow", i)
+    waitfor(lambda: receiver.received == 4)
+    assert receiver.drain(dispatcher, 0.) == 1
+    assert len(receiver.queue) == 3
+
+
+def test_full_queue_drops_oldest(receiver, client):
+    for i in range(20):
+        client.send_message("/value", i)
+    waitfor(lambda: receiver.received == 20)
+    assert receiver.dropped == 4
+    assert receiver.queue[0][2].params == [4]
+
+
+def test_parameters_bypass_queue(receiver, client):
+    receiver.parameters.register("/fader", "float")
+    client.send_message("/fader", 0.25)
+    client.send_message("/fader", 0.75)
+    waitfor(lambda: receiver.received == 2)
+    assert len(receiver.queue) == 0
+    receiver.parameters.update(0.)
+    assert receiver.parameters["/fader"] == 0.75
+
+
+def test_failing_handler(receiver, client):
+    received = []
+    dispatcher = Dispatcher()
+    dispatcher.map("/value", lambda address, *args: 1 / 0)
+    dispatcher.map("/value", lambda address, *args: received.append(args))
+    client.send_message("/value", 1)
+    waitfor(lambda: receiver.received == 1)
+    assert receiver.drain(dispatcher, 1.) == 1  # Logged, the other handlers still run
+    assert received == [(1,)]
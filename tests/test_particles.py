@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+from OpenGL.GL import *
+
+from PyreeEngine.particles import ParticleSystem
+
+
+@pytest.fixture
+def particles(engine):
+    system = ParticleSystem(1000)
+    system.emitter.rate = 0.
+    system.emitter.lifetime = 1.
+    system.emitter.lifetimespread = 0.
+    yield system
+    system.release()
+
+
+def test_burst(particles):
+    assert particles.alive() == 0
+    particles.burst(100)
+    particles.simulate(0.01)
+    assert particles.alive() == 100
+    particles.burst(50)
+    particles.simulate(0.01)
+    assert particles.alive() == 150
+
+
+def test_rate(particles):
+    particles.emitter.rate = 1000.
+    for i in range(10):
+        particles.simulate(0.0105)  # Fractions carry over, 105 in total
+    assert particles.alive() == 105
+
+
+def test_expire(particles):
+    particles.burst(100)
+    particles.simulate(0.01)
+    particles.emitter.lifetime = 0.5
+    particles.burst(30)
+    particles.simulate(0.01)
+    assert particles.alive() == 130
+    particles.simulate(0.6)  # Only the second burst dies
+    assert particles.alive() == 100
+    particles.simulate(0.5)
+    assert particles.alive() == 0
+
+
+def test_capacity(particles):
+    particles.burst(1500)
+    particles.simulate(0.01)
+    assert particles.alive() == 1000
+    particles.simulate(2.)
+    particles.burst(10)
+    particles.simulate(0.01)  # Expired slots are reused
+    assert particles.alive() == 10
+
+
+def test_alive_after_other_system(particles):
+    """simulate() binds buffers to indexed binding points, alive() must still read its own free list"""
+    other = ParticleSystem(100)
+    other.emitter.rate = 0.
+    try:
+        particles.burst(10)
+        particles.simulate(0.01)
+        assert particles.alive() == 10
+        other.simulate(0.01)  # Leaves other's free list bound to the generic target
+        assert particles.alive() == 10
+        assert other.alive() == 0
+    finally:
+        other.release()
+
+
+def test_render_restores_state(particles):
+    glEnable(GL_BLEND)
+    glBlendFunc(GL_ONE, GL_ZERO)
+    glDepthMask(GL_FALSE)
+    try:
+        particles.burst(10)
+        particles.simulate(0.01)
+        particles.render(np.matrix(np.identity(4)))
+        assert glIsEnabled(GL_BLEND)
+        assert not glGetBooleanv(GL_DEPTH_WRITEMASK)
+        assert (glGetIntegerv(GL_BLEND_SRC_RGB), glGetIntegerv(GL_BLEND_DST_RGB)) == (GL_ONE, GL_ZERO)
+    finally:
+        glDisable(GL_BLEND)
+        glDepthMask(GL_TRUE)
@@ -0,0 +1,75 @@
+import itertools
+import sys
+
+import imageio
+import numpy as np
+import pytest
+
+from PyreeEngine.layers import LayerConfig
+from PyreeEngine.preload import Preloader, StartupReport, assetcache
+
+modulenames = ("preloadmodule%i" % i for i in itertools.count())
+
+
+def test_startupreport():
+    report = StartupReport()
+    for i in range(2):
+        with report.phase("import"):
+            pass
+    with pytest.raises(ValueError):
+        with report.phase("init"):  # Timed even if it fails
+            raise ValueError()
+    assert list(report.phases) == ["import", "init"]
+
+    report.addlayer("a", "import", 0.5)
+    report.addlayer("a", "import", 0.25)
+    report.addlayer("a", "init", 1.)
+    assert report.layers["a"] == {"import": 0.75, "init": 1.}
+    report.report()
+
+
+@pytest.fixture
+def layer(tmp_path, monkeypatch):
+    """LayerConfig of a module with an image asset, and the image"""
+    monkeypatch.syspath_prepend(str(tmp_path))
+    name = next(modulenames)
+    image = np.zeros((2, 3, 4), np.uint8)
+    image[0] = 255  # Top row
+    imageio.imwrite(tmp_path / "image.png", image)
+    (tmp_path / (name + ".py")).write_text("class LayerEntry():\n    assets = [%r]\n" % str(tmp_path / "image.png"))
+    yield LayerConfig(name=name, module=name, filepath=tmp_path / (name + ".py")), tmp_path / "image.png"
+    assetcache.clear()
+
+
+def test_preload(layer):
+    config, image = layer
+    preloader = Preloader(2)
+    preloader.preload([config])
+    assert config.module in sys.modules
+    assert set(preloader.report.layers[config.name]) == {"import", "assets"}
+
+    pixels = assetcache.take(image)
+    assert pixels.shape == (2, 3, 4) and (pixels[-1] == 255).all()  # Flipped for GL, bottom row first
+    assert assetcache.take(image) is None  # Handed out once
+    preloader.finish()
+    assert preloader.pool is None
+
+
+def test_failures_are_left_to_the_main_thread(layer, tmp_path):
+    config, image = layer
+    image.write_bytes(b"no image")
+    broken = LayerConfig(name="broken", module="nonexistentpreloadmodule")
+    preloader = Preloader(2)
+    preloader.preload([config, broken])
+    assert "nonexistentpreloadmodule" not in sys.modules
+    assert "assets" not in preloader.report.layers[config.name]
+    preloader.finish()
+
+
+def test_sequential(layer):
+    config, image = layer
+    preloader = Preloader(0)
+    preloader.warm()
+    preloader.preload([config])
+    assert config.module not in sys.modules and preloader.report.phases == {}
+    preloader.finish()
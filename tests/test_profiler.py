@@ -0,0 +1,62 @@
+import json
+import time
+
+import pytest
+
+from PyreeEngine.profiler import Profiler, NullScope
+
+
+@pytest.fixture
+def profiler():
+    profiler = Profiler(window=10)
+    profiler.enabled = True
+    return profiler
+
+
+def test_disabled_scope_is_shared_noop():
+    profiler = Profiler()
+    assert isinstance(profiler.scope("a"), NullScope) and profiler.scope("a") is profiler.scope("b")
+    with profiler.scope("a"):
+        pass
+    profiler.beginframe()
+    profiler.endframe()
+    assert profiler.stats == {}
+
+
+def test_scopes(profiler):
+    for i in range(20):
+        profiler.beginframe()
+        with profiler.scope("sleep"):
+            time.sleep(0.002)
+        with profiler.scope("empty"):
+            pass
+        profiler.endframe()
+    assert set(profiler.stats) == {"sleep", "empty", "frame"}
+    assert len(profiler.stats["sleep"].samples) == 10  # Window
+    assert profiler.stats["sleep"].p50 >= 2.
+    assert profiler.stats["empty"].max < profiler.stats["sleep"].p50 <= profiler.stats["frame"].p50
+
+
+def test_exception_still_records(profiler):
+    with pytest.raises(ValueError):
+        with profiler.scope("failing"):
+            raise ValueError()
+    assert len(profiler.stats["failing"].samples) == 1
+
+
+def test_capture(tmp_path):
+    profiler = Profiler()
+    path = tmp_path / "trace.json"
+    profiler.capture(2, path)
+    assert profiler.enabled  # Enabled for the capture only
+    for i in range(3):
+        profiler.beginframe()
+        with profiler.scope("work"):
+            pass
+        profiler.endframe()
+    assert not profiler.enabled
+
+    events = json.loads(path.read_text())["traceEvents"]
+    assert [event["name"] for event in events] == ["work", "frame"] * 2
+    assert all(event["ph"] == "X" and event["dur"] >= 0 for event in events)
+    assert events[0]["ts"] >= events[1]["ts"]  # The frame encloses its scopes
@@ -0,0 +1,74 @@
+import math
+
+import numpy as np
+import pytest
+from OpenGL.GL import *
+
+from PyreeEngine.quadbatch import QuadBatch
+from PyreeEngine.textures import TextureArray
+
+
+@pytest.fixture
+def batch(engine):
+    with QuadBatch(capacity=4, blend=False) as batch:
+        yield batch
+
+
+def render(engine, batch):
+    engine.target.bindFramebuffer()
+    glViewport(0, 0, 64, 64)
+    glDisable(GL_DEPTH_TEST)
+    glClearColor(0, 0, 0, 0)
+    glClear(GL_COLOR_BUFFER_BIT)
+    batch.render(np.matrix(np.identity(4)))
+    glEnable(GL_DEPTH_TEST)
+    return engine.readpixels()
+
+
+def test_staging(batch):
+    batch.add(0.5, -0.5, 1., 2., rotation=0.25, color=(1., 0., 0., 1.), layer=2, z=0.1)
+    batch.addmany(np.array([[0., 0.], [1., 1.]]), (0.1, 0.1), rotations=np.array([0., 1.]), layers=3)
+    assert batch.count == 3
+    assert list(batch.instances[0, :15]) == pytest.approx([0.5, -0.5, 0.1, 1., 2., 0.25, 0., 0., 1., 1., 1., 0., 0., 1., 2.])
+    assert list(batch.instances[2, [0, 1, 5, 14]]) == [1., 1., 1., 3.]
+
+    batch.clear()
+    assert batch.count == 0
+
+
+def test_grows_beyond_capacity(engine, batch):
+    batch.addmany(np.zeros((3, 2)), (0.1, 0.1))
+    for i in range(5):
+        batch.add(i, 0., 0.1, 0.1)
+    assert batch.count == 8 and batch.capacity >= 8
+    assert list(batch.instances[3:8, 0]) == [0., 1., 2., 3., 4.]  # Earlier quads are kept
+    render(engine, batch)
+    assert batch.streamcapacity == batch.capacity  # Instance buffer follows on the next render
+
+
+def test_render(engine, batch):
+    batch.add(-0.5, 0., 1., 2., color=(1., 0., 0., 1.))  # Left half, red
+    batch.add(0.5, 0.5, 1., 1., color=(0., 0., 1., 1.))  # Top right quarter, blue
+    pixels = render(engine, batch)
+    assert np.allclose(pixels[:, :32], [1., 0., 0., 1.])
+    assert np.allclose(pixels[32:, 32:], [0., 0., 1., 1.])
+    assert not pixels[:32, 32:].any()
+
+
+def test_rotation(engine, batch):
+    batch.add(0., 0., 2., 0.5, rotation=math.pi / 2)  # Horizontal bar turned vertical
+    alpha = render(engine, batch)[:, :, 3]
+    assert alpha[:, 32].all() and not alpha[32, 0] and not alpha[32, 63]
+
+
+def test_texture_layers(engine):
+    texture = TextureArray(2, 2, 2, mipmaps=False)
+    for layer, color in enumerate(([0, 255, 0, 255], [255, 255, 0, 255])):
+        texture.setlayer(layer, np.full((2, 2, 4), color, np.uint8))
+    with QuadBatch(texture=texture, blend=False) as batch:
+        batch.add(-0.5, 0., 1., 2., layer=0)
+        batch.add(0.5, 0., 1., 2., layer=1, color=(0.5, 1., 1., 1.))  # Tinted
+        pixels = render(engine, batch)
+    assert np.allclose(pixels[:, :32], [0., 1., 0., 1.], atol=0.01)
+    assert np.allclose(pixels[:, 32:], [0.5, 1., 0., 1.], atol=0.01)
+    texture.release()
@@ -0,0 +1,81 @@
+import struct
+
+import pytest
+from OpenGL.GL import *
+
+from PyreeEngine.shadercache import ProgramCache
+from PyreeEngine.gpuresources import gpuresources
+
+VertexCode = """#version 450 core
+layout (location = 0) in vec3 posIn;
+void main() { gl_Position = vec4(posIn, 1.); }
+"""
+
+FragCode = """#version 450 core
+layout (location = 0) out vec4 colorOut;
+void main() { colorOut = vec4(%s); }
+"""
+
+
+def stages(color="1."):
+    return [(GL_VERTEX_SHADER, VertexCode), (GL_FRAGMENT_SHADER, FragCode % color)]
+
+
+@pytest.fixture
+def cache(engine, tmp_path):
+    cache = ProgramCache(tmp_path / "programs")
+    if not cache.usable():
+        pytest.skip("Driver supports no program binaries")
+    return cache
+
+
+def release(program):
+    gpuresources.delete("program", int(program))
+
+
+def test_miss_then_hit(cache):
+    release(cache.getprogram(stages()))
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert len(list(cache.cachedir.glob("*.bin"))) == 1
+
+    fresh = ProgramCache(cache.cachedir)  # As on the next startup
+    program = fresh.getprogram(stages())
+    assert (fresh.hits, fresh.misses) == (1, 0)
+    assert glGetProgramiv(program, GL_LINK_STATUS) == GL_TRUE
+    release(program)
+
+
+def test_key(cache):
+    cache.querydriver()
+    assert cache.key(stages()) == cache.key(stages())
+    assert cache.key(stages()) != cache.key(stages("0.5"))
+    assert cache.key(stages(), {"A": "1"}) != cache.key(stages(), {"A": "2"})
+    assert cache.key(stages(), {"A": "1", "B": "2"}) == cache.key(stages(), {"B": "2", "A": "1"})
+
+    other = ProgramCache(cache.cachedir)
+    other.querydriver()
+    other.driverstring += b" updated"  # Driver update, same sources
+    assert cache.key(stages()) != other.key(stages())
+
+
+@pytest.mark.parametrize("content, rejected", [(b"\x00\x00", 0),  # Truncated header, treated as missing
+                                               (struct.pack("<I", 0x1234) + b"garbage", 1),  # Unknown format
+                                               (struct.pack("<I", 0), 1)])
+def test_rejected_binaries_are_recompiled(cache, content, rejected):
+    cache.querydriver()
+    path = cache.cachepath(stages())
+    path.parent.mkdir(parents=True)
+    path.write_bytes(content)
+
+    program = cache.getprogram(stages())
+    assert glGetProgramiv(program, GL_LINK_STATUS) == GL_TRUE
+    release(program)
+    assert (cache.hits, cache.rejected) == (0, rejected)
+    assert path.exists() and path.read_bytes() != content  # Replaced by a valid binary
+
+
+def test_disabled(cache):
+    cache.enabled = False
+    release(cache.getprogram(stages()))
+    assert (cache.hits, cache.misses) == (0, 0)
+    assert not cache.cachedir.exists()
@@ -0,0 +1,106 @@
+import pytest
+from OpenGL.GL import *
+
+from PyreeEngine.shaderpreprocessor import ShaderPreprocessor, ShaderIncludeError
+from PyreeEngine.shaders import HotloadingShader
+from PyreeEngine.gpuresources import gpuresources
+
+
+def writefiles(directory, files):
+    for name, content in files.items():
+        path = directory / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+
+
+def test_include_and_line_directives(tmp_path):
+    writefiles(tmp_path, {"main.frag": '#version 450\n#include "common.glsl"\nvoid main() {}\n',
+                          "common.glsl": "float a;\nfloat b;\n"})
+    result = ShaderPreprocessor().process(tmp_path / "main.frag")
+
+    assert result.source.splitlines() == ["#version 450", "#line 1 1", "float a;", "float b;", "#line 3 0",
+                                          "void main() {}"]
+    assert result.files == [(tmp_path / "main.frag").resolve(), (tmp_path / "common.glsl").resolve()]
+
+
+def test_nested_and_repeated_includes(tmp_path):
+    writefiles(tmp_path, {"main.frag": '#version 450\n#include "a.glsl"\n#include "b.glsl"\nvoid main() {}\n',
+                          "a.glsl": '#include "b.glsl"\nfloat a;\n',
+                          "b.glsl": "float b;\n"})
+    result = ShaderPreprocessor().process(tmp_path / "main.frag")
+
+    # b.glsl is file 2, its second include is dropped but keeps the line count of main.frag intact
+    assert result.source.splitlines() == ["#version 450", "#line 1 1", "#line 1 2", "float b;", "#line 2 1",
+                                          "float a;", "#line 3 0", "", "void main() {}"]
+
+
+def test_includepaths(tmp_path):
+    writefiles(tmp_path, {"shaders/main.frag": '#version 450\n#include <lib.glsl>\n', "lib/lib.glsl": "float l;\n"})
+    result = ShaderPreprocessor([tmp_path / "lib"]).process(tmp_path / "shaders" / "main.frag")
+    assert "float l;" in result.source.splitlines()
+
+    with pytest.raises(ShaderIncludeError):
+        ShaderPreprocessor().process(tmp_path / "shaders" / "main.frag")
+
+
+def test_defines_after_version(tmp_path):
+    writefiles(tmp_path, {"main.frag": "#version 450\nvoid main() {}\n"})
+    result = ShaderPreprocessor().process(tmp_path / "main.frag", {"COUNT": 3, "DEBUG": True})
+    lines = result.source.splitlines()
+
+    assert lines[0] == "#version 450"
+    assert lines[-2:] == ["#line 2 0", "void main() {}"]
+    assert set(lines[1:-2]) == {"#define COUNT 3", "#define DEBUG 1"}
+
+
+def test_contenthash(tmp_path):
+    writefiles(tmp_path, {"main.frag": '#version 450\n#include "common.glsl"\n', "common.glsl": "float a;\n"})
+    preprocessor = ShaderPreprocessor()
+    before = preprocessor.process(tmp_path / "main.frag").contenthash
+    writefiles(tmp_path, {"common.glsl": "float b;\n"})
+    assert preprocessor.process(tmp_path / "main.frag").contenthash != before
+
+
+def test_compile_errors_point_into_include(engine, tmp_path):
+    writefiles(tmp_path, {"main.frag": '#version 450\n#include "broken.glsl"\nvoid main() {}\n',
+                          "broken.glsl": "float a;\nfloat b = ;\n"})
+    result = ShaderPreprocessor().process(tmp_path / "main.frag")
+
+    shader = glCreateShader(GL_FRAGMENT_SHADER)
+    try:
+        glShaderSource(shader, result.source)
+        glCompileShader(shader)
+        assert not glGetShaderiv(shader, GL_COMPILE_STATUS)
+        infolog = glGetShaderInfoLog(shader).decode()
+        assert "1:2(" in infolog  # File 1, line 2 in Mesa's format, which only names the file for syntax errors
+    finally:
+        glDeleteShader(shader)
+
+
+def test_variantkey():
+    key = HotloadingShader.variantkey
+    assert key(b"hash", {"A": 1, "B": 2}) == key(b"hash", {"B": 2, "A": 1})
+    assert key(b"hash", {"A": 1}) != key(b"hash", {"A": 2})
+    assert key(b"hash", {}) != key(b"other", {})
+
+
+def test_variants(engine, tmp_path):
+    writefiles(tmp_path, {"shader.vert": "#version 450\nvoid main() { gl_Position = vec4(0.); }\n",
+                          "shader.frag": "#version 450\nout vec4 color;\n"
+                                         "void main() { color = vec4(VALUE + 0.0123); }\n"})
+    with HotloadingShader(tmp_path / "shader.vert", tmp_path / "shader.frag", defines={"VALUE": 1}) as shader:
+        first = shader.getshaderprogram()
+        shader.setdefines({"VALUE": 2})
+        second = shader.getshaderprogram()
+        assert second != first and len(shader.variants) == 2
+
+        shader.setdefines({"VALUE": 1})  # Cached, no rebuild
+        assert shader.pendingbuild is None and shader.getshaderprogram() == first
+
+        # Changed sources make every variant stale
+        writefiles(tmp_path, {"shader.frag": "#version 450\nout vec4 color;\n"
+                                             "void main() { color = vec4(VALUE + 0.0456); }\n"})
+        shader.regenShader(block=True)
+        assert shader.getshaderprogram() not in (first, second)
+        assert len(shader.variants) == 1
+        assert not gpuresources.islive("program", second)
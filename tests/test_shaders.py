@@ -0,0 +1,121 @@
+import itertools
+
+import pytest
+from OpenGL.GL import *
+
+from PyreeEngine import shaders
+from PyreeEngine.shaders import HotloadingShader, ShaderBatch, ProgramBuild, DebugShader
+from PyreeEngine.gpuresources import gpuresources
+
+VertexCode = """#version 450 core
+layout (location = 0) in vec3 posIn;
+void main() { gl_Position = vec4(posIn, 1.); }
+"""
+
+FragCode = """#version 450 core
+layout (location = 0) out vec4 colorOut;
+void main() { colorOut = vec4(%s); }
+"""
+
+colors = itertools.count(1)  # Unique fragment sources, so the program cache never hits
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    """ProgramBuilds started while the test runs"""
+    started = []
+
+    class CountingBuild(ProgramBuild):
+        def __init__(self, *args, **kwargs):
+            super(CountingBuild, self).__init__(*args, **kwargs)
+            started.append(self)
+
+    monkeypatch.setattr(shaders, "ProgramBuild", CountingBuild)
+    return started
+
+
+@pytest.fixture
+def shaderfiles(engine, tmp_path):
+    vertexpath, fragmentpath = tmp_path / "shader.vert", tmp_path / "shader.frag"
+    vertexpath.write_text(VertexCode)
+    fragmentpath.write_text(FragCode % ("%i." % next(colors)))
+    return vertexpath, fragmentpath
+
+
+def test_programbuild(engine):
+    build = ProgramBuild([(GL_VERTEX_SHADER, VertexCode), (GL_FRAGMENT_SHADER, FragCode % "0.25")])
+    while not build.poll():  # Never blocks, returns False while the driver is busy
+        pass
+    assert build.error is None
+    assert glGetProgramiv(build.program, GL_LINK_STATUS) == GL_TRUE
+    for shader in build.shaderobjects.values():
+        gpuresources.delete("shader", shader)
+    gpuresources.delete("program", build.program)
+
+
+def test_programbuild_error_frees_objects(engine):
+    live = len(gpuresources.resources)
+    build = ProgramBuild([(GL_VERTEX_SHADER, VertexCode), (GL_FRAGMENT_SHADER, FragCode % "undefined")])
+    build.wait()
+    assert build.done and "compile failure" in build.error
+    assert len(gpuresources.resources) == live
+
+
+def test_hotload(shaderfiles, builds):
+    vertexpath, fragmentpath = shaderfiles
+    with HotloadingShader(vertexpath, fragmentpath) as shader:
+        first = shader.getshaderprogram()
+        assert first != DebugShader.program and len(builds) == 1
+
+        fragmentpath.write_text(FragCode % ("%i." % next(colors)))
+        for i in range(3):  # Burst of events from one save
+            shader.onfileevent(None)
+        shader.tick()
+        assert len(builds) == 2  # One rebuild for the whole burst
+        builds[-1].wait()
+        shader.tick()
+        assert shader.getshaderprogram() not in (first, DebugShader.program)
+
+        # Only the changed stage is compiled again
+        assert len(builds[-1].newshaders) == 1
+
+
+def test_touch_without_change(shaderfiles, builds):
+    with HotloadingShader(*shaderfiles) as shader:
+        program = shader.getshaderprogram()
+        shader.onfileevent(None)
+        shader.tick()
+        assert len(builds) == 1 and shader.getshaderprogram() == program
+
+
+def test_broken_source_keeps_program(shaderfiles, builds):
+    vertexpath, fragmentpath = shaderfiles
+    with HotloadingShader(vertexpath, fragmentpath) as shader:
+        program = shader.getshaderprogram()
+        fragmentpath.write_text(FragCode % "undefined")
+        shader.onfileevent(None)
+        shader.tick()
+        builds[-1].wait()
+        shader.tick()
+        assert shader.pendingbuild is None
+        assert shader.getshaderprogram() == program
+
+
+def test_shaderbatch(engine, tmp_path, builds):
+    paths = []
+    for i in range(3):
+        vertexpath, fragmentpath = tmp_path / ("%i.vert" % i), tmp_path / ("%i.frag" % i)
+        vertexpath.write_text(VertexCode)
+        fragmentpath.write_text(FragCode % ("%i." % next(colors)))
+        paths.append((vertexpath, fragmentpath))
+
+    with ShaderBatch():
+        batched = [HotloadingShader(*pair) for pair in paths]
+        assert len(builds) == 3  # Started right away, finished together on exit
+    try:
+        for shader in batched:
+            assert shader.pendingbuild is None
+            assert glGetProgramiv(shader.getshaderprogram(), GL_LINK_STATUS) == GL_TRUE
+    finally:
+        for shader in batched:
+            shader.release()
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+from OpenGL.GL import *
+
+from PyreeEngine.basicObjects import ModelObject
+from PyreeEngine.staticbatch import StaticBatch
+from PyreeEngine.glstate import glstate
+from PyreeEngine.util import Vec3
+
+
+def quadverts(x0, x1):
+    """Two triangles covering x0..x1 in NDC, as (6, 8) XYZ UV NXNYNZ"""
+    corners = [(x0, -1), (x1, -1), (x1, 1), (x0, -1), (x1, 1), (x0, 1)]
+    return np.array([[x, y, 0, 1, 1, 0, 0, 1] for x, y in corners], np.float32)
+
+
+def model(verts):
+    obj = ModelObject()
+    obj.loadFromVerts(verts.reshape(-1))
+    return obj
+
+
+def readvertices(batch):
+    glstate.bindbuffer(GL_ARRAY_BUFFER, batch.vbo)
+    data = glGetBufferSubData(GL_ARRAY_BUFFER, 0, batch.tricount * 8 * 4)
+    return np.frombuffer(data, np.float32).reshape(-1, 8)
+
+
+@pytest.fixture
+def members(engine):
+    objects = [model(quadverts(-1, 0)), model(quadverts(0, 1)[:3]), model(quadverts(-0.5, 0.5))]
+    yield objects
+    for obj in objects:
+        obj.release()
+
+
+def test_ranges(members):
+    with StaticBatch(members) as batch:
+        batch.rebuild()
+        assert batch.ranges == {members[0]: (0, 6), members[1]: (6, 3), members[2]: (9, 6)}
+        assert batch.tricount == 15
+
+        batch.remove(members[1])
+        batch.rebuild()
+        assert batch.ranges == {members[0]: (0, 6), members[2]: (6, 6)}
+
+
+def test_transformed_vertices(members):
+    members[1].pos = Vec3(1, 2, 3)
+    members[2].scale = Vec3(2, 2, 2)
+    with StaticBatch(members) as batch:
+        batch.rebuild()
+        verts = readvertices(batch)
+
+        for obj, offset, scale in zip(members, ((0, 0, 0), (1, 2, 3), (0, 0, 0)), (1, 1, 2)):
+            first, count = batch.ranges[obj]
+            assert np.allclose(verts[first:first + count, 0:3], obj.verts[:, 0:3] * scale + offset)
+            assert np.allclose(verts[first:first + count, 3:5], obj.verts[:, 3:5])
+            assert np.allclose(verts[first:first + count, 5:8], (0, 0, 1))  # Renormalized after scaling
+
+
+def test_hidden_members(engine, members):
+    with StaticBatch(members[:2]) as batch:
+        batch.setvisible(members[0], False)
+
+        engine.target.bindFramebuffer()
+        glViewport(0, 0, 64, 64)
+        glClearColor(0, 0, 0, 0)
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        batch.render(np.matrix(np.identity(4)))
+        alpha = engine.readpixels()[:, :, 3]
+
+        assert list(batch.firsts) == [6] and list(batch.counts) == [3]
+        assert not alpha[:, :32].any()  # Left quad hidden
+        assert alpha[:, 32:].any()  # Right triangle drawn
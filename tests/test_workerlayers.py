@@ -0,0 +1,122 @@
+import itertools
+import multiprocessing
+import queue
+import time
+
+import numpy as np
+import pytest
+
+from PyreeEngine.filewatch import filewatchservice
+from PyreeEngine.layers import LayerConfig, LayerContext
+from PyreeEngine.workerlayers import layoutoutputs, WorkerProcess, WorkerLayer, LATEST, LATESTGEN, READING, SEQUENCE
+
+ModuleCode = """import numpy as np
+from PyreeEngine.workerlayers import WorkerEntry
+
+class LayerEntry(WorkerEntry):
+    outputs = {"value": ((%i,), "f4")}
+
+    def tick(self):
+        self.context.outputs["value"][:] = self.context.frame * self.context.inputs.get("scale", 1.)
+"""
+
+modulenames = ("workermodule%i" % i for i in itertools.count())  # Fresh name per test, no stale sys.modules entry
+
+
+@pytest.fixture
+def layerconfig(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(tmp_path))
+    name = next(modulenames)
+    path = tmp_path / (name + ".py")
+    path.write_text(ModuleCode % 4)
+    return LayerConfig(name="worker", module=name, filepath=path, worker=True, workerinterval=0.002)
+
+
+def test_layoutoutputs():
+    layout, size = layoutoutputs({"b": ((3,), "f4"), "a": ((2, 2), "f8")})
+    assert layout == {"a": (0, (2, 2), "<f8"), "b": (64, (3,), "<f4")}  # Sorted and 64 byte aligned
+    assert size == 128
+    assert layoutoutputs({}) == ({}, 64)
+
+
+@pytest.fixture
+def worker(layerconfig):
+    state = multiprocessing.Array("q", [-1, 0, -1, 0])
+    worker = WorkerProcess(layerconfig, queue.Queue(), queue.Queue(), state, 0.)
+    yield worker
+    worker.retireblocks()
+    worker.unlinkretired(worker.generation)
+
+
+def statusmessages(worker):
+    messages = []
+    while not worker.status.empty():
+        messages.append(worker.status.get_nowait()[0])
+    return messages
+
+
+def test_worker_slots(worker):
+    worker.loadmodule()
+    assert statusmessages(worker) == ["layout", "loaded"]
+    assert worker.generation == 1 and worker.state[LATEST] == -1
+
+    worker.state[READING] = 1  # Render side reads slot 1
+    for i in range(4):
+        worker.tick()
+        assert worker.state[LATEST] != 1
+    assert worker.state[SEQUENCE] == 4 and worker.state[LATESTGEN] == 1
+    assert worker.slots[worker.state[LATEST]]["value"][0] == 3.
+
+
+def test_worker_reload_generations(worker, layerconfig):
+    worker.loadmodule()
+    worker.tick()
+    worker.loadmodule()  # Same outputs, blocks are kept
+    assert worker.generation == 1 and worker.retired == []
+
+    layerconfig.filepath.write_text(ModuleCode % 8)
+    worker.loadmodule()
+    assert worker.generation == 2 and worker.state[LATEST] == -1
+    assert worker.slots[0]["value"].shape == (8,)
+    assert [generation for generation, blocks in worker.retired] == [1]
+
+    worker.unlinkretired(1)  # Render side attached generation 2
+    assert worker.retired == []
+
+
+def test_worker_broken_reload_keeps_instance(worker, layerconfig):
+    worker.loadmodule()
+    instance = worker.entryinstance
+    statusmessages(worker)
+    layerconfig.filepath.write_text("syntax error")
+    worker.loadmodule()
+    assert statusmessages(worker) == ["old"] and worker.entryinstance is instance
+
+
+def waitfor(layer, condition, timeout=30.):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Worker did not respond in time"
+        layer.tick()
+        time.sleep(0.005)
+
+
+def test_workerlayer(layerconfig):
+    context = LayerContext()
+    layer = WorkerLayer(layerconfig, context)
+    try:
+        assert context.data["worker"] is layer
+        waitfor(layer, lambda: "value" in layer.outputs)
+        assert layer.valid and layer.generation == 1
+
+        layer.send(scale=-1.)
+        waitfor(layer, lambda: layer.outputs["value"][0] < 0)
+
+        layerconfig.filepath.write_text(ModuleCode % 8)
+        layer.loadmodule()
+        waitfor(layer, lambda: layer.generation == 2 and "value" in layer.outputs)
+        assert layer.outputs["value"].shape == (8,)
+    finally:
+        layer.stop()
+        filewatchservice.unsubscribe(layer.filewatch)
+    assert not layer.process.is_alive()